@@ -0,0 +1,8 @@
+'''
+Performance benchmarks for gazelib. Not part of the installed package.
+
+Run from the repository root::
+
+    $ python -m benchmarks --help
+    $ python benchmarks/import_time.py
+'''
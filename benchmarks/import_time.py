@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the time to import gazelib in a fresh interpreter.
+
+Each case is imported in a new Python process several times and the median
+wall time is reported. The 'eager' case first imports the heavy optional
+dependencies that gazelib defers, and thus shows how long the import would
+take if they were imported on package import. Also lists which of the heavy
+dependencies each import pulls in.
+
+Usage::
+
+    $ python benchmarks/import_time.py [--repeat 7] [--json]
+'''
+import argparse
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ['deepdiff', 'jsonschema', 'scipy', 'bokeh', 'yaml', 'jinja2']
+
+CASES = [
+    ('gazelib', 'import gazelib'),
+    ('gazelib.models', 'import gazelib.models'),
+    ('gazelib.visualization', 'import gazelib.visualization'),
+    ('eager', 'import deepdiff, jsonschema, scipy.signal, scipy.ndimage, '
+              'bokeh.plotting, bokeh.embed, yaml, jinja2; import gazelib'),
+]
+
+# Measures the import within the child so that interpreter startup
+# does not add noise.
+PROBE = '''
+import sys, time, json
+t0 = time.time()
+exec({statement!r})
+t1 = time.time()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'seconds': t1 - t0, 'heavy': heavy}}))
+'''
+
+
+def measure(statement, repeat):
+    '''
+    Return dict with median import seconds and loaded heavy modules.
+    '''
+    code = PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code])
+        runs.append(json.loads(out.decode('utf-8')))
+    seconds = sorted(r['seconds'] for r in runs)
+    return {
+        'median_seconds': seconds[len(seconds) // 2],
+        'min_seconds': seconds[0],
+        'heavy_modules_loaded': runs[0]['heavy']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, statement in CASES:
+        results[name] = measure(statement, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=4, sort_keys=True))
+        return
+    for name, _ in CASES:
+        r = results[name]
+        print('{:24s} {:8.1f} ms  heavy: {}'.format(
+            name, 1000 * r['median_seconds'],
+            ', '.join(r['heavy_modules_loaded']) or '-'))
+
+
+if __name__ == '__main__':
+    main()
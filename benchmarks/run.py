@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark the hot paths of gazelib on a synthetic recording.
+
+Each case is timed over several repeats and the median and minimum wall
+times are reported. Peak memory allocated during a case is measured with
+tracemalloc in a separate run, because tracing slows the code down.
+Results can be written as JSON and compared with an earlier run, e.g.
+one made before a commit.
+
+Usage::
+
+    $ python -m benchmarks --duration 600 --output after.json \\
+        --compare before.json
+'''
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+import gazelib
+from gazelib.legacy import igazelib
+from gazelib.conversion.icl import cg
+from gazelib.visualization import common as vis_common
+from gazelib import synthetic
+
+# Wall clock with the best available resolution.
+clock = getattr(time, 'perf_counter', time.time)
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_cases(options, tmpdir):
+    '''
+    Return the synthetic CommonV1 and a list of (name, setup) pairs. Setup
+    prepares the input outside the timing and returns the function to time.
+
+    Parameters:
+        options: keyword arguments for gazelib.synthetic generators.
+        tmpdir: directory for the input and output files.
+    '''
+    gazedata_path = os.path.join(tmpdir, 'synthetic.gazedata')
+    experiment_config_path = os.path.join(tmpdir, 'config.json')
+    trial_configuration = options['trial_configuration']
+    synthetic.write_gazedata(gazedata_path, **options)
+    synthetic.write_experiment_config(experiment_config_path,
+                                      trial_configuration)
+    common = synthetic.generate_common(**options)
+    trial_config_id = trial_configuration['name']
+
+    def slice_by_relative_time():
+        tag = 'icl/experiment/reaction/trial'
+        return lambda: list(common.iter_slices_by_tag(tag))
+
+    def validate():
+        return lambda: gazelib.containers.CommonV1.validate(common.raw)
+
+    def load_csv_as_dictlist():
+        return lambda: gazelib.io.load_csv_as_dictlist(gazedata_path)
+
+    def convert_icl_cg():
+        return lambda: cg.common.convert(gazedata_path,
+                                         experiment_config_path,
+                                         participant_number=0,
+                                         trial_config_id=trial_config_id,
+                                         was_calibrated=True)
+
+    def median_filter():
+        values = common.get_stream_values('gazelib/gaze/left_eye_pupil_mm')
+        values = [4.0 if v is None else v for v in values]
+        return lambda: igazelib.median_filter(values, 5)
+
+    def append_samples():
+        tl = common.get_timeline('eyetracker')
+        names = common.list_stream_names()
+        chunk = 1000
+
+        def build():
+            c = gazelib.containers.CommonV1()
+            c.add_timeline('eyetracker', [], regular=True)
+            for name in names:
+                c.add_stream(name, 'eyetracker', [], confidence=[])
+            for i in range(0, len(tl), chunk):
+                values = {}
+                confidences = {}
+                for name in names:
+                    stream = common.get_stream(name)
+                    values[name] = stream['values'][i:i + chunk]
+                    confidences[name] = stream['confidence'][i:i + chunk]
+                c.append_samples('eyetracker', tl[i:i + chunk], values,
+                                 confidences)
+            return c
+        return build
+
+    def render_overview():
+        path = os.path.join(tmpdir, 'overview.html')
+        return lambda: vis_common.render_overview(common, path)
+
+    return common, [
+        ('slice_by_relative_time', slice_by_relative_time),
+        ('validate', validate),
+        ('load_csv_as_dictlist', load_csv_as_dictlist),
+        ('convert_icl_cg', convert_icl_cg),
+        ('median_filter', median_filter),
+        ('append_samples', append_samples),
+        ('render_overview', render_overview)
+    ]
+
+
+def measure(setup, repeat):
+    '''
+    Return dict of timings and peak memory of the function given by setup.
+    '''
+    func = setup()
+    func()  # warm up, e.g. lazy imports
+    seconds = []
+    for _ in range(repeat):
+        t0 = clock()
+        func()
+        seconds.append(clock() - t0)
+    seconds.sort()
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'median_seconds': seconds[len(seconds) // 2],
+        'min_seconds': seconds[0],
+        'repeat': repeat,
+        'peak_memory_bytes': peak
+    }
+
+
+def get_git_commit():
+    '''Return the commit hash of the working tree or None.'''
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here,
+                                      stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('utf-8').strip()
+
+
+def run(duration, rate, blink_interval, dropout_interval, uncertain_rate,
+        repeat, only=None, seed=0, trial_configuration=None, trials=None):
+    '''
+    Run the benchmarks and return the results as a JSON compatible dict.
+
+    Parameters:
+        duration, trials: length of the recording in seconds and in
+            trials, see gazelib.synthetic.iter_chunks
+        rate, blink_interval, dropout_interval, uncertain_rate,
+            seed: see gazelib.synthetic.GazeGenerator
+        repeat: number of timed runs per case.
+        only: optional list of case names to run.
+        trial_configuration: optional ICL trial configuration. Defaults to
+            gazelib.synthetic.DEFAULT_TRIAL_CONFIGURATION.
+    '''
+    if trial_configuration is None:
+        trial_configuration = synthetic.DEFAULT_TRIAL_CONFIGURATION
+    options = {
+        'duration': duration,
+        'trials': trials,
+        'rate': rate,
+        'blink_interval': blink_interval,
+        'dropout_interval': dropout_interval,
+        'uncertain_rate': uncertain_rate,
+        'seed': seed,
+        'trial_configuration': trial_configuration
+    }
+    tmpdir = tempfile.mkdtemp()
+    try:
+        results = {}
+        common, cases = get_cases(options, tmpdir)
+        trial_count = common.count_events('icl/experiment/reaction/trial')
+        for name, setup in cases:
+            if only and name not in only:
+                continue
+            results[name] = measure(setup, repeat)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return {
+        'gazelib_version': gazelib.__version__,
+        'git_commit': get_git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': options,
+        'trial_count': trial_count,
+        'results': results
+    }
+
+
+def format_report(report, baseline=None):
+    '''
+    Return the results as a human readable table. If a baseline report is
+    given, include the ratio of median times, below 1 meaning faster.
+    '''
+    lines = []
+    header = '{:24s} {:>12s} {:>12s}'.format('case', 'median (ms)',
+                                             'peak (MiB)')
+    if baseline is not None:
+        header += ' {:>10s}'.format('vs base')
+    lines.append(header)
+    for name in sorted(report['results']):
+        r = report['results'][name]
+        peak = r['peak_memory_bytes']
+        peak = '-' if peak is None else '{:.1f}'.format(peak / 2.0 ** 20)
+        line = '{:24s} {:12.1f} {:>12s}'.format(
+            name, 1000 * r['median_seconds'], peak)
+        if baseline is not None:
+            base = baseline['results'].get(name)
+            if base is None:
+                line += ' {:>10s}'.format('-')
+            else:
+                ratio = r['median_seconds'] / base['median_seconds']
+                line += ' {:10.2f}'.format(ratio)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark gazelib on synthetic recordings.')
+    parser.add_argument('--duration', type=float,
+                        help='recording length in seconds, default 60 '
+                             'unless --trials is given')
+    parser.add_argument('--trials', type=int,
+                        help='recording length in trials')
+    parser.add_argument('--rate', type=float, default=300.0,
+                        help='sampling rate in Hz')
+    parser.add_argument('--blink-interval', type=float, default=4.0,
+                        help='mean seconds between blinks')
+    parser.add_argument('--dropout-interval', type=float, default=2.0,
+                        help='mean seconds between single eye dropouts')
+    parser.add_argument('--uncertain-rate', type=float, default=0.02,
+                        help='fraction of samples with uncertain validity')
+    parser.add_argument('--trial-config',
+                        help='JSON file of an ICL trial configuration')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help='case names to run')
+    parser.add_argument('--output', help='write results to a JSON file')
+    parser.add_argument('--compare', help='JSON results of a baseline run')
+    args = parser.parse_args(argv)
+
+    trial_configuration = None
+    if args.trial_config:
+        trial_configuration = gazelib.io.load_json(args.trial_config)
+    duration = args.duration
+    if duration is None and args.trials is None:
+        duration = 60.0
+    report = run(duration, args.rate, args.blink_interval,
+                 args.dropout_interval, args.uncertain_rate, args.repeat,
+                 args.only, args.seed, trial_configuration, args.trials)
+    if args.output:
+        gazelib.io.write_fancy_json(args.output, report)
+
+    baseline = None
+    if args.compare:
+        baseline = gazelib.io.load_json(args.compare)
+    sys.stdout.write(format_report(report, baseline) + '\n')
@@ -0,0 +1,6 @@
+'''
+Areas of interest (AoI) and testing if gaze hits them.
+'''
+from .hits import (to_rectangle_array, membership,  # noqa
+                   first_and_last_indices, dwell_fractions, hit_test)
+from .index import AoiIndex  # noqa
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+Vectorized hit-testing of gaze samples against many rectangular AoIs.
+
+Rectangles are expected in gazelib/geom/rectangle format i.e.
+[x1, y1, x2, y2] where (x1, y1) is the top-left and (x2, y2) the
+bottom-right corner. This is the format returned by
+gazelib.conversion.utils.TrialConfiguration.get_aoi_rectangle.
+Like gazelib.legacy.igazelib.inside_aoi, the borders are not
+included in the AoI.
+'''
+import numpy as np
+
+
+def to_rectangle_array(rectangles):
+    '''
+    Parameters:
+        rectangles: a list of rectangles in gazelib/geom/rectangle format.
+            Legacy AoI dicts with keys 'x1', 'x2', 'y1', 'y2' are
+            accepted too.
+
+    Return:
+        numpy array of shape (n_rectangles, 4).
+
+    Raise:
+        ValueError if a rectangle cannot be interpreted.
+    '''
+    rows = []
+    for rect in rectangles:
+        if isinstance(rect, dict):
+            rect = [rect['x1'], rect['y1'], rect['x2'], rect['y2']]
+        if len(rect) != 4:
+            raise ValueError('Invalid rectangle: ' + str(rect))
+        rows.append(rect)
+    return np.array(rows, dtype=float).reshape((len(rows), 4))
+
+
+def to_coordinate_array(values):
+    '''
+    Return float numpy array where None values are replaced by NaN.
+    NaN coordinates are never inside any AoI.
+    '''
+    return np.array(values, dtype=float)
+
+
+def membership(xs, ys, rectangles):
+    '''
+    Test all samples against all rectangles at once.
+
+    Parameters:
+        xs: a sequence of x coordinates. None values are allowed.
+        ys: a sequence of y coordinates. None values are allowed.
+        rectangles: a list of rectangles, see to_rectangle_array.
+
+    Return:
+        boolean numpy array of shape (n_samples, n_rectangles).
+        Element [i, j] is True if the i:th sample is inside
+        the j:th rectangle.
+    '''
+    xs = to_coordinate_array(xs)
+    ys = to_coordinate_array(ys)
+    if xs.shape != ys.shape:
+        raise ValueError('xs and ys must have equal length.')
+    rects = to_rectangle_array(rectangles)
+
+    # Broadcast samples as column and rectangles as row.
+    x = xs[:, np.newaxis]
+    y = ys[:, np.newaxis]
+    # NaN comparisons are False, thus gaps are outside of all AoIs.
+    return ((rects[:, 0] < x) & (x < rects[:, 2]) &
+            (rects[:, 1] < y) & (y < rects[:, 3]))
+
+
+def first_and_last_indices(member):
+    '''
+    Parameters:
+        member: boolean array of shape (n_samples, n_rectangles),
+            see membership.
+
+    Return:
+        tuple (first, last) of integer numpy arrays of length n_rectangles.
+        The sample index when gaze first and last was inside the AoI.
+        -1 if gaze never entered the AoI.
+    '''
+    n_samples, n_rects = member.shape
+    if n_samples == 0:
+        none_found = np.full(n_rects, -1, dtype=np.intp)
+        return none_found, none_found.copy()
+    hit_any = member.any(axis=0)
+    first = np.where(hit_any, member.argmax(axis=0), -1)
+    last = np.where(hit_any,
+                    n_samples - 1 - member[::-1].argmax(axis=0), -1)
+    return first, last
+
+
+def dwell_fractions(member):
+    '''
+    Parameters:
+        member: boolean array of shape (n_samples, n_rectangles),
+            see membership.
+
+    Return:
+        float numpy array of length n_rectangles. Portion of all samples
+        inside each AoI. Samples with gaps count as outside.
+        -1 for each AoI if there are no samples, similarly to
+        gazelib.legacy.igazelib.gaze_inside_aoi_percentage.
+    '''
+    n_samples = member.shape[0]
+    if n_samples == 0:
+        return np.full(member.shape[1], -1.0)
+    return member.sum(axis=0) / float(n_samples)
+
+
+def hit_test(xs, ys, rectangles):
+    '''
+    Compute AoI membership, entry indices, and dwell fractions
+    for all AoIs in one pass.
+
+    Parameters:
+        xs: a sequence of x coordinates. None values are allowed.
+        ys: a sequence of y coordinates. None values are allowed.
+        rectangles: a list of rectangles in gazelib/geom/rectangle format.
+
+    Return::
+
+        {
+            'membership': <bool array (n_samples, n_rectangles)>,
+            'first_index': <int array (n_rectangles,), -1 if never inside>,
+            'last_index': <int array (n_rectangles,), -1 if never inside>,
+            'dwell_fraction': <float array (n_rectangles,)>
+        }
+
+    '''
+    member = membership(xs, ys, rectangles)
+    first, last = first_and_last_indices(member)
+    return {
+        'membership': member,
+        'first_index': first,
+        'last_index': last,
+        'dwell_fraction': dwell_fractions(member)
+    }
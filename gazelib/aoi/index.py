@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+'''
+Spatial index for mapping gaze samples to AoIs when AoIs are many
+or polygonal.
+
+The index is a uniform grid over the bounding box of the AoIs.
+Each grid cell knows the AoIs that overlap it, thus a sample is tested
+only against the few AoIs of its cell instead of all AoIs.
+Build the index once per stimulus and reuse it for all participants.
+The index is immutable and can be pickled to worker processes.
+
+Supported AoI shapes:
+    rectangle: [x1, y1, x2, y2] i.e. gazelib/geom/rectangle.
+        Legacy dicts with keys 'x1', 'x2', 'y1', 'y2' are accepted too.
+        Borders are not included, like in hits.membership.
+    polygon: a list of [x, y] vertices, at least three.
+        Even-odd rule decides if a point is inside.
+'''
+import numpy as np
+from math import ceil, sqrt
+from gazelib.statistics.grouping import group_segments
+from .hits import to_coordinate_array
+
+
+RECTANGLE = 'rectangle'
+POLYGON = 'polygon'
+
+
+def to_shape(aoi):
+    '''
+    Return tuple (kind, vertices_or_corners) where kind is
+    RECTANGLE or POLYGON.
+
+    Raise ValueError if the AoI cannot be interpreted.
+    '''
+    if isinstance(aoi, dict):
+        aoi = [aoi['x1'], aoi['y1'], aoi['x2'], aoi['y2']]
+    arr = np.array(aoi, dtype=float)
+    if arr.shape == (4,):
+        return (RECTANGLE, arr)
+    if arr.ndim == 2 and arr.shape[1] == 2 and arr.shape[0] >= 3:
+        return (POLYGON, arr)
+    raise ValueError('Invalid AoI: ' + str(aoi))
+
+
+def bounding_box(shape):
+    '''Return [x1, y1, x2, y2] of the shape given by to_shape.'''
+    kind, arr = shape
+    if kind == RECTANGLE:
+        return arr
+    return np.array([arr[:, 0].min(), arr[:, 1].min(),
+                     arr[:, 0].max(), arr[:, 1].max()])
+
+
+def inside_rectangle(xs, ys, rect):
+    '''Return boolean array. Borders are not included.'''
+    return ((rect[0] < xs) & (xs < rect[2]) &
+            (rect[1] < ys) & (ys < rect[3]))
+
+
+def inside_polygon(xs, ys, vertices):
+    '''
+    Return boolean array. Uses the even-odd rule: a point is inside
+    if a horizontal ray from it crosses the edges an odd number of times.
+    '''
+    inside = np.zeros(xs.shape, dtype=bool)
+    xj, yj = vertices[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for xi, yi in vertices:
+            crosses = (yi > ys) != (yj > ys)
+            x_cross = (xj - xi) * (ys - yi) / (yj - yi) + xi
+            inside ^= crosses & (xs < x_cross)
+            xj, yj = xi, yi
+    return inside
+
+
+def inside_shape(xs, ys, shape):
+    '''Return boolean array, True for points inside the shape.'''
+    kind, arr = shape
+    if kind == RECTANGLE:
+        return inside_rectangle(xs, ys, arr)
+    return inside_polygon(xs, ys, arr)
+
+
+class AoiIndex(object):
+
+    def __init__(self, aois, grid_size=None):
+        '''
+        Parameters:
+            aois:
+                A list of AoIs, rectangles or polygons. See the module
+                docstring for formats. The position of the AoI in the list
+                is its id.
+            grid_size:
+                Optional number of grid cells per side. Defaults to
+                the square root of the number of AoIs, which gives
+                about one AoI per cell for grid-like layouts.
+
+        Raise:
+            ValueError if an AoI cannot be interpreted.
+        '''
+        self.shapes = [to_shape(aoi) for aoi in aois]
+        n = len(self.shapes)
+
+        if grid_size is None:
+            grid_size = int(ceil(sqrt(n)))
+        self.grid_size = max(1, int(grid_size))
+
+        if n == 0:
+            self.bounds = np.zeros(4)
+        else:
+            boxes = np.array([bounding_box(s) for s in self.shapes])
+            self.bounds = np.array([boxes[:, 0].min(), boxes[:, 1].min(),
+                                    boxes[:, 2].max(), boxes[:, 3].max()])
+
+        # Avoid division by zero with degenerate bounds.
+        gs = self.grid_size
+        self.cell_width = max(self.bounds[2] - self.bounds[0], 1e-12) / gs
+        self.cell_height = max(self.bounds[3] - self.bounds[1], 1e-12) / gs
+
+        # Candidate AoI ids of each cell in increasing id order.
+        self.cells = [[] for _ in range(gs * gs)]
+        for aoi_id, shape in enumerate(self.shapes):
+            x1, y1, x2, y2 = bounding_box(shape)
+            c0 = self._clip_cell((x1 - self.bounds[0]) // self.cell_width)
+            c1 = self._clip_cell((x2 - self.bounds[0]) // self.cell_width)
+            r0 = self._clip_cell((y1 - self.bounds[1]) // self.cell_height)
+            r1 = self._clip_cell((y2 - self.bounds[1]) // self.cell_height)
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    self.cells[row * gs + col].append(aoi_id)
+
+    @classmethod
+    def from_trial_configuration(cls, trial_configuration, grid_size=None):
+        '''
+        Build index from all AoI rectangles of a
+        gazelib.conversion.utils.TrialConfiguration.
+        '''
+        rects = trial_configuration.get_aoi_rectangles()
+        return cls(rects, grid_size=grid_size)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def _clip_cell(self, c):
+        return int(min(max(c, 0), self.grid_size - 1))
+
+    def cell_indices(self, xs, ys):
+        '''
+        Return integer numpy array of flat grid cell indices.
+        -1 for samples outside the bounds or with missing coordinates.
+        '''
+        gs = self.grid_size
+        with np.errstate(invalid='ignore'):
+            cols = np.floor((xs - self.bounds[0]) / self.cell_width)
+            rows = np.floor((ys - self.bounds[1]) / self.cell_height)
+            # The upper bounds belong to the last cell.
+            cols = np.where(xs == self.bounds[2], gs - 1, cols)
+            rows = np.where(ys == self.bounds[3], gs - 1, rows)
+            inside = ((cols >= 0) & (cols < gs) &
+                      (rows >= 0) & (rows < gs))
+        cells = np.full(xs.shape, -1, dtype=np.intp)
+        cells[inside] = (rows[inside] * gs + cols[inside]).astype(np.intp)
+        return cells
+
+    def _iter_cell_samples(self, xs, ys):
+        '''
+        Yield (candidate_ids, sample_indices) for each non-empty cell.
+        '''
+        cells = self.cell_indices(xs, ys)
+        sample_indices = np.flatnonzero(cells >= 0)
+        uniq, order, bounds = group_segments(cells[sample_indices])
+        for k, cell in enumerate(uniq.tolist()):
+            candidates = self.cells[cell]
+            if len(candidates) > 0:
+                seg = order[bounds[k]:bounds[k + 1]]
+                yield candidates, sample_indices[seg]
+
+    def lookup(self, xs, ys):
+        '''
+        Map each sample to an AoI id.
+
+        Parameters:
+            xs: a sequence of x coordinates. None values are allowed.
+            ys: a sequence of y coordinates. None values are allowed.
+
+        Return:
+            integer numpy array of AoI ids, one per sample.
+            If AoIs overlap, the one with smallest id wins.
+            -1 for samples outside all AoIs or with missing coordinates.
+        '''
+        xs = to_coordinate_array(xs)
+        ys = to_coordinate_array(ys)
+        if xs.shape != ys.shape:
+            raise ValueError('xs and ys must have equal length.')
+
+        ids = np.full(xs.shape, -1, dtype=np.intp)
+        for candidates, idx in self._iter_cell_samples(xs, ys):
+            for aoi_id in candidates:
+                hit = inside_shape(xs[idx], ys[idx], self.shapes[aoi_id])
+                ids[idx[hit]] = aoi_id
+                idx = idx[~hit]
+                if len(idx) == 0:
+                    break
+        return ids
+
+    def membership(self, xs, ys):
+        '''
+        Like gazelib.aoi.membership but for any supported AoI shape and
+        tests each sample only against the AoIs of its grid cell.
+
+        Return:
+            boolean numpy array of shape (n_samples, n_aois).
+        '''
+        xs = to_coordinate_array(xs)
+        ys = to_coordinate_array(ys)
+        if xs.shape != ys.shape:
+            raise ValueError('xs and ys must have equal length.')
+
+        member = np.zeros((len(xs), len(self.shapes)), dtype=bool)
+        for candidates, idx in self._iter_cell_samples(xs, ys):
+            for aoi_id in candidates:
+                shape = self.shapes[aoi_id]
+                member[idx, aoi_id] = inside_shape(xs[idx], ys[idx], shape)
+        return member
@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+'''
+Compact in-memory representations of CommonV1 data.
+
+A list of Python floats takes about 32 bytes per element. Confidence
+values typically take only a few discrete levels, e.g. the five levels
+of Tobii validity codes, and can therefore be stored as one byte codes
+to a lookup table of levels. Regularly sampled timelines can be stored
+as a start time and an interval, with small per-sample corrections and a
+list of exceptions.
+
+The compact objects behave like read-only lists: they support len,
+indexing, slicing, iteration, and comparison with lists. numpy.asarray
+converts them to float arrays. They are expanded to lists only when
+written to JSON, see gazelib.io.write_json.
+'''
+from bisect import bisect_left
+import math
+import numpy as np
+
+# Lookup tables up to this size are indexed with uint8 codes.
+MAX_LEVELS = 256
+
+# Timelines with more exceptions than this fraction of their samples are
+# not stored as regular timelines.
+MAX_EXCEPTION_RATIO = 0.25
+
+
+def _append(view, buffer, values):
+    '''
+    Append values after the view, which is either a prefix of the buffer or
+    an array not owned by the caller if buffer is None. The buffer grows by
+    doubling, thus appending takes amortized time proportional to the
+    number of values.
+
+    Return:
+        tuple (view, buffer), the extended view and its buffer
+    '''
+    n = len(view)
+    needed = n + len(values)
+    if buffer is None or len(buffer) < needed:
+        capacity = max(needed, 2 * n, 16)
+        buffer = np.empty(capacity, dtype=view.dtype)
+        buffer[:n] = view
+    buffer[n:needed] = values
+    return buffer[:needed], buffer
+
+
+def _to_float_array(values):
+    '''
+    Return values as a flat float numpy array.
+
+    Raise:
+        ValueError: if values contain non-numbers, such as None or NaN.
+    '''
+    if not isinstance(values, (np.ndarray, list, tuple)):
+        values = list(values)
+    try:
+        arr = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError('Values must be numbers.')
+    if arr.ndim != 1:
+        raise ValueError('Values must be a flat sequence.')
+    if np.isnan(arr).any():
+        # Also None converts to NaN.
+        raise ValueError('Values must be numbers.')
+    return arr
+
+
+def _to_exact_floats(arr):
+    '''
+    Return the float64 array as float32 if no value changes in the
+    conversion, otherwise as float64.
+    '''
+    narrow = arr.astype(np.float32)
+    if np.array_equal(narrow, arr):
+        return narrow
+    return arr
+
+
+def _to_int_array(values):
+    '''
+    Return values as a flat int64 numpy array.
+
+    Raise:
+        ValueError: if values are not integers.
+    '''
+    arr = np.asarray(values)
+    if arr.ndim != 1 or (len(arr) > 0 and arr.dtype.kind not in 'iu'):
+        raise ValueError('Times must be a flat sequence of integers.')
+    return arr.astype(np.int64)
+
+
+class _Growable(object):
+    '''
+    Base for compact sequences whose numpy array attributes can be
+    extended in place. Views given to slices are never written to.
+    '''
+
+    # Names of the array attributes
+    _arrays = ()
+
+    def _append_to(self, name, values):
+        '''Append values to the array attribute name.'''
+        view, buffer = _append(getattr(self, name),
+                               self._buffers.get(name), values)
+        setattr(self, name, view)
+        self._buffers[name] = buffer
+
+    def _replace(self, name, array):
+        '''Replace the array attribute name by a new array.'''
+        setattr(self, name, array)
+        self._buffers.pop(name, None)
+
+    @property
+    def nbytes(self):
+        '''Bytes held by the arrays, including their spare capacity.'''
+        size = 0
+        for name in self._arrays:
+            arr = self._buffers.get(name, getattr(self, name))
+            if arr is not None:
+                size += arr.nbytes
+        return size
+
+
+class CompactArray(_Growable):
+    '''
+    Read-only sequence of floats stored either as uint8 codes to a lookup
+    table of levels or, if there are too many distinct values, as float32.
+    Values that float32 cannot represent exactly keep float64, thus the
+    stored values are always equal to the given ones.
+    Construct with compact_floats.
+
+    Parameters:
+        data: numpy array of uint8 codes if levels is given, otherwise
+            numpy array of float32 or float64 values.
+        levels: optional numpy float array, the lookup table.
+    '''
+
+    _arrays = ('data', 'levels')
+
+    def __init__(self, data, levels=None):
+        self.data = data
+        self.levels = levels
+        self._buffers = {}
+
+    def extend(self, values):
+        '''
+        Append numbers. Takes amortized time proportional to the number of
+        values. Slices taken earlier are unaffected.
+
+        Raise:
+            ValueError: if values contain non-numbers, such as None or NaN.
+        '''
+        arr = _to_float_array(values)
+        if self.levels is not None:
+            new_levels = np.setdiff1d(arr, self.levels)
+            if len(self.levels) + len(new_levels) <= MAX_LEVELS:
+                if len(new_levels) > 0:
+                    # Old codes stay valid. Slices keep the old table.
+                    self._replace('levels', np.concatenate((self.levels,
+                                                            new_levels)))
+                order = np.argsort(self.levels, kind='mergesort')
+                pos = np.searchsorted(self.levels[order], arr)
+                self._append_to('data', order[pos].astype(np.uint8))
+                return
+            # Too many levels for codes.
+            self._replace('data', _to_exact_floats(self.to_numpy()))
+            self._replace('levels', None)
+        arr = _to_exact_floats(arr)
+        if arr.dtype != self.data.dtype and arr.dtype == np.float64:
+            # Widen to float64 to keep the new values exact.
+            self._replace('data', self.data.astype(float))
+        self._append_to('data', arr.astype(self.data.dtype))
+
+    def to_numpy(self):
+        '''Return values as a new float64 numpy array.'''
+        if self.levels is None:
+            return self.data.astype(float)
+        return self.levels[self.data]
+
+    def representatives(self):
+        '''
+        Return list of floats that includes each distinct stored value,
+        without expanding coded arrays. May include levels unused by a
+        slice. Enough to validate the values against a schema.
+        '''
+        if self.levels is None:
+            return self.data.tolist()
+        return self.levels.tolist()
+
+    def tolist(self):
+        '''Return values as a list of Python floats.'''
+        return self.to_numpy().tolist()
+
+    def __array__(self, dtype=None):
+        arr = self.to_numpy()
+        if dtype is not None:
+            arr = arr.astype(dtype, copy=False)
+        return arr
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # Views share the buffers.
+            return CompactArray(self.data[index], self.levels)
+        if self.levels is None:
+            return float(self.data[index])
+        return float(self.levels[self.data[index]])
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if not hasattr(other, '__len__') or len(other) != len(self):
+            return False
+        try:
+            other = np.asarray(other, dtype=float)
+        except (TypeError, ValueError):
+            return False
+        return bool(np.array_equal(self.to_numpy(), other))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'CompactArray(' + repr(self.tolist()) + ')'
+
+
+def compact_floats(values, max_levels=MAX_LEVELS):
+    '''
+    Store the numbers compactly.
+
+    Parameters:
+        values: an iterable of numbers or a CompactArray.
+        max_levels: use a lookup table if there are at most this many
+            distinct values. At most 256.
+
+    Return:
+        CompactArray
+
+    Raise:
+        ValueError: if values contain non-numbers, such as None or NaN.
+    '''
+    if isinstance(values, CompactArray):
+        return values
+    arr = _to_float_array(values)
+    levels, codes = np.unique(arr, return_inverse=True)
+    if len(levels) <= min(max_levels, MAX_LEVELS):
+        return CompactArray(codes.astype(np.uint8), levels)
+    return CompactArray(_to_exact_floats(arr))
+
+
+class RegularTimeline(_Growable):
+    '''
+    Read-only sequence of integer times of a near-regular sampling:
+
+        t[i] = start + round((offset + i) * interval) + residual[i]
+
+    except at the exception indices, where the times are listed
+    explicitly. Small residuals, such as the jitter of eye-tracker clocks,
+    are stored densely as int8 or int16. They are omitted if the sampling
+    is exactly regular, in which case the memory use depends on the number
+    of exceptions only. Index to time and time to index conversions take
+    constant time apart from a binary search in the exceptions.
+    Construct with RegularTimeline.from_times.
+
+    Parameters:
+        start: integer time of the index origin.
+        interval: float sampling interval.
+        count: number of samples.
+        exception_indices: sorted numpy int64 array of indices in [0, count)
+        exception_times: numpy int64 array of the times at the indices.
+        residuals: optional numpy integer array of length count.
+        offset: integer index of the first sample from the origin. Slices
+            keep the origin so that rounding does not change.
+    '''
+
+    def __init__(self, start, interval, count, exception_indices,
+                 exception_times, residuals=None, offset=0):
+        self.start = int(start)
+        self.interval = float(interval)
+        self.count = int(count)
+        self.exception_indices = exception_indices
+        self.exception_times = exception_times
+        self.residuals = residuals
+        self.offset = int(offset)
+        self._buffers = {}
+
+    @staticmethod
+    def from_times(times, max_exceptions=None):
+        '''
+        Represent times with the mean interval. Deviations from the
+        formula smaller than half of the interval are stored as residuals
+        and the rest as exceptions.
+
+        Parameters:
+            times: a sequence of integers.
+            max_exceptions: optional integer. Return None if more samples
+                would need to be listed as exceptions.
+
+        Return:
+            RegularTimeline or None
+
+        Raise:
+            ValueError: if times are not integers.
+        '''
+        arr = _to_int_array(times)
+        n = len(arr)
+        if n == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return RegularTimeline(0, 0.0, 0, empty, empty.copy())
+        interval = 0.0
+        if n > 1:
+            interval = float(arr[-1] - arr[0]) / (n - 1)
+        tl = RegularTimeline(arr[0], interval, n, None, None)
+        indices = np.arange(n, dtype=np.int64)
+        deviations = arr - tl._predict(indices)
+
+        # Near-regular: deviations smaller than half an interval keep the
+        # time to index estimate within a step of the right index.
+        limit = min(np.iinfo(np.int16).max, interval / 2)
+        mask = np.abs(deviations) > limit
+        if max_exceptions is not None and np.count_nonzero(mask) > \
+                max_exceptions:
+            return None
+        tl.exception_indices = indices[mask]
+        tl.exception_times = arr[mask]
+        deviations[mask] = 0
+        if deviations.any():
+            if np.abs(deviations).max() <= np.iinfo(np.int8).max:
+                tl.residuals = deviations.astype(np.int8)
+            else:
+                tl.residuals = deviations.astype(np.int16)
+        return tl
+
+    _arrays = ('exception_indices', 'exception_times', 'residuals')
+
+    def _predict(self, indices):
+        '''Times of the index array by the formula, without corrections.'''
+        steps = (indices + self.offset) * self.interval
+        return self.start + np.floor(steps + 0.5).astype(np.int64)
+
+    @property
+    def nbytes(self):
+        '''Bytes held by the corrections and the parameters.'''
+        return _Growable.nbytes.fget(self) + 5 * 8
+
+    def extend(self, times):
+        '''
+        Append times. Takes amortized time proportional to the number of
+        times. Slices taken earlier are unaffected. Order is not checked.
+
+        Raise:
+            ValueError: if times are not integers.
+        '''
+        arr = _to_int_array(times)
+        m = len(arr)
+        if m == 0:
+            return
+        if self.count < 2:
+            # Too short to know the interval. Start over.
+            tl = RegularTimeline.from_times(np.concatenate((self.to_numpy(),
+                                                            arr)))
+            self.__dict__.update(tl.__dict__)
+            return
+
+        indices = np.arange(self.count, self.count + m, dtype=np.int64)
+        deviations = arr - self._predict(indices)
+        limit = min(np.iinfo(np.int16).max, self.interval / 2)
+        mask = np.abs(deviations) > limit
+        if mask.any():
+            self._append_to('exception_indices', indices[mask])
+            self._append_to('exception_times', arr[mask])
+            deviations[mask] = 0
+        if self.residuals is None and deviations.any():
+            self._replace('residuals', np.zeros(self.count, dtype=np.int8))
+        if self.residuals is not None:
+            if (self.residuals.dtype == np.int8 and
+                    np.abs(deviations).max() > np.iinfo(np.int8).max):
+                self._replace('residuals', self.residuals.astype(np.int16))
+            self._append_to('residuals',
+                            deviations.astype(self.residuals.dtype))
+        self.count += m
+
+        if len(self.exception_indices) > MAX_EXCEPTION_RATIO * self.count:
+            # The interval estimated from fewer samples drifted. Estimate
+            # again. The estimate improves with the count, thus this is
+            # rare enough to keep the amortized time.
+            tl = RegularTimeline.from_times(self.to_numpy())
+            self.__dict__.update(tl.__dict__)
+
+    def to_numpy(self):
+        '''Return times as a new int64 numpy array.'''
+        arr = self._predict(np.arange(self.count, dtype=np.int64))
+        if self.residuals is not None:
+            arr += self.residuals
+        arr[self.exception_indices] = self.exception_times
+        return arr
+
+    def representatives(self):
+        '''
+        Return list of integers that includes the first time and the
+        exceptions. Other times are integers by construction. Enough to
+        validate the timeline against a schema.
+        '''
+        if self.count == 0:
+            return []
+        return [self[0]] + self.exception_times.tolist()
+
+    def tolist(self):
+        '''Return times as a list of Python integers.'''
+        return self.to_numpy().tolist()
+
+    def bisect_left(self, t):
+        '''
+        Return the index of the first time that is at least t, like
+        bisect.bisect_left for a sorted list. The index is estimated from
+        the interval and then corrected by a few steps.
+        '''
+        if self.count == 0:
+            return 0
+        if self.interval > 0:
+            estimate = math.ceil((t - self.start) / self.interval)
+            i = int(min(max(estimate - self.offset, 0), self.count))
+        else:
+            i = 0
+        # Residuals and exceptions shift the boundary by a few samples.
+        for _ in range(16):
+            if i > 0 and self[i - 1] >= t:
+                i -= 1
+            elif i < self.count and self[i] < t:
+                i += 1
+            else:
+                return i
+        return bisect_left(self, t)
+
+    def __array__(self, dtype=None):
+        arr = self.to_numpy()
+        if dtype is not None:
+            arr = arr.astype(dtype, copy=False)
+        return arr
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, stop, step = index.indices(self.count)
+            if step != 1:
+                return self.tolist()[index]
+            stop = max(first, stop)
+            lo, hi = np.searchsorted(self.exception_indices, [first, stop])
+            residuals = None
+            if self.residuals is not None:
+                residuals = self.residuals[first:stop]
+            return RegularTimeline(self.start, self.interval, stop - first,
+                                   self.exception_indices[lo:hi] - first,
+                                   self.exception_times[lo:hi], residuals,
+                                   self.offset + first)
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError('Timeline index out of range.')
+        exceptions = self.exception_indices
+        if len(exceptions) > 0 and index <= exceptions[-1]:
+            # A bisect of a few steps is faster than numpy for one index.
+            j = bisect_left(exceptions, index)
+            if exceptions[j] == index:
+                return int(self.exception_times[j])
+        t = self.start + int(math.floor((index + self.offset) *
+                                        self.interval + 0.5))
+        if self.residuals is not None:
+            t += int(self.residuals[index])
+        return t
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if not hasattr(other, '__len__') or len(other) != len(self):
+            return False
+        try:
+            other = np.asarray(other, dtype=np.int64)
+        except (TypeError, ValueError):
+            return False
+        return bool(np.array_equal(self.to_numpy(), other))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'RegularTimeline(' + repr(self.tolist()) + ')'
+
+
+def to_json_compatible(obj):
+    '''
+    Expand compact objects and numpy arrays to lists. Used as the default
+    hook of json.dump.
+
+    Raise:
+        TypeError: if obj cannot be expanded.
+    '''
+    if isinstance(obj, (CompactArray, RegularTimeline, np.ndarray,
+                        np.generic)):
+        return obj.tolist()
+    raise TypeError(repr(obj) + ' is not JSON serializable')
@@ -6,10 +6,13 @@ from .validation import is_list_of_strings, is_integer, is_string
 # from .settings import min_event_slice_overlap_seconds as min_overlap
 from .statistics import arithmetic_mean, deltas
 from .io import load_json, write_json, write_fancy_json, write_dictlist_as_csv
+from .instrumentation import timed, count
+from .compact import (CompactArray, RegularTimeline, compact_floats,
+                      MAX_EXCEPTION_RATIO)
 from time import time as get_current_posix_time
-from deepdiff import DeepDiff
 from bisect import bisect_left  # binary tree search tool
-from jsonschema import validate as validate_jsonschema
+from sys import getsizeof
+import numpy as np
 
 
 def get_current_time_reference():
@@ -17,6 +20,141 @@ def get_current_time_reference():
     return int(get_current_posix_time() * 10**6)
 
 
+def bisect_time(timeline, t):
+    '''
+    Return the index of the first time in the timeline that is at least t.
+    Takes constant time for a RegularTimeline and logarithmic otherwise.
+    '''
+    if isinstance(timeline, RegularTimeline):
+        return timeline.bisect_left(t)
+    return bisect_left(timeline, t)
+
+
+def to_stream_values(arr):
+    '''
+    Convert a float numpy array to a list of stream values. CommonV1
+    streams represent missing values with None, thus NaNs become None.
+    '''
+    obj = arr.astype(object)
+    obj[np.isnan(arr)] = None
+    return obj.tolist()
+
+
+def get_deep_size(obj, seen=None):
+    '''
+    Estimate bytes of memory held by the object and its contents.
+
+    Lists, tuples, sets and dicts are sized deeply. Objects with a nbytes
+    attribute, such as numpy arrays, are sized by their data buffer.
+    Objects reached twice, e.g. a confidence level repeated in a list,
+    are counted once. None and booleans are shared by the interpreter and
+    therefore count zero.
+
+    Parameters:
+        obj: a Python object
+        seen: optional set of ids of objects already counted. Updated.
+
+    Return:
+        integer, bytes
+    '''
+    if seen is None:
+        seen = set()
+    if obj is None or obj is True or obj is False:
+        return 0
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+
+    size = getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_deep_size(key, seen) + get_deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            # Inline the common scalars of long streams for speed.
+            t = type(item)
+            if t is float or t is int:
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    size += getsizeof(item)
+            elif item is not None:
+                size += get_deep_size(item, seen)
+    return size
+
+
+def replace_compact(raw_common, expand):
+    '''
+    Return raw_common where the compact timelines and the compact
+    confidences of streams are replaced by expand(compact_object). Only
+    the changed dicts are copied. Used to pass compact containers to tools
+    that require lists.
+    '''
+    compact_types = (CompactArray, RegularTimeline)
+    r = raw_common
+    timelines = raw_common.get('timelines')
+    if isinstance(timelines, dict):
+        changed = {}
+        for name, tl in timelines.items():
+            if isinstance(tl, compact_types):
+                changed[name] = expand(tl)
+        if len(changed) > 0:
+            r = dict(r)
+            r['timelines'] = dict(timelines)
+            r['timelines'].update(changed)
+
+    streams = raw_common.get('streams')
+    if isinstance(streams, dict):
+        changed = {}
+        for name, stream in streams.items():
+            if (isinstance(stream, dict) and
+                    isinstance(stream.get('confidence'), compact_types)):
+                new_stream = dict(stream)
+                new_stream['confidence'] = expand(stream['confidence'])
+                changed[name] = new_stream
+        if len(changed) > 0:
+            if r is raw_common:
+                r = dict(r)
+            r['streams'] = dict(streams)
+            r['streams'].update(changed)
+    return r
+
+
+def aggregate_memory_usage(commons_or_reports):
+    '''
+    Sum memory usage reports of many containers, e.g. of all participants
+    of a study, to see which timelines and streams dominate.
+
+    Parameters:
+        commons_or_reports: iterable of CommonV1 objects or reports
+            returned by CommonV1.memory_usage
+
+    Return:
+        dict like CommonV1.memory_usage with the bytes summed by name
+        and additionally 'containers', the number of containers.
+    '''
+    total = {
+        'containers': 0,
+        'timelines': {},
+        'streams': {},
+        'confidence': {},
+        'events': 0,
+        'environment': 0,
+        'total': 0
+    }
+    for report in commons_or_reports:
+        if isinstance(report, CommonV1):
+            report = report.memory_usage()
+        total['containers'] += 1
+        for key in ['timelines', 'streams', 'confidence']:
+            for name, size in report[key].items():
+                total[key][name] = total[key].get(name, 0) + size
+        for key in ['events', 'environment', 'total']:
+            total[key] += report[key]
+    return total
+
+
 class CommonV1(object):
 
     class InvalidRangeException(Exception):
@@ -160,13 +298,20 @@ class CommonV1(object):
     }
 
     @staticmethod
+    @timed('gazelib.containers.CommonV1.validate')
     def validate(raw_common):
         '''
         Raises ValidationError if raw_common is not valid gazelib/common/v1
         '''
+        # Imported on first use to keep 'import gazelib' fast.
+        from jsonschema import validate as validate_jsonschema
+        # Compact objects are valid by construction except possibly
+        # their representative values.
+        raw_common = replace_compact(raw_common,
+                                     lambda c: c.representatives())
         validate_jsonschema(raw_common, CommonV1.SCHEMA)
 
-    def __init__(self, raw_common_or_filepath=None):
+    def __init__(self, raw_common_or_filepath=None, validate=True):
         '''
         Parameters:
             raw_common_or_filepath:
@@ -174,6 +319,9 @@ class CommonV1(object):
                 or a string path to a source file.
                 Supported source file types:
                 - JSON
+            validate:
+                Set False to skip validation of a dict that is known to
+                be valid, e.g. a slice of a valid container.
 
         Raises:
             ValidationError
@@ -196,14 +344,19 @@ class CommonV1(object):
             # Load file
             r = load_json(r)
             CommonV1.validate(r)
-        else:
+        elif validate:
             CommonV1.validate(r)
 
         self.raw = r
 
     def __eq__(self, other):
         '''Override '==' operator with deep difference check.'''
-        return DeepDiff(self.raw, other.raw) == {}
+        from deepdiff import DeepDiff  # imported on first use
+
+        def expand(c):
+            return c.tolist()
+        return DeepDiff(replace_compact(self.raw, expand),
+                        replace_compact(other.raw, expand)) == {}
 
     # Assertions
 
@@ -391,6 +544,46 @@ class CommonV1(object):
             else:
                 raise CommonV1.EmptyContainerException('No time content.')
 
+    def memory_usage(self):
+        '''
+        Estimate the memory held by the container, to decide what to
+        compact or to unload. See get_deep_size for the method. Data shared
+        between parts, e.g. with the container this one was sliced from,
+        is counted in each container but only once within one.
+
+        Return::
+
+            {
+                'timelines': {<timeline name>: <bytes>, ...},
+                'streams': {<stream name>: <bytes of values>, ...},
+                'confidence': {<stream name>: <bytes of confidence>, ...},
+                'events': <bytes>,
+                'environment': <bytes>,
+                'total': <bytes>
+            }
+        '''
+        seen = set()
+        report = {
+            'timelines': {},
+            'streams': {},
+            'confidence': {},
+            'events': get_deep_size(self.raw['events'], seen),
+            'environment': get_deep_size(self.raw['environment'], seen)
+        }
+        for tl_name, tl in self.raw['timelines'].items():
+            report['timelines'][tl_name] = get_deep_size(tl, seen)
+        for stream_name, stream in self.raw['streams'].items():
+            report['streams'][stream_name] = get_deep_size(stream['values'],
+                                                           seen)
+            if 'confidence' in stream:
+                size = get_deep_size(stream['confidence'], seen)
+                report['confidence'][stream_name] = size
+        report['total'] = (sum(report['timelines'].values()) +
+                           sum(report['streams'].values()) +
+                           sum(report['confidence'].values()) +
+                           report['events'] + report['environment'])
+        return report
+
     def get_relative_time_by_index(self, timeline_name, index):
         '''
         Return relative time on the timeline at index.
@@ -414,7 +607,8 @@ class CommonV1(object):
 
     def get_stream(self, stream_name):
         '''
-        Return: CommonV1 stream dict.
+        Return: CommonV1 stream dict. Its confidence, if any, is a
+            gazelib.compact.CompactArray, see add_stream.
         Raise: CommonV1.MissingStreamException: if name not found.
         '''
         try:
@@ -433,7 +627,10 @@ class CommonV1(object):
     def get_timeline(self, timeline_name):
         '''
         Return:
-            timeline i.e. a list of relative times.
+            timeline i.e. a sequence of relative times. Either a list or,
+            for near-regular timelines, a gazelib.compact.RegularTimeline,
+            which behaves like a read-only list but is not a list.
+            Use list(timeline) or numpy.asarray(timeline) if needed.
 
         Raise:
             CommonV1.MissingTimelineException: if name not found.
@@ -451,11 +648,16 @@ class CommonV1(object):
         '''
         try:
             tl = self.raw['timelines'][timeline_name]
-            return arithmetic_mean(deltas(tl))
         except KeyError:
             str_tl = str(timeline_name)
             raise CommonV1.MissingTimelineException('Timeline ' + str_tl +
                                                     ' not found.')
+        if isinstance(tl, RegularTimeline):
+            # The deltas sum up to the difference of the ends.
+            if len(tl) < 2:
+                return None
+            return float(tl[-1] - tl[0]) / (len(tl) - 1)
+        return arithmetic_mean(deltas(tl))
 
     def get_time_reference(self):
         '''
@@ -582,6 +784,7 @@ class CommonV1(object):
         '''Return list of names of stored timelines.'''
         return list(self.raw['timelines'].keys())
 
+    @timed('gazelib.containers.CommonV1.slice_by_relative_time')
     def slice_by_relative_time(self, rel_start_time, rel_end_time=None):
         '''
         Return new CommonV1 object with data only in the time range.
@@ -608,42 +811,36 @@ class CommonV1(object):
         }
 
         # Streams first, then events.
+        # Index range and slice of each timeline are computed only once
+        # and shared by the streams on the timeline.
+        sub_timelines = {}
         for stream_name, stream in self.raw['streams'].items():
 
-            # Find indices from the original timeline
             tl_name = stream['timeline']
-            tl = self.get_timeline(tl_name)  # Raises if not found
-            first_i = bisect_left(tl, rel_start_time)  # first in range
-            if rel_end_time is None:
-                end_i = None
-            else:
-                end_i = bisect_left(tl, rel_end_time)  # first after range
-            # https://docs.python.org/3/library/bisect.html
-
-            # Slice timeline and streams
-            # (TODO ensure that timeline slice is done only once)
-            if end_i is None:
-                sub_timeline = tl[first_i:]
-                sub_values = stream['values'][first_i:]
-                if 'confidence' in stream:
-                    sub_confidence = stream['confidence'][first_i:]
-            else:
-                sub_timeline = tl[first_i:end_i]
-                sub_values = stream['values'][first_i:end_i]  # incl-excl
-                if 'confidence' in stream:
-                    sub_confidence = stream['confidence'][first_i:end_i]
+            if tl_name not in sub_timelines:
+                # Find indices from the original timeline
+                tl = self.get_timeline(tl_name)  # Raises if not found
+                first_i = bisect_time(tl, rel_start_time)  # first in range
+                if rel_end_time is None:
+                    end_i = len(tl)
+                else:
+                    end_i = bisect_time(tl, rel_end_time)  # first after
+                sub_timelines[tl_name] = (first_i, end_i, tl[first_i:end_i])
+            first_i, end_i, sub_timeline = sub_timelines[tl_name]
 
             # Include stream to the slice if not empty.
-            if len(sub_values) > 0:
+            if end_i > first_i:
                 slice_raw['timelines'][tl_name] = sub_timeline
 
                 substream = {}
                 substream['timeline'] = tl_name
-                substream['values'] = sub_values
+                substream['values'] = stream['values'][first_i:end_i]
                 # Include confidencies only if they exist beforehand
                 if 'confidence' in stream:
-                    substream['confidence'] = sub_confidence
+                    substream['confidence'] = \
+                        stream['confidence'][first_i:end_i]
                 slice_raw['streams'][stream_name] = substream
+                count('samples', end_i - first_i)
 
         # Result:
         #   only needed timelines are included
@@ -703,7 +900,8 @@ class CommonV1(object):
                     # Add the event.
                     slice_raw['events'].append(nev)
 
-        return CommonV1(slice_raw)
+        # The slice is valid because the container is.
+        return CommonV1(slice_raw, validate=False)
 
     def slice_by_unix_time(self, start_time, end_time=None):
         '''
@@ -849,7 +1047,8 @@ class CommonV1(object):
 
         self.raw['events'].append(new_event)
 
-    def add_stream(self, stream_name, timeline_name, values, confidence=None):
+    def add_stream(self, stream_name, timeline_name, values, confidence=None,
+                   derived=None):
         '''
         Add a new sequence of sampled data.
 
@@ -864,7 +1063,21 @@ class CommonV1(object):
                 the length of the timeline.
             confidence
                 An optional iterable of confidence values. The confidencies
-                must be inclusively within 0.0 and 1.0.
+                must be numbers inclusively within 0.0 and 1.0, thus None
+                and NaN are rejected. Stored compactly but without loss of
+                precision as a gazelib.compact.CompactArray, see
+                gazelib.compact.compact_floats.
+
+        Note that the confidence in self.raw is therefore a read-only,
+        list-like CompactArray, not a list. Use list(confidence) where a
+        list is required. save_as_json and gazelib.io.write_json expand it;
+        give default=gazelib.compact.to_json_compatible to json.dumps.
+
+        Raise:
+            CommonV1.InvalidStreamException: if values or confidences are
+                invalid.
+            derived
+                Optional name of function that was used to derive the stream.
         '''
         if timeline_name not in self.raw['timelines']:
             msg = 'Timeline ' + timeline_name + ' not found.'
@@ -889,28 +1102,153 @@ class CommonV1(object):
             if not hasattr(confidence, '__iter__'):
                 msg = 'Confidence must be an iterable or None'
                 raise CommonV1.InvalidStreamException(msg)
-            # Convert to list so length can be checked.
-            # The specification also requires the internal representation
-            # to be a list.
-            confidence = list(confidence)
+            # Confidencies take typically only a few levels and are
+            # therefore stored as codes to a table of the levels.
+            # Expanded to a list when saved as JSON.
+            try:
+                # Slicing gives a new object that shares the buffers, so
+                # that appending to one stream does not affect another.
+                confidence = compact_floats(confidence)[:]
+            except ValueError:
+                msg = 'Confidence values must be numbers'
+                raise CommonV1.InvalidStreamException(msg)
             if len(confidence) != len(values):
                 msg = 'Confidence length must equal to values'
                 raise CommonV1.InvalidStreamException(msg)
-            # Ensure values inclusively between 0.0 and 1.0
-            if any(map(lambda c: c < 0.0 or c > 1.0, confidence)):
+            # Ensure values inclusively between 0.0 and 1.0.
+            # Checking the distinct levels suffices. NaN fails too.
+            levels = np.array(confidence.representatives())
+            if not np.all((levels >= 0.0) & (levels <= 1.0)):
                 msg = 'Confidence values must be within [0.0, 1.0]'
                 raise CommonV1.InvalidStreamException(msg)
 
+        if derived is not None and not is_string(derived):
+            msg = 'Derived must be a string: ' + str(derived)
+            raise CommonV1.InvalidStreamException(msg)
+
         new_stream = {
             'timeline': timeline_name,
             'values': values,
         }
         if confidence is not None:
             new_stream['confidence'] = confidence
+        if derived is not None:
+            new_stream['derived'] = derived
 
         self.raw['streams'][stream_name] = new_stream
 
-    def add_timeline(self, timeline_name, timeline_values):
+    @timed('gazelib.containers.CommonV1.append_samples')
+    def append_samples(self, timeline_name, times, stream_values,
+                       stream_confidences=None):
+        '''
+        Append a chunk of samples to a timeline and to each stream on it,
+        e.g. during live acquisition or chunked conversion. Only the chunk
+        is validated and the containers grow in amortized time proportional
+        to the chunk size. On error, nothing is appended.
+
+        Parameters:
+            timeline_name
+                The name of an existing timeline.
+            times
+                An iterable of integer microseconds in non-decreasing
+                order, not before the last time of the timeline.
+            stream_values
+                A dict from the name of each stream on the timeline to an
+                iterable of values, one for each time.
+            stream_confidences
+                A dict from the name of each stream that has confidence to
+                an iterable of confidences within 0.0 and 1.0. Optional if
+                no stream has confidence.
+
+        Raise:
+            MissingTimelineException: if the timeline is not found.
+            InvalidTimelineException: if times are not integers or are
+                out of order.
+            InvalidStreamException: if values or confidences of a stream
+                are missing, unexpected, of wrong length, or invalid.
+        '''
+        tl = self.get_timeline(timeline_name)  # Raises if not found
+        if stream_confidences is None:
+            stream_confidences = {}
+
+        # Validate the chunk before modifying anything.
+        try:
+            new_times = np.asarray(list(times))
+            if len(new_times) > 0 and new_times.dtype.kind not in 'iu':
+                raise TypeError()
+        except (TypeError, ValueError):
+            msg = 'Times must be integers.'
+            raise CommonV1.InvalidTimelineException(msg)
+        n = len(new_times)
+        if n > 0 and (np.any(np.diff(new_times) < 0) or
+                      (len(tl) > 0 and new_times[0] < tl[-1])):
+            msg = 'Times must not decrease.'
+            raise CommonV1.InvalidTimelineException(msg)
+
+        streams = {}
+        for stream_name, stream in self.raw['streams'].items():
+            if stream['timeline'] == timeline_name:
+                streams[stream_name] = stream
+        for name in set(stream_values) | set(stream_confidences):
+            if name not in streams:
+                msg = 'Stream ' + str(name) + ' not on the timeline.'
+                raise CommonV1.InvalidStreamException(msg)
+
+        new_values = {}
+        new_confidences = {}
+        for stream_name, stream in streams.items():
+            if stream_name not in stream_values:
+                msg = 'Values for stream ' + stream_name + ' are missing.'
+                raise CommonV1.InvalidStreamException(msg)
+            values = list(stream_values[stream_name])
+            if len(values) != n:
+                msg = 'Stream and timeline must have equal length.'
+                raise CommonV1.InvalidStreamException(msg)
+            new_values[stream_name] = values
+
+            has_confidence = 'confidence' in stream
+            if has_confidence != (stream_name in stream_confidences):
+                msg = ('Confidence must be given exactly for the streams '
+                       'with confidence: ' + stream_name)
+                raise CommonV1.InvalidStreamException(msg)
+            if has_confidence:
+                try:
+                    conf = compact_floats(stream_confidences[stream_name])
+                except ValueError:
+                    msg = 'Confidence values must be numbers'
+                    raise CommonV1.InvalidStreamException(msg)
+                if len(conf) != n:
+                    msg = 'Confidence length must equal to values'
+                    raise CommonV1.InvalidStreamException(msg)
+                levels = np.array(conf.representatives())
+                if not np.all((levels >= 0.0) & (levels <= 1.0)):
+                    msg = 'Confidence values must be within [0.0, 1.0]'
+                    raise CommonV1.InvalidStreamException(msg)
+                new_confidences[stream_name] = conf
+
+        if n == 0:
+            return
+
+        # Append. Lists grow in amortized constant time per item and
+        # compact objects by doubling their buffers.
+        if isinstance(tl, RegularTimeline):
+            tl.extend(new_times)
+            if len(tl.exception_indices) > MAX_EXCEPTION_RATIO * len(tl):
+                # No longer near-regular.
+                self.raw['timelines'][timeline_name] = tl.tolist()
+        else:
+            tl.extend(new_times.tolist())
+        for stream_name, stream in streams.items():
+            stream['values'].extend(new_values[stream_name])
+            if stream_name in new_confidences:
+                conf = new_confidences[stream_name]
+                if isinstance(stream['confidence'], CompactArray):
+                    stream['confidence'].extend(conf.to_numpy())
+                else:
+                    stream['confidence'].extend(conf.tolist())
+        count('samples', n)
+
+    def add_timeline(self, timeline_name, timeline_values, regular=False):
         '''
         Add a new timeline.
 
@@ -919,12 +1257,57 @@ class CommonV1(object):
                 A string that will be referenced from the streams.
             timeline_values
                 An iterable of integer microseconds. Will be converted to list.
+            regular
+                Set True to store a near-regularly sampled timeline as a
+                start time, an interval, and small corrections instead of a
+                list, if at most a quarter of the samples are irregular.
+                The timeline behaves like a list but takes a fraction of
+                the memory and converts between times and indices in
+                constant time. See gazelib.compact.RegularTimeline.
         '''
         if type(timeline_name) is str and hasattr(timeline_values, '__iter__'):
-            self.raw['timelines'][timeline_name] = list(timeline_values)
+            values = list(timeline_values)
+            if regular:
+                max_exceptions = int(len(values) * MAX_EXCEPTION_RATIO)
+                try:
+                    tl = RegularTimeline.from_times(values, max_exceptions)
+                except ValueError:
+                    raise CommonV1.InvalidTimelineException()
+                if tl is not None:
+                    values = tl
+            self.raw['timelines'][timeline_name] = values
         else:
             raise CommonV1.InvalidTimelineException()
 
+    def compact(self):
+        '''
+        Store near-regular timelines and stream confidences compactly, e.g.
+        after loading a container from JSON. See add_timeline and
+        add_stream.
+
+        The timeline and confidence lists themselves are not modified,
+        thus slices that share them are unaffected. However, the entries
+        of self.raw['timelines'] and self.raw['streams'] are replaced in
+        place, thus another CommonV1 constructed from the same raw dict
+        sees the compact objects as well.
+        '''
+        timelines = self.raw['timelines']
+        for tl_name, tl in list(timelines.items()):
+            if isinstance(tl, list):
+                max_exceptions = int(len(tl) * MAX_EXCEPTION_RATIO)
+                try:
+                    regular = RegularTimeline.from_times(tl, max_exceptions)
+                except ValueError:
+                    continue
+                if regular is not None:
+                    timelines[tl_name] = regular
+        streams = self.raw['streams']
+        for stream_name, stream in list(streams.items()):
+            if isinstance(stream.get('confidence'), list):
+                new_stream = dict(stream)
+                new_stream['confidence'] = compact_floats(stream['confidence'])
+                streams[stream_name] = new_stream
+
     def set_time_reference(self, microseconds_from_epoch):
         '''
         Can be used to anonymize data.
@@ -972,6 +1355,7 @@ class CommonV1(object):
         write_dictlist_as_csv(target_file_path, iterevents(),
                               headers=headers, delimiter=delimiter)
 
+    @timed('gazelib.containers.CommonV1.save_timeline_as_csv')
     def save_timeline_as_csv(self, timeline_name, target_file_path,
                              delimiter='\t'):
         '''
@@ -1007,6 +1391,7 @@ class CommonV1(object):
         write_dictlist_as_csv(target_file_path, iterstreams(),
                               headers=headers, delimiter=delimiter)
 
+    @timed('gazelib.containers.CommonV1.save_as_json')
     def save_as_json(self, target_file_path, human_readable=False):
         '''
         Store the content in gazelib/common/v1 in a JSON file.
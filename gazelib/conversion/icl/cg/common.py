@@ -2,10 +2,13 @@
 import gazelib
 from os import path
 from gazelib.conversion import utils
+from gazelib.instrumentation import timed, count
 
 
+@timed()
 def convert(gazedata_file_path, experiment_config_file_path,
-            participant_number, trial_config_id, was_calibrated):
+            participant_number, trial_config_id, was_calibrated,
+            regular_timeline=False):
     '''
     Parameters:
         gazedata_file_path: string
@@ -13,6 +16,8 @@ def convert(gazedata_file_path, experiment_config_file_path,
         participant_number: string
         trial_config_id: e.g. 'SRT1'
         was_calibrated: boolean
+        regular_timeline: boolean. If True, store the timeline compactly
+            as a RegularTimeline, see CommonV1.add_timeline.
 
     Return:
         CommonV1 object
@@ -83,7 +88,7 @@ def convert(gazedata_file_path, experiment_config_file_path,
     timeline = list(map(get_relative_time, gd))
 
     c.set_time_reference(global_time)
-    c.add_timeline('eyetracker', timeline)
+    c.add_timeline('eyetracker', timeline, regular=regular_timeline)
 
     # Build streams
 
@@ -244,4 +249,6 @@ def convert(gazedata_file_path, experiment_config_file_path,
         c.add_event(['icl/stimulus', 'icl/stimulus/image'],
                     r['start'], r['end'], extra=extra)
 
+    count('samples', len(gd))
+    count('events', c.count_events())
     return c
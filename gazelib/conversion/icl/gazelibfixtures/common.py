@@ -2,14 +2,19 @@
 import gazelib
 from os import path
 from gazelib.conversion import utils
+from gazelib.instrumentation import timed, count
 
 
-def convert(gazedata_file_path, experiment_config_file_path, trial_config_id):
+@timed()
+def convert(gazedata_file_path, experiment_config_file_path, trial_config_id,
+            regular_timeline=False):
     '''
     Parameters:
         gazedata_file_path: string
         experiment_config_file_path: string
         trial_config_id: 'mid' or 'shift'
+        regular_timeline: boolean. If True, store the timeline compactly
+            as a RegularTimeline, see CommonV1.add_timeline.
 
     Return:
         CommonV1 object
@@ -83,7 +88,7 @@ def convert(gazedata_file_path, experiment_config_file_path, trial_config_id):
     timeline = list(map(get_relative_time, gd))
 
     c.set_time_reference(global_time)
-    c.add_timeline('eyetracker', timeline)
+    c.add_timeline('eyetracker', timeline, regular=regular_timeline)
 
     # Build streams
 
@@ -239,4 +244,6 @@ def convert(gazedata_file_path, experiment_config_file_path, trial_config_id):
         c.add_event(['icl/stimulus', 'icl/stimulus/image'],
                     r['start'], r['end'], extra=extra)
 
+    count('samples', len(gd))
+    count('events', c.count_events())
     return c
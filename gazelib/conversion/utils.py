@@ -147,3 +147,11 @@ class TrialConfiguration(object):
         # Convert to gazelib/geom/rectangle
         rect = [aoi[0], aoi[2], aoi[1], aoi[3]]
         return rect
+
+    def get_aoi_rectangles(self):
+        '''
+        Returns all AoIs in gazelib/geom/rectangle format. The position
+        in the list equals the AoI index.
+        '''
+        n = len(self.raw['aois'])
+        return [self.get_aoi_rectangle(i) for i in range(n)]
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+'''
+Lightweight instrumentation of the hot paths.
+
+Gazelib functions that read, validate, slice, convert, or fit data are
+wrapped in named spans. A span measures the wall time of a call and can
+carry counters such as the number of rows read. Finished spans are passed
+to sinks. Without sinks, instrumentation is disabled and a wrapped call
+costs one extra check.
+
+Usage::
+
+    from gazelib import instrumentation
+
+    with instrumentation.profile() as summary:
+        run_analysis()
+    print(summary.format())
+
+    # Or record every span as a line of JSON.
+    sink = instrumentation.JsonLinesSink('spans.jsonl')
+    instrumentation.add_sink(sink)
+    ...
+    instrumentation.remove_sink(sink)
+    sink.close()
+'''
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import time as get_current_posix_time
+
+# Active sinks. Instrumentation is enabled when not empty.
+_sinks = []
+
+# Stack of open spans, separate for each thread.
+_local = threading.local()
+
+
+def _get_stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = []
+        _local.stack = stack
+    return stack
+
+
+def is_enabled():
+    '''Return True if there are sinks to record spans.'''
+    return len(_sinks) > 0
+
+
+def add_sink(sink):
+    '''
+    Start passing finished spans to the sink.
+
+    Parameters:
+        sink: an object with method record(span).
+    '''
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    '''Stop passing spans to the sink. Unknown sinks are ignored.'''
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+class Span(object):
+    '''
+    A timed call. Passed to the sinks when finished.
+
+    Attributes:
+        name: string, e.g. 'gazelib.io.load_json'
+        parent: name of the enclosing span or None.
+        start_time: POSIX time in seconds when the span began.
+        seconds: wall time of the span.
+        counters: dict from counter names to numbers.
+        error: name of the exception class that ended the span or None.
+    '''
+
+    def __init__(self, name, counters=None):
+        self.name = name
+        self.parent = None
+        self.start_time = None
+        self.seconds = None
+        self.counters = {} if counters is None else dict(counters)
+        self.error = None
+
+    def count(self, counter_name, n=1):
+        '''Add n to the counter.'''
+        self.counters[counter_name] = self.counters.get(counter_name, 0) + n
+
+    def to_dict(self):
+        '''Return JSON compatible dict.'''
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start_time': self.start_time,
+            'seconds': self.seconds,
+            'counters': self.counters,
+            'error': self.error
+        }
+
+    def __enter__(self):
+        stack = _get_stack()
+        if len(stack) > 0:
+            self.parent = stack[-1].name
+        stack.append(self)
+        self.start_time = get_current_posix_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = get_current_posix_time() - self.start_time
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        stack = _get_stack()
+        if len(stack) > 0 and stack[-1] is self:
+            stack.pop()
+        for sink in list(_sinks):
+            sink.record(self)
+        return False
+
+
+class _NullSpan(object):
+    '''Span that records nothing. Used when instrumentation is disabled.'''
+
+    def count(self, counter_name, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **counters):
+    '''
+    Return a context manager that times the code in its block::
+
+        with instrumentation.span('my_analysis', participants=10) as s:
+            ...
+            s.count('trials', 30)
+
+    Parameters:
+        name: string
+        counters: initial counter values.
+    '''
+    if not _sinks:
+        return _NULL_SPAN
+    return Span(name, counters)
+
+
+def count(counter_name, n=1):
+    '''
+    Add n to a counter of the innermost open span of the current thread.
+    Does nothing if instrumentation is disabled or no span is open.
+    '''
+    if not _sinks:
+        return
+    stack = _get_stack()
+    if len(stack) > 0:
+        stack[-1].count(counter_name, n)
+
+
+def timed(name=None):
+    '''
+    Decorator that runs each call of the function in a span.
+
+    Parameters:
+        name: span name. Defaults to the module and name of the function.
+            Give the name explicitly for methods.
+    '''
+    def decorator(func):
+        span_name = name
+        if span_name is None:
+            span_name = func.__module__ + '.' + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SummarySink(object):
+    '''
+    Sink that aggregates spans in memory by name: number of calls, total,
+    minimum, and maximum seconds, and sums of the counters.
+    '''
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            s = self.stats.get(span.name)
+            if s is None:
+                s = {
+                    'calls': 0,
+                    'errors': 0,
+                    'total_seconds': 0.0,
+                    'min_seconds': span.seconds,
+                    'max_seconds': span.seconds,
+                    'counters': {}
+                }
+                self.stats[span.name] = s
+            s['calls'] += 1
+            if span.error is not None:
+                s['errors'] += 1
+            s['total_seconds'] += span.seconds
+            s['min_seconds'] = min(s['min_seconds'], span.seconds)
+            s['max_seconds'] = max(s['max_seconds'], span.seconds)
+            for key, value in span.counters.items():
+                s['counters'][key] = s['counters'].get(key, 0) + value
+
+    def summary(self):
+        '''Return dict from span names to their statistics.'''
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def format(self):
+        '''
+        Return the statistics as a human readable table, the most time
+        consuming spans first. Nested spans are included in the time of
+        their parents.
+        '''
+        lines = ['{:48s} {:>8s} {:>12s} {:>12s}  {}'.format(
+            'span', 'calls', 'total (ms)', 'max (ms)', 'counters')]
+        items = sorted(self.summary().items(),
+                       key=lambda item: -item[1]['total_seconds'])
+        for name, s in items:
+            counters = ', '.join('{}={}'.format(k, v)
+                                 for k, v in sorted(s['counters'].items()))
+            lines.append('{:48s} {:8d} {:12.1f} {:12.1f}  {}'.format(
+                name, s['calls'], 1000 * s['total_seconds'],
+                1000 * s['max_seconds'], counters))
+        return '\n'.join(lines)
+
+
+class JsonLinesSink(object):
+    '''
+    Sink that writes each span as a JSON object on its own line, with
+    the process id. Suitable for long batch runs and later analysis.
+
+    Parameters:
+        target: a file path as string or a writable file object. A file
+            opened by the sink is appended to and closed by close().
+    '''
+
+    def __init__(self, target):
+        if isinstance(target, str):
+            self._file = open(target, 'a')
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        d = span.to_dict()
+        d['pid'] = os.getpid()
+        line = json.dumps(d, sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        '''Flush and close the file if opened by the sink.'''
+        with self._lock:
+            self._file.flush()
+            if self._owns_file:
+                self._file.close()
+
+
+@contextmanager
+def profile(sink=None):
+    '''
+    Context manager that enables instrumentation for the code in its block,
+    e.g. a single analysis run::
+
+        with instrumentation.profile() as summary:
+            ...
+        print(summary.format())
+
+    Parameters:
+        sink: optional sink. Defaults to a new SummarySink.
+
+    Yield:
+        the sink
+    '''
+    if sink is None:
+        sink = SummarySink()
+    add_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_sink(sink)
@@ -5,8 +5,11 @@ Input-Output functions that help to read and write gaze data.
 '''
 import json
 import csv
+from .instrumentation import timed, count
+from .compact import to_json_compatible
 
 
+@timed()
 def load_json(filename):
     '''
     Load json-type file and return its contents as python object.
@@ -27,15 +30,17 @@ def load_json(filename):
     return data
 
 
+@timed()
 def write_json(filename, data, human_readable=False):
     '''
     Dump data to a given JSON file. File is created if it does not exist.
+    Compact arrays and numpy arrays are written as lists.
 
     Raise TypeError if data is not serializable.
     '''
     with open(filename, 'w') as jsonfile:
         if not human_readable:
-            json.dump(data, jsonfile)
+            json.dump(data, jsonfile, default=to_json_compatible)
         else:
             # ensure_ascii=False
             #   'True' would turn non-ascii characters such
@@ -46,7 +51,8 @@ def write_json(filename, data, human_readable=False):
             #   Python 2.7 and Python 3.5 would produce different output.
             #   See https://docs.python.org/3/library/json.html#json.dump
             json.dump(data, jsonfile, sort_keys=True, indent=4,
-                      ensure_ascii=False, separators=(',', ': '))
+                      ensure_ascii=False, separators=(',', ': '),
+                      default=to_json_compatible)
 
 
 def write_fancy_json(filename, data):
@@ -58,6 +64,7 @@ def write_fancy_json(filename, data):
     return write_json(filename, data, human_readable=True)
 
 
+@timed()
 def load_csv_as_dictlist(filepath, delimiter='\t'):
     '''
     Load a file in csv (common in .gazedata) and return data as
@@ -91,9 +98,11 @@ def load_csv_as_dictlist(filepath, delimiter='\t'):
     if rows == []:
         raise ValueError('CSV file is not correctly formatted.')
 
+    count('rows', len(rows))
     return rows
 
 
+@timed()
 def write_dictlist_as_csv(target_filename, dictlist, headers=None,
                           delimiter='\t'):
     '''
@@ -127,5 +136,8 @@ def write_dictlist_as_csv(target_filename, dictlist, headers=None,
                                 delimiter=delimiter)
         writer.writeheader()
         writer.writerow(first)
+        rows = 1
         for d in dictlist:
             writer.writerow(d)
+            rows += 1
+    count('rows', rows)
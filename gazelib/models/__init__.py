@@ -1,2 +1,2 @@
 
-from . import fixation, saccade  # noqa
+from . import cache, fixation, saccade, saccade_search  # noqa
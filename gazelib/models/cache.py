@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+'''
+On-disk cache for model results.
+
+Results are stored as JSON files in a directory, one file per result,
+named by a fingerprint of the model inputs, the model name, the model
+version, and the model parameters. Models increment their version when
+their results change, so that results of older implementations are
+not reused. Because the cache lives in the file system, it persists across
+runs and can be shared by worker processes. The total size of the cache
+is bounded by evicting the least recently used results.
+
+Usage::
+
+    cache = ResultCache('/tmp/gazelib-cache')
+    r = saccade.fit(g, cache=cache)
+'''
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+
+def fingerprint_arrays(model_name, version, params, arrays):
+    '''
+    Fingerprint model inputs given as sequences of numbers.
+
+    Parameters:
+        model_name: string, e.g. 'gazelib.models.saccade.fit'
+        version: int, version of the model implementation.
+        params: JSON compatible dict of model parameters or None.
+        arrays: list of sequences of numbers. Nones are allowed.
+
+    Return:
+        hexadecimal string
+    '''
+    h = hashlib.sha1()
+    header = json.dumps([model_name, version, params], sort_keys=True)
+    h.update(header.encode('utf-8'))
+    for arr in arrays:
+        try:
+            data = np.asarray(arr, dtype=float)
+        except (TypeError, ValueError):
+            # Non-numeric values
+            data = json.dumps(list(arr), sort_keys=True).encode('utf-8')
+        else:
+            data = np.ascontiguousarray(data).tobytes()
+        # Length prefix separates the arrays unambiguously.
+        h.update(str(len(data)).encode('utf-8') + b':')
+        h.update(data)
+    return h.hexdigest()
+
+
+def fingerprint(common, stream_names, model_name, version, params=None):
+    '''
+    Fingerprint the streams of a CommonV1 and their timelines.
+
+    Parameters:
+        common: CommonV1 object
+        stream_names: list of names of the streams the model reads.
+        model_name: string
+        version: int, version of the model implementation.
+        params: JSON compatible dict of model parameters or None.
+
+    Raise:
+        InsufficientDataException: if streams are missing.
+
+    Return:
+        hexadecimal string
+    '''
+    common.assert_has_streams(stream_names)
+    arrays = []
+    for name in stream_names:
+        stream = common.get_stream(name)
+        arrays.append(common.get_timeline(stream['timeline']))
+        arrays.append(stream['values'])
+        arrays.append(stream.get('confidence', []))
+    return fingerprint_arrays(model_name, version, params, arrays)
+
+
+class ResultCache(object):
+    '''
+    Directory of JSON encoded results keyed by fingerprints.
+    Behaves like a dict: cache[key] raises KeyError for a missing result.
+
+    Parameters:
+        directory: path to the cache directory. Created if missing.
+        max_bytes: bound for the total size of the stored results.
+            Least recently used results are removed to fit.
+    '''
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024):
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process meanwhile.
+                if not os.path.isdir(directory):
+                    raise
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Estimated total size. Measured when first needed.
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _entries(self):
+        '''List (last use time, size, path) of the stored results.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Evicted by another process.
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __getitem__(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+        except (IOError, OSError, ValueError):
+            # Missing, evicted during read, or partially written.
+            raise KeyError(key)
+        try:
+            # Mark as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return result
+
+    def __setitem__(self, key, result):
+        data = json.dumps(result)
+        try:
+            # Size of the result being replaced, if any.
+            old_size = os.stat(self._path(key)).st_size
+        except OSError:
+            old_size = 0
+        # Write to a temporary file and rename so that concurrent
+        # readers never see a partial result.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        replace = getattr(os, 'replace', os.rename)
+        try:
+            replace(tmp_path, self._path(key))
+        except OSError:
+            os.remove(tmp_path)
+            raise
+
+        if self._size is None:
+            self._size = sum(e[1] for e in self._entries())
+        else:
+            self._size += len(data) - old_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def get(self, key, default=None):
+        '''Return the result for key or default if missing.'''
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def evict(self):
+        '''
+        Remove least recently used results until the total size is within
+        max_bytes.
+        '''
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another process.
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self):
+        '''Remove all results.'''
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
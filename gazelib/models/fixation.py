@@ -1,10 +1,375 @@
 # coding: utf-8
 '''
-Find a fixation from the data.
+Find fixations from the data.
+
+Two detectors are provided:
+    I-VT, velocity threshold: samples slower than a threshold velocity
+        are fixational and consecutive fixational samples form a fixation.
+    I-DT, dispersion threshold: a fixation is a maximal window of samples
+        whose dispersion, (max x - min x) + (max y - min y), stays under
+        a threshold.
+
+Coordinates are in gazelib relative units, times in microseconds.
+Fixations never span over gaps i.e. None values.
 '''
-# from gazelib.statistics import arithmetic_mean
-# import fixationmodel
+from gazelib.containers import CommonV1
+from gazelib.instrumentation import timed, count
+from gazelib.statistics.validity import find_runs
+from gazelib.preprocessing.binocular import mean_of_accepted
+from collections import deque
+import numpy as np
+
+
+STREAM_NAMES = [
+    'gazelib/gaze/left_eye_x_relative',
+    'gazelib/gaze/left_eye_y_relative',
+    'gazelib/gaze/right_eye_x_relative',
+    'gazelib/gaze/right_eye_y_relative'
+]
 
 
 def fit(g):
-    pass
+    '''
+    Fit a single fixation to the gaze of both eyes.
+
+    Parameter:
+        g: Gaze data as CommonV1 object
+
+    Require streams:
+        gazelib/gaze/left_eye_x_relative
+        gazelib/gaze/left_eye_y_relative
+        gazelib/gaze/right_eye_x_relative
+        gazelib/gaze/right_eye_y_relative
+
+    Raise:
+        InsufficientDataException: if streams are missing or they are empty.
+
+    Return::
+
+        {
+            'type': 'gazelib/gaze/fixation',
+            'centroid': [<x>, <y>],
+            'mean_squared_error': <float, variance around the centroid>
+        }
+
+    '''
+    xs, ys, times = get_gaze(g)
+    valid = ~np.isnan(xs) & ~np.isnan(ys)
+    if not valid.any():
+        msg = 'Cannot find fixation from empty data.'
+        raise CommonV1.InsufficientDataException(msg)
+    vx = xs[valid]
+    vy = ys[valid]
+    return {
+        'type': 'gazelib/gaze/fixation',
+        'centroid': [float(vx.mean()), float(vy.mean())],
+        'mean_squared_error': float(vx.var() + vy.var())
+    }
+
+
+def get_gaze(g):
+    '''
+    Read the gaze of both eyes and combine to a single gaze path.
+    Where only one eye is available, it is used alone.
+
+    Raise:
+        InsufficientDataException: if streams are missing or the eyes
+            are not on the same timeline.
+
+    Return:
+        tuple (xs, ys, times) of numpy arrays. Gaps are NaN.
+    '''
+    g.assert_has_streams(STREAM_NAMES)
+    tl_names = set(map(g.get_stream_timeline_name, STREAM_NAMES))
+    if len(tl_names) != 1:
+        msg = 'Eye streams must share a timeline.'
+        raise CommonV1.InsufficientDataException(msg)
+    times = np.asarray(g.get_timeline(tl_names.pop()), dtype=np.int64)
+
+    lx, ly, rx, ry = [np.array(g.get_stream_values(name), dtype=float)
+                      for name in STREAM_NAMES]
+    l_ok = ~np.isnan(lx) & ~np.isnan(ly)
+    r_ok = ~np.isnan(rx) & ~np.isnan(ry)
+    xs = mean_of_accepted(lx, l_ok, rx, r_ok, np.nan)
+    ys = mean_of_accepted(ly, l_ok, ry, r_ok, np.nan)
+    return xs, ys, times
+
+
+def runs_to_fixations(starts, ends, xs, ys, times, min_duration):
+    '''
+    Convert index runs to fixation dicts and drop too short ones.
+    The fixation ends at the time of the first sample after it,
+    or at the last sample if the run reaches the end.
+
+    Return:
+        list of dicts with keys 'start_index', 'end_index' (exclusive),
+        'start_time_relative', 'end_time_relative', and 'centroid'.
+    '''
+    n = len(times)
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    if n == 0 or len(starts) == 0:
+        return []
+    start_times = times[starts]
+    end_times = times[np.minimum(ends, n - 1)]
+    keep = (end_times - start_times) >= min_duration
+    starts, ends = starts[keep], ends[keep]
+    start_times, end_times = start_times[keep], end_times[keep]
+
+    # Centroids by cumulative sums. Runs contain no gaps.
+    cx = np.concatenate(([0.0], np.cumsum(np.nan_to_num(xs))))
+    cy = np.concatenate(([0.0], np.cumsum(np.nan_to_num(ys))))
+    counts = (ends - starts).astype(float)
+    mean_x = (cx[ends] - cx[starts]) / counts
+    mean_y = (cy[ends] - cy[starts]) / counts
+
+    fixations = []
+    for i in range(len(starts)):
+        fixations.append({
+            'start_index': int(starts[i]),
+            'end_index': int(ends[i]),
+            'start_time_relative': int(start_times[i]),
+            'end_time_relative': int(end_times[i]),
+            'centroid': [float(mean_x[i]), float(mean_y[i])]
+        })
+    return fixations
+
+
+def detect_ivt(xs, ys, times, max_velocity=1.0, min_duration=60000):
+    '''
+    Velocity threshold fixation identification (I-VT).
+
+    Parameters:
+        xs, ys: numpy arrays of relative coordinates. Gaps as NaN.
+        times: numpy array of sample times in microseconds.
+        max_velocity: in relative units per second. A sample is
+            fixational if gaze moved slower than this from the previous
+            sample. The first sample uses the velocity to the next one.
+            The default corresponds roughly to 40 degrees per second
+            on a typical display. Noisy data may need smoothing first.
+        min_duration: shortest accepted fixation in microseconds.
+
+    Return:
+        list of fixation dicts, see runs_to_fixations.
+    '''
+    n = len(times)
+    if n < 2:
+        return []
+    # Speed over each interval using the true time deltas.
+    dt = np.diff(times) / 1e6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.hypot(np.diff(xs), np.diff(ys)) / dt
+    # Per-sample speed: interval ending at the sample.
+    speed = np.concatenate((speed[:1], speed))
+    with np.errstate(invalid='ignore'):
+        fixational = speed < max_velocity  # NaN i.e. gaps are False
+    starts, ends = find_runs(fixational)
+    return runs_to_fixations(starts, ends, xs, ys, times, min_duration)
+
+
+class DispersionWindow(object):
+    '''
+    Window over coordinate sequences that knows its dispersion.
+    The window grows from the end and shrinks from the start. Running
+    minimum and maximum of x and y are maintained with monotonic deques
+    of indices, thus each operation is amortized O(1) instead of O(n)
+    needed to recompute the extrema.
+    '''
+
+    def __init__(self, xs, ys, start=0):
+        '''
+        Parameters:
+            xs, ys: sequences of coordinates without gaps.
+            start: index of the first sample of the initially empty window.
+        '''
+        # Lists index faster than numpy arrays one element at a time.
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self.reset(start)
+
+    def reset(self, start):
+        '''Empty the window and move it to start.'''
+        self.start = start
+        self.end = start  # exclusive
+        # Values at indices decrease in max deques and increase in min.
+        self.max_x = deque()
+        self.min_x = deque()
+        self.max_y = deque()
+        self.min_y = deque()
+
+    def __len__(self):
+        return self.end - self.start
+
+    def push(self):
+        '''Include the next sample after the window.'''
+        i = self.end
+        x = self.xs[i]
+        y = self.ys[i]
+        for dq, values, value, sign in ((self.max_x, self.xs, x, 1),
+                                        (self.min_x, self.xs, x, -1),
+                                        (self.max_y, self.ys, y, 1),
+                                        (self.min_y, self.ys, y, -1)):
+            # Drop indices that can never again be the extremum.
+            while dq and sign * values[dq[-1]] <= sign * value:
+                dq.pop()
+            dq.append(i)
+        self.end = i + 1
+
+    def pop(self):
+        '''Exclude the first sample of the window.'''
+        i = self.start
+        for dq in (self.max_x, self.min_x, self.max_y, self.min_y):
+            if dq and dq[0] == i:
+                dq.popleft()
+        self.start = i + 1
+
+    def extrema(self):
+        '''Return [min x, max x, min y, max y] of a non-empty window.'''
+        return [self.xs[self.min_x[0]], self.xs[self.max_x[0]],
+                self.ys[self.min_y[0]], self.ys[self.max_y[0]]]
+
+    def dispersion(self):
+        '''Return (max x - min x) + (max y - min y) of the window.'''
+        min_x, max_x, min_y, max_y = self.extrema()
+        return max_x - min_x + max_y - min_y
+
+
+def expand_window(xs, ys, end, limit, max_dispersion, extrema):
+    '''
+    Expand a window as long as its dispersion stays at most max_dispersion.
+    Samples are examined in chunks of growing size with running extrema,
+    thus the cost is linear in the length of the expansion.
+
+    Parameters:
+        xs, ys: numpy arrays of coordinates
+        end: exclusive end index of the current window
+        limit: exclusive index the window cannot grow over
+        max_dispersion: threshold
+        extrema: [min x, max x, min y, max y] of the current window
+
+    Return:
+        exclusive end index of the expanded window
+    '''
+    min_x, max_x, min_y, max_y = extrema
+    chunk = 16
+    while end < limit:
+        cx = xs[end:end + chunk]
+        cy = ys[end:end + chunk]
+        run_min_x = np.minimum(np.minimum.accumulate(cx), min_x)
+        run_max_x = np.maximum(np.maximum.accumulate(cx), max_x)
+        run_min_y = np.minimum(np.minimum.accumulate(cy), min_y)
+        run_max_y = np.maximum(np.maximum.accumulate(cy), max_y)
+        disp = run_max_x - run_min_x + run_max_y - run_min_y
+        exceeded = np.flatnonzero(disp > max_dispersion)
+        if len(exceeded) > 0:
+            return end + int(exceeded[0])
+        min_x, max_x = run_min_x[-1], run_max_x[-1]
+        min_y, max_y = run_min_y[-1], run_max_y[-1]
+        end += len(cx)
+        chunk *= 2
+    return limit
+
+
+def detect_idt(xs, ys, times, max_dispersion=0.05, min_duration=100000):
+    '''
+    Dispersion threshold fixation identification (I-DT).
+
+    A window covering min_duration is tested. If its dispersion is
+    at most max_dispersion, the window is expanded as long as dispersion
+    stays under the threshold and the window becomes a fixation.
+    Otherwise the window start moves to the next sample. The dispersion
+    of the sliding window is maintained by DispersionWindow, thus the
+    detector stays linear in the number of samples.
+
+    Parameters:
+        xs, ys: numpy arrays of relative coordinates. Gaps as NaN.
+        times: numpy array of sample times in microseconds.
+        max_dispersion: in relative units.
+        min_duration: shortest accepted fixation in microseconds.
+
+    Return:
+        list of fixation dicts, see runs_to_fixations.
+    '''
+    valid = ~np.isnan(xs) & ~np.isnan(ys)
+    starts = []
+    ends = []
+
+    # Sliding window. Each sample enters and leaves it at most once.
+    window = DispersionWindow(xs, ys)
+
+    # Process each gapless segment separately.
+    seg_starts, seg_ends = find_runs(valid)
+    for seg_start, seg_end in zip(seg_starts, seg_ends):
+        # First index whose time is min_duration after each start.
+        window_ends = np.searchsorted(times[:seg_end],
+                                      times[seg_start:seg_end] + min_duration,
+                                      side='left')
+        s = seg_start
+        window.reset(s)
+        while s < seg_end:
+            e = window_ends[s - seg_start] + 1  # exclusive
+            if e > seg_end:
+                break
+            # Window ends never decrease, thus only push and pop.
+            while window.end < e:
+                window.push()
+            while window.start < s:
+                window.pop()
+            if window.dispersion() > max_dispersion:
+                s += 1
+                continue
+            e = expand_window(xs, ys, e, seg_end, max_dispersion,
+                              window.extrema())
+            starts.append(s)
+            ends.append(e)
+            s = e
+            window.reset(s)
+
+    return runs_to_fixations(starts, ends, xs, ys, times, min_duration)
+
+
+@timed()
+def detect(g, method='ivt', add_events=True, **params):
+    '''
+    Detect fixations from the gaze of both eyes.
+
+    Parameters:
+        g: Gaze data as CommonV1 object. Events are added to it.
+        method: 'ivt' for velocity threshold (see detect_ivt) or
+            'idt' for dispersion threshold (see detect_idt).
+        add_events: if True, add each fixation as an event with tag
+            'gazelib/gaze/fixation' and its centroid as extra.
+        params: keyword parameters for the detector, e.g. max_velocity.
+
+    Require streams:
+        gazelib/gaze/left_eye_x_relative
+        gazelib/gaze/left_eye_y_relative
+        gazelib/gaze/right_eye_x_relative
+        gazelib/gaze/right_eye_y_relative
+
+    Raise:
+        InsufficientDataException: if streams are missing.
+        ValueError: if method is unknown.
+
+    Return:
+        list of fixation dicts, see runs_to_fixations.
+    '''
+    detectors = {
+        'ivt': detect_ivt,
+        'idt': detect_idt
+    }
+    if method not in detectors:
+        raise ValueError('Unknown fixation detection method: ' + str(method))
+
+    xs, ys, times = get_gaze(g)
+    fixations = detectors[method](xs, ys, times, **params)
+    count('samples', len(times))
+    count('fixations', len(fixations))
+
+    if add_events:
+        derived = 'gazelib.models.fixation.detect_' + method
+        for fx in fixations:
+            g.add_event(['gazelib/gaze/fixation'],
+                        fx['start_time_relative'], fx['end_time_relative'],
+                        derived=derived, extra={'centroid': fx['centroid']})
+    return fixations
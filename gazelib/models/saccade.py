@@ -3,56 +3,41 @@
 Find a linear saccade from the data.
 '''
 from gazelib.containers import CommonV1
-from gazelib.preprocessing import fill_gaps, ExtrapolationError
-import scipy.signal
-import saccademodel
+from gazelib.instrumentation import timed, count
+from gazelib.preprocessing import fill_gaps_array, ExtrapolationError
+from multiprocessing import Pool
+import numpy as np
+from . import saccade_search
+from . import cache as result_cache
 
 
-def fit(g):
-    '''
-    Parameter:
-        g: Gaze data as CommonV1 object
+STREAM_NAMES = [
+    'gazelib/gaze/left_eye_x_relative',
+    'gazelib/gaze/left_eye_y_relative',
+    'gazelib/gaze/right_eye_x_relative',
+    'gazelib/gaze/right_eye_y_relative'
+]
 
-    Require streams:
-        gazelib/gaze/left_eye_x_relative
-        gazelib/gaze/left_eye_y_relative
-        gazelib/gaze/right_eye_x_relative
-        gazelib/gaze/right_eye_y_relative
-
-    Raise:
-        InsufficientDataException: if streams are missing or they are empty.
-
-    Return::
+# Version of the fitting algorithm, part of the cache keys. Increment when
+# the results of fit_eyes change, to invalidate cached results.
+MODEL_VERSION = 1
 
-        {
-            'type': 'gazelib/gaze/saccade',
-            'start_time_relative': <int microseconds>
-            'end_time_relative': <int microseconds>
-            'mean_squared_error': <float>
-        }
 
+def preprocess(values):
     '''
-    g.assert_has_streams([
-        'gazelib/gaze/left_eye_x_relative',
-        'gazelib/gaze/left_eye_y_relative',
-        'gazelib/gaze/right_eye_x_relative',
-        'gazelib/gaze/right_eye_y_relative'
-    ])
-    # Timeline names
-    l_tl_name = g.get_stream_timeline_name('gazelib/gaze/left_eye_x_relative')
-    r_tl_name = g.get_stream_timeline_name('gazelib/gaze/right_eye_x_relative')
+    Forward fill gaps and median filter a stream.
 
-    lx = g.raw['streams']['gazelib/gaze/left_eye_x_relative']['values']
-    ly = g.raw['streams']['gazelib/gaze/left_eye_y_relative']['values']
-    rx = g.raw['streams']['gazelib/gaze/right_eye_x_relative']['values']
-    ry = g.raw['streams']['gazelib/gaze/right_eye_y_relative']['values']
+    Parameters:
+        values: a sequence of numbers and Nones
 
-    # Forward fill
+    Raise:
+        InsufficientDataException: if there are no valid values.
+
+    Return:
+        float numpy array
+    '''
     try:
-        lx_fill = fill_gaps(lx)
-        ly_fill = fill_gaps(ly)
-        rx_fill = fill_gaps(rx)
-        ry_fill = fill_gaps(ry)
+        filled = fill_gaps_array(values)
     except ExtrapolationError:
         # Only nones or empty
         msg = 'Cannot find saccade from empty data.'
@@ -60,22 +45,40 @@ def fit(g):
 
     # Median filter
     # Required to remove non-Gaussian noise i.e. random outliers
-    # Saccademodel handles Gaussian noise.
-    lx_filt = scipy.signal.medfilt(lx_fill, 5)
-    ly_filt = scipy.signal.medfilt(ly_fill, 5)
-    rx_filt = scipy.signal.medfilt(rx_fill, 5)
-    ry_filt = scipy.signal.medfilt(ry_fill, 5)
+    # The saccade model handles Gaussian noise.
+    # SciPy is imported on first use to keep 'import gazelib' fast.
+    import scipy.signal
+    return scipy.signal.medfilt(filled, 5)
+
+
+def fit_eyes(lx, ly, rx, ry):
+    '''
+    Fit saccade model to both eyes and pick the one with smallest error.
 
-    # Pointlists for saccademodel
-    lpl = [[x, y] for x, y in zip(lx_filt, ly_filt)]
-    rpl = [[x, y] for x, y in zip(rx_filt, ry_filt)]
+    Parameters:
+        lx, ly, rx, ry: sequences of coordinates. Nones are allowed.
+
+    Raise:
+        InsufficientDataException: if an eye has no valid data.
+
+    Return::
+
+        {
+            'eye': <'left' or 'right'>,
+            'start_index': <index of the saccade start on the eye timeline>,
+            'end_index': <index of the saccade end on the eye timeline>,
+            'mean_squared_error': <float>
+        }
+
+    '''
+    lx_filt, ly_filt, rx_filt, ry_filt = map(preprocess, [lx, ly, rx, ry])
 
     # Results
     try:
-        lresults = saccademodel.fit(lpl)
-        rresults = saccademodel.fit(rpl)
-    except saccademodel.interpolate.InterpolationError:
-        msg = 'Cannot find saccade from empty data.'
+        lresults = saccade_search.fit(lx_filt, ly_filt)
+        rresults = saccade_search.fit(rx_filt, ry_filt)
+    except saccade_search.SaccadeModelError:
+        msg = 'Cannot find saccade from too short data.'
         raise CommonV1.InsufficientDataException(msg)
 
     # Pick one with smallest error
@@ -83,20 +86,85 @@ def fit(g):
     rerr = rresults['mean_squared_error']
     if lerr < rerr:
         results = lresults
-        tl_name = l_tl_name
+        eye = 'left'
     else:
         results = rresults
-        tl_name = r_tl_name
+        eye = 'right'
 
-    # Convert measured saccade end and start to times.
-    lensource = len(results['source_points'])
-    lensaccade = len(results['saccade_points'])
+    # Convert measured saccade end and start to indices of the last
+    # source point and the last saccade point.
+    lensource = results['saccade_start_index']
+    lensaccade = results['saccade_end_index'] - lensource
 
     start_index = max(0, lensource - 1)  # do not let below zero
     end_index = max(0, lensource + lensaccade - 1)  # do not let above length
 
-    start = g.get_relative_time_by_index(tl_name, start_index)
-    end = g.get_relative_time_by_index(tl_name, end_index)
+    return {
+        'eye': eye,
+        'start_index': start_index,
+        'end_index': end_index,
+        'mean_squared_error': results['mean_squared_error']
+    }
+
+
+@timed()
+def fit(g, cache=None):
+    '''
+    Parameter:
+        g: Gaze data as CommonV1 object
+        cache: optional gazelib.models.cache.ResultCache. If given, the
+            result is read from the cache when the streams and their
+            timelines are unchanged, and stored there otherwise.
+
+    Require streams:
+        gazelib/gaze/left_eye_x_relative
+        gazelib/gaze/left_eye_y_relative
+        gazelib/gaze/right_eye_x_relative
+        gazelib/gaze/right_eye_y_relative
+
+    Raise:
+        InsufficientDataException: if streams are missing or they are empty.
+
+    Return::
+
+        {
+            'type': 'gazelib/gaze/saccade',
+            'start_time_relative': <int microseconds>
+            'end_time_relative': <int microseconds>
+            'mean_squared_error': <float>
+        }
+
+    '''
+    g.assert_has_streams(STREAM_NAMES)
+    if cache is not None:
+        key = result_cache.fingerprint(g, STREAM_NAMES,
+                                       'gazelib.models.saccade.fit',
+                                       MODEL_VERSION)
+        try:
+            result = cache[key]
+            count('cache_hits')
+            return result
+        except KeyError:
+            result = _fit(g)
+            cache[key] = result
+            return result
+    return _fit(g)
+
+
+def _fit(g):
+    '''Compute the result of fit without the cache.'''
+    # Timeline names
+    tl_names = {
+        'left': g.get_stream_timeline_name(STREAM_NAMES[0]),
+        'right': g.get_stream_timeline_name(STREAM_NAMES[2])
+    }
+
+    lx, ly, rx, ry = map(g.get_stream_values, STREAM_NAMES)
+    results = fit_eyes(lx, ly, rx, ry)
+
+    tl_name = tl_names[results['eye']]
+    start = g.get_relative_time_by_index(tl_name, results['start_index'])
+    end = g.get_relative_time_by_index(tl_name, results['end_index'])
 
     return {
         'type': 'gazelib/gaze/saccade',
@@ -104,3 +172,139 @@ def fit(g):
         'end_time_relative': end,
         'mean_squared_error': results['mean_squared_error']
     }
+
+
+def fit_eyes_or_none(eye_values):
+    '''
+    Like fit_eyes but takes the four sequences as one tuple and returns
+    None instead of raising on insufficient data. Used by the process pool
+    of fit_by_tag and therefore defined on module level.
+    '''
+    try:
+        return fit_eyes(*eye_values)
+    except CommonV1.InsufficientDataException:
+        return None
+
+
+@timed()
+def fit_by_tag(g, tag, processes=None, cache=None):
+    '''
+    Fit a saccade to each event with the given tag, for example to each
+    trial of a session. The streams are read and windowed once and the
+    fits are run in parallel in a process pool.
+
+    Parameters:
+        g: Gaze data as CommonV1 object
+        tag: event tag, e.g. 'icl/experiment/reaction/trial'
+        processes: number of worker processes. Defaults to the number of
+            CPUs. Give 1 to fit in the current process.
+        cache: optional gazelib.models.cache.ResultCache. Fits of events
+            with unchanged stream values are read from the cache and only
+            the rest are computed.
+
+    Require streams:
+        gazelib/gaze/left_eye_x_relative
+        gazelib/gaze/left_eye_y_relative
+        gazelib/gaze/right_eye_x_relative
+        gazelib/gaze/right_eye_y_relative
+
+    Raise:
+        InsufficientDataException: if streams are missing.
+
+    Return:
+        list of dicts, one for each event in event order, suitable for
+        gazelib.io.write_dictlist_as_csv::
+
+            {
+                'event_index': <int, order of the event among the tagged>,
+                'event_start_time_relative': <int microseconds>,
+                'event_end_time_relative': <int microseconds>,
+                'start_time_relative': <int microseconds or None>,
+                'end_time_relative': <int microseconds or None>,
+                'mean_squared_error': <float or None>
+            }
+
+        Saccade times and error are None if the event has no valid data.
+    '''
+    g.assert_has_streams(STREAM_NAMES)
+    events = list(g.iter_events_by_tag(tag))
+
+    # Timelines and stream values as contiguous arrays, read only once.
+    tl_names = {
+        'left': g.get_stream_timeline_name(STREAM_NAMES[0]),
+        'right': g.get_stream_timeline_name(STREAM_NAMES[2])
+    }
+    timelines = {}
+    for eye, tl_name in tl_names.items():
+        timelines[eye] = np.asarray(g.get_timeline(tl_name))
+    lx, ly, rx, ry = [np.array(g.get_stream_values(name), dtype=float)
+                      for name in STREAM_NAMES]
+
+    # Find event windows on both timelines with a single search each.
+    # Same as slice_by_relative_time: start inclusive, end exclusive.
+    starts = [ev['range'][0] for ev in events]
+    ends = [ev['range'][1] for ev in events]
+    windows = {}
+    for eye, tl in timelines.items():
+        windows[eye] = (np.searchsorted(tl, starts, side='left'),
+                        np.searchsorted(tl, ends, side='left'))
+
+    jobs = []
+    for i in range(len(events)):
+        l0, l1 = windows['left'][0][i], windows['left'][1][i]
+        r0, r1 = windows['right'][0][i], windows['right'][1][i]
+        jobs.append((lx[l0:l1], ly[l0:l1], rx[r0:r1], ry[r0:r1]))
+
+    # Fits are relative to the windows, thus the values suffice as keys.
+    fits = [None] * len(jobs)
+    todo = list(range(len(jobs)))
+    if cache is not None:
+        keys = [result_cache.fingerprint_arrays(
+                'gazelib.models.saccade.fit_eyes', MODEL_VERSION, None, job)
+                for job in jobs]
+        todo = []
+        for i, key in enumerate(keys):
+            try:
+                fits[i] = cache[key]
+            except KeyError:
+                todo.append(i)
+
+    todo_jobs = [jobs[i] for i in todo]
+    count('events', len(jobs))
+    count('cache_hits', len(jobs) - len(todo_jobs))
+    if processes == 1 or len(todo_jobs) < 2:
+        new_fits = list(map(fit_eyes_or_none, todo_jobs))
+    else:
+        pool = Pool(processes)
+        try:
+            new_fits = pool.map(fit_eyes_or_none, todo_jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    for i, result in zip(todo, new_fits):
+        fits[i] = result
+        if cache is not None:
+            cache[keys[i]] = result
+
+    table = []
+    for i, (ev, result) in enumerate(zip(events, fits)):
+        row = {
+            'event_index': i,
+            'event_start_time_relative': ev['range'][0],
+            'event_end_time_relative': ev['range'][1],
+            'start_time_relative': None,
+            'end_time_relative': None,
+            'mean_squared_error': None
+        }
+        if result is not None:
+            eye = result['eye']
+            tl = timelines[eye]
+            first = windows[eye][0][i]
+            row['start_time_relative'] = int(tl[first +
+                                                result['start_index']])
+            row['end_time_relative'] = int(tl[first + result['end_index']])
+            row['mean_squared_error'] = result['mean_squared_error']
+        table.append(row)
+
+    return table
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''
+Linear saccade model fitted by exhaustive search over the saccade start
+and end times.
+
+The model consists of three phases:
+  1) source phase, gaze is fixated onto a point
+  2) saccade phase, gaze moves steadily from the source point
+     onto the target point
+  3) target phase, gaze becomes fixated onto a point.
+
+This is the algorithm of the saccademodel package, reimplemented on
+NumPy arrays. Summed squared errors of all three phases are read from
+cumulative sums, thus the error of each candidate start or end time is
+computed in O(1) and one search over all candidates in O(n).
+
+Here we use two different concepts, times and indices:
+    Time t  0 1 2 3 4 5
+            | | | | | |
+    Vector [ 2 3 1 2 1 ]
+             | | | | |
+    Index i  0 1 2 3 4
+'''
+import numpy as np
+
+
+class SaccadeModelError(Exception):
+    '''Raised if the model cannot be fitted to the given points.'''
+    pass
+
+
+class PrefixSums(object):
+    '''
+    Cumulative sums that give summed squared errors of the model phases
+    for fixed source and target points. Arrays have length n + 1 so that
+    sum over times t1..t2 is s[t2] - s[t1].
+    '''
+
+    def __init__(self, points, src, tgt):
+        n = len(points)
+        # Source phase: squared distances to the source point.
+        p = points - src
+        ps = np.einsum('ij,ij->i', p, p)
+        self.source = np.concatenate(([0.0], np.cumsum(ps)))
+        # Target phase: squared distances to the target point.
+        pt = points - tgt
+        pts = np.einsum('ij,ij->i', pt, pt)
+        self.target = np.concatenate(([0.0], np.cumsum(pts)))
+        # Saccade phase: |p_i - alpha_i * d|^2 where d = tgt - src
+        # expands to |p_i|^2 - 2 alpha_i (p_i . d) + alpha_i^2 |d|^2.
+        d = tgt - src
+        q = p.dot(d)
+        self.dd = float(d.dot(d))
+        self.q = np.concatenate(([0.0], np.cumsum(q)))
+        self.iq = np.concatenate(([0.0], np.cumsum(np.arange(n) * q)))
+        self.n = n
+
+    def source_sse(self, t_start):
+        '''Summed squared error of source phase t=0..t_start'''
+        return self.source[t_start]
+
+    def target_sse(self, t_end):
+        '''Summed squared error of target phase t=t_end..n'''
+        return self.target[self.n] - self.target[t_end]
+
+    def saccade_sse(self, t_start, t_end):
+        '''
+        Summed squared error of saccade phase t=t_start..t_end.
+        Either of the times can be an array. The saccade point at index i
+        is the weighted mean of source and target with weight
+        alpha = (i + 0.5 - t_start) / (t_end - t_start).
+        '''
+        t_start = np.asarray(t_start)
+        t_end = np.asarray(t_end)
+        length = (t_end - t_start).astype(float)
+        sum_pp = self.source[t_end] - self.source[t_start]
+        sum_q = self.q[t_end] - self.q[t_start]
+        sum_iq = self.iq[t_end] - self.iq[t_start]
+        # sum of (i + 0.5 - t_start) * q_i
+        sum_kq = sum_iq + (0.5 - t_start) * sum_q
+        # sum of (k + 0.5)^2 for k = 0..length-1
+        sum_kk = length * (4 * length * length - 1) / 12.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sse = (sum_pp - 2.0 * sum_kq / length +
+                   self.dd * sum_kk / (length * length))
+        return np.where(length > 0, sse, 0.0)
+
+
+def mle(points, src, tgt, init_t_start, init_t_end):
+    '''
+    Find saccade start and end times that minimize the summed squared
+    error, given source and target points.
+
+    Return
+        tuple (t_start, t_end, mse)
+    '''
+    n = len(points)
+    sums = PrefixSums(points, src, tgt)
+
+    # Put limits to initial times and ensure order.
+    t_start = min(init_t_start, n)
+    t_end = min(init_t_end, n)
+    if t_end < t_start:
+        t_start, t_end = t_end, t_start
+
+    sum_sse = float('inf')
+    # Iterate until no change. Place iteration limits for bugs.
+    for _ in range(20):
+        # Optimal t_start given t_end. argmin picks the first minimum.
+        ts = np.arange(0, t_end + 1)
+        sse = sums.source_sse(ts) + sums.saccade_sse(ts, t_end)
+        t_start_hat = int(np.argmin(sse))
+        # Optimal t_end given t_start.
+        te = np.arange(t_start_hat, n + 1)
+        sse = sums.saccade_sse(t_start_hat, te) + sums.target_sse(te)
+        k = int(np.argmin(sse))
+        t_end_hat = t_start_hat + k
+        sum_sse = (sums.source_sse(t_start_hat) +
+                   sums.saccade_sse(t_start_hat, t_end_hat) +
+                   sums.target_sse(t_end_hat))
+        if t_start_hat == t_start and t_end_hat == t_end:
+            break
+        t_start = t_start_hat
+        t_end = t_end_hat
+
+    return t_start_hat, t_end_hat, float(sum_sse) / n
+
+
+def fit(xs, ys):
+    '''
+    Fit the saccade model to a gapless gaze path.
+
+    The fit alternates between estimating the saccade times (see mle)
+    and re-estimating source and target points as means of the up to 30
+    points before and after the saccade, in Expectation-Maximization
+    manner. Iteration stops when a pair of times repeats, and the pair
+    with smallest error is chosen.
+
+    Parameters:
+        xs: sequence of x coordinates without gaps
+        ys: sequence of y coordinates without gaps
+
+    Raise:
+        SaccadeModelError: if there are less than two points.
+
+    Return::
+
+        {
+            'saccade_start_index': <int, index of first saccade point>,
+            'saccade_end_index': <int, index of first target point>,
+            'mean_squared_error': <float>,
+            'converged': <bool>
+        }
+
+    Thus source points are [0, saccade_start_index) and saccade points
+    [saccade_start_index, saccade_end_index).
+    '''
+    points = np.column_stack((np.asarray(xs, dtype=float),
+                              np.asarray(ys, dtype=float)))
+    n = len(points)
+    if n < 2:
+        raise SaccadeModelError('At least two points are required.')
+
+    # Initialize
+    mu_s = points[0]
+    mu_t = points[-1]
+    t_start = min(n, 60)  # Average SRT is about 200 ms
+    t_end = min(n, 70)  # Average SD is about 30 ms
+
+    # To detect nonconvergent situations, memorize the visited pairs.
+    visited = set()
+    best = None  # (mse, t_start, t_end)
+
+    max_iters = 50
+    em_iters = 0
+    for _ in range(max_iters):
+        t_start, t_end, mse = mle(points, mu_s, mu_t, t_start, t_end)
+
+        # Limit times so that there is at least one point.
+        t_start_c = min(max(t_start, 1), n - 1)
+        t_end_c = min(max(t_end, 1), n - 1)
+        # Means based on windows before and after saccade
+        mu_s = points[max(0, t_start_c - 30):t_start_c].mean(axis=0)
+        mu_t = points[t_end_c:t_end_c + 30].mean(axis=0)
+
+        if (t_start, t_end) not in visited:
+            visited.add((t_start, t_end))
+            if best is None or mse < best[0]:
+                best = (mse, t_start, t_end)
+            em_iters += 1
+        else:
+            # Select the parameters that gave minimum error
+            mse, t_start, t_end = best
+            break
+
+    return {
+        'saccade_start_index': t_start,
+        'saccade_end_index': t_end,
+        'mean_squared_error': mse,
+        'converged': em_iters < max_iters
+    }
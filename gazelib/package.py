@@ -47,8 +47,8 @@ keywords = 'eye-tracking data'
 # your project is installed. For an analysis of "install_requires" vs pip's
 # requirements files see:
 # https://packaging.python.org/en/latest/requirements.html
-install_requires = ['deepdiff', 'jsonschema', 'saccademodel', 'fixationmodel',
-                    'bokeh', 'six', 'numpy', 'scipy']
+install_requires = ['deepdiff', 'jsonschema', 'bokeh', 'six', 'numpy',
+                    'scipy']
 
 # List additional groups of dependencies here (e.g. development
 # dependencies). You can install these using the following syntax,
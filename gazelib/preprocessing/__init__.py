@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import numpy as np
+from . import binocular, velocity  # noqa
 
 
 class ExtrapolationError(Exception):
@@ -49,3 +51,31 @@ def fill_gaps(l):
             nl.append(p)
 
     return nl
+
+
+def fill_gaps_array(values):
+    '''
+    Vectorized fill_gaps for numerical data. None and NaN values are
+    replaced by the last preceding valid value or, at the beginning,
+    by the first valid value.
+
+    Parameters:
+        values: a sequence of numbers and Nones
+
+    Throw
+        ExtrapolationError
+            if there are no valid values
+
+    Return
+        float numpy array without gaps
+    '''
+    arr = np.array(values, dtype=float)
+    valid = ~np.isnan(arr)
+    valid_indices = np.flatnonzero(valid)
+    if len(valid_indices) == 0:
+        msg = 'No non-null values to fill with.'
+        raise ExtrapolationError(msg)
+    fill_index = np.where(valid, np.arange(len(arr)), -1)
+    fill_index = np.maximum.accumulate(fill_index)
+    fill_index[fill_index < 0] = valid_indices[0]
+    return arr[fill_index]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+Combine the gaze of left and right eye into a single binocular gaze.
+'''
+import numpy as np
+from gazelib.containers import to_stream_values
+
+
+def combine_coordinates(rx, ry, rval, lx, ly, lval, accepted_validities):
+    '''
+    Array-based version of gazelib.legacy.igazelib.combine_coordinates.
+    Coordinates of an eye are used where the validity of the eye is
+    accepted. If both eyes are accepted, their mean is used.
+
+    Parameters:
+        rx, ry, rval: right eye x, y, and validity sequences.
+        lx, ly, lval: left eye x, y, and validity sequences.
+        accepted_validities: a list of validity codes regarded as valid.
+
+    Return:
+        tuple (x, y, val) of numpy arrays. Coordinates are -1 where
+        neither eye is accepted. Combined validity is the smaller of the
+        two, assumed to be better. Coordinates of eyes that are not
+        accepted are ignored and need not be numbers.
+    '''
+    rval = np.asarray(rval)
+    lval = np.asarray(lval)
+
+    r_ok = np.isin(rval, accepted_validities)
+    l_ok = np.isin(lval, accepted_validities)
+
+    rx = accepted_floats(rx, r_ok)
+    ry = accepted_floats(ry, r_ok)
+    lx = accepted_floats(lx, l_ok)
+    ly = accepted_floats(ly, l_ok)
+
+    x = mean_of_accepted(rx, r_ok, lx, l_ok, -1.0)
+    y = mean_of_accepted(ry, r_ok, ly, l_ok, -1.0)
+    val = np.minimum(rval.astype(int), lval.astype(int))
+    return x, y, val
+
+
+def accepted_floats(values, ok):
+    '''
+    Convert the values to a float numpy array. Values where ok is False
+    are not converted and become NaN.
+
+    Parameters:
+        values: a sequence
+        ok: boolean numpy array of the same length.
+
+    Raise:
+        ValueError: if an accepted value is not a number.
+    '''
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        # Rejected values may be e.g. empty strings or Nones.
+        arr = np.full(len(ok), np.nan)
+        arr[ok] = np.asarray(values, dtype=object)[ok].astype(float)
+        return arr
+
+
+def mean_of_accepted(a, a_ok, b, b_ok, missing):
+    '''
+    Elementwise mean of a and b where only accepted values are included.
+
+    Parameters:
+        a, b: float numpy arrays
+        a_ok, b_ok: boolean numpy arrays
+        missing: value to use where neither is accepted.
+
+    Return:
+        float numpy array
+    '''
+    count = a_ok.astype(float) + b_ok
+    total = np.where(a_ok, a, 0.0) + np.where(b_ok, b, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count > 0, total / count, missing)
+
+
+def derive_binocular_streams(common, min_confidence=0.8):
+    '''
+    Derive binocular gaze from the left and right eye streams of a
+    CommonV1 and add it as streams:
+
+        gazelib/gaze/binocular_x_relative
+        gazelib/gaze/binocular_y_relative
+
+    The streams are added to the timeline of the eye streams and are
+    marked as derived. Value is None where neither eye is accepted.
+    Confidence is the largest confidence of the accepted eyes.
+
+    Parameters:
+        common: CommonV1 object. Will be modified.
+        min_confidence: sample of an eye is accepted if its confidence is
+            at least this. Default 0.8 corresponds to Tobii validities
+            0 and 1. Samples with None values are never accepted.
+            Streams without confidence are regarded fully confident.
+
+    Require streams:
+        gazelib/gaze/left_eye_x_relative
+        gazelib/gaze/left_eye_y_relative
+        gazelib/gaze/right_eye_x_relative
+        gazelib/gaze/right_eye_y_relative
+
+    Raise:
+        InsufficientDataException: if streams are missing or they
+            are not on the same timeline.
+    '''
+    names = {
+        'lx': 'gazelib/gaze/left_eye_x_relative',
+        'ly': 'gazelib/gaze/left_eye_y_relative',
+        'rx': 'gazelib/gaze/right_eye_x_relative',
+        'ry': 'gazelib/gaze/right_eye_y_relative'
+    }
+    common.assert_has_streams(list(names.values()))
+
+    tl_names = set(map(common.get_stream_timeline_name, names.values()))
+    if len(tl_names) != 1:
+        msg = 'Eye streams must share a timeline.'
+        raise common.InsufficientDataException(msg)
+    tl_name = tl_names.pop()
+
+    def load(key):
+        '''Return values as float array with NaNs and confidence array.'''
+        stream = common.get_stream(names[key])
+        values = np.array(stream['values'], dtype=float)
+        if 'confidence' in stream:
+            conf = np.asarray(stream['confidence'], dtype=float)
+        else:
+            conf = np.ones(len(values))
+        return values, conf
+
+    lx, lxc = load('lx')
+    ly, lyc = load('ly')
+    rx, rxc = load('rx')
+    ry, ryc = load('ry')
+
+    # Accept an eye only if both coordinates are known and confident.
+    l_conf = np.minimum(lxc, lyc)
+    r_conf = np.minimum(rxc, ryc)
+    l_ok = (~np.isnan(lx) & ~np.isnan(ly) & (l_conf >= min_confidence))
+    r_ok = (~np.isnan(rx) & ~np.isnan(ry) & (r_conf >= min_confidence))
+
+    x = mean_of_accepted(rx, r_ok, lx, l_ok, np.nan)
+    y = mean_of_accepted(ry, r_ok, ly, l_ok, np.nan)
+    conf = np.maximum(np.where(l_ok, l_conf, 0.0),
+                      np.where(r_ok, r_conf, 0.0))
+
+    derived = 'gazelib.preprocessing.binocular.derive_binocular_streams'
+    common.add_stream('gazelib/gaze/binocular_x_relative', tl_name,
+                      to_stream_values(x), conf.tolist(), derived=derived)
+    common.add_stream('gazelib/gaze/binocular_y_relative', tl_name,
+                      to_stream_values(y), conf.tolist(), derived=derived)
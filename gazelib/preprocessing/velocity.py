@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''
+Derive gaze velocity and acceleration.
+
+Derivatives are estimated Savitzky-Golay style: a polynomial is fitted
+by least squares to a window of samples around each sample and the
+derivatives of the polynomial are used. The polynomials are fitted to
+the true sample times, thus irregular sampling and dropped samples do
+not bias the estimates.
+'''
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from gazelib.containers import to_stream_values
+
+
+def _windows(arr, window):
+    '''
+    Return a view of the 1-D array with consecutive windows as rows,
+    shape (n - window + 1, window). The view must not be written to.
+    Same as sliding_window_view of numpy 1.20, which is not available
+    for all supported Python versions.
+    '''
+    stride = arr.strides[0]
+    return as_strided(arr, shape=(len(arr) - window + 1, window),
+                      strides=(stride, stride))
+
+
+def savitzky_golay_derivatives(values, times, window=7, polyorder=2):
+    '''
+    Estimate first and second time derivatives of the values.
+
+    Parameters:
+        values: a sequence of numbers. None and NaN values are gaps.
+        times: a sequence of sample times in microseconds.
+        window: odd number of samples in each fitting window.
+        polyorder: order of the fitted polynomial, at least 2 and
+            smaller than window.
+
+    Return:
+        tuple (first, second) of float numpy arrays in units per second
+        and units per second squared. NaN where the window around the
+        sample contains a gap or exceeds the data.
+
+    Raise:
+        ValueError if window or polyorder is invalid.
+    '''
+    if window % 2 != 1 or window < 3:
+        raise ValueError('Window must be an odd integer larger than 2.')
+    if polyorder < 2 or polyorder >= window:
+        raise ValueError('Polyorder must be within [2, window).')
+
+    values = np.array(values, dtype=float)
+    times = np.asarray(times, dtype=float) / 1e6  # seconds
+    n = len(values)
+    first = np.full(n, np.nan)
+    second = np.full(n, np.nan)
+    if n < window:
+        return first, second
+
+    half = window // 2
+    # Windows as rows: shape (n - window + 1, window)
+    wv = _windows(values, window)
+    wt = _windows(times, window)
+    # Time offsets from the center sample, scaled to about [-1, 1]
+    # to keep the least squares problem well conditioned.
+    dt = wt - wt[:, half:half + 1]
+    scale = (wt[:, -1] - wt[:, 0]) / 2.0
+    scale[scale <= 0] = np.nan
+    u = dt / scale[:, np.newaxis]
+
+    # Design matrices: shape (m, window, polyorder + 1)
+    a = u[:, :, np.newaxis] ** np.arange(polyorder + 1)
+    ok = ~np.isnan(wv).any(axis=1) & ~np.isnan(scale)
+    ata = np.einsum('mwi,mwj->mij', a[ok], a[ok])
+    aty = np.einsum('mwi,mw->mi', a[ok], wv[ok])
+    coef = np.linalg.solve(ata, aty[:, :, np.newaxis])[:, :, 0]
+
+    # Derivatives of the polynomial at the center, u = 0.
+    s = scale[ok]
+    centers = np.arange(half, n - half)[ok]
+    first[centers] = coef[:, 1] / s
+    second[centers] = 2.0 * coef[:, 2] / (s * s)
+    return first, second
+
+
+def to_visual_angle(xs, ys, display_size, viewing_distance_mm):
+    '''
+    Convert relative screen coordinates to visual angles in degrees,
+    measured from the screen center.
+
+    Parameters:
+        xs, ys: sequences of relative coordinates. Nones are allowed.
+        display_size: value of the environment
+            gazelib/gaze/tracked_display_size
+        viewing_distance_mm: distance from the eyes to the screen.
+
+    Return:
+        tuple (x_deg, y_deg) of float numpy arrays. Gaps are NaN.
+    '''
+    width = float(display_size['physical_mm']['width'])
+    height = float(display_size['physical_mm']['height'])
+    x_mm = (np.array(xs, dtype=float) - 0.5) * width
+    y_mm = (np.array(ys, dtype=float) - 0.5) * height
+    x_deg = np.degrees(np.arctan2(x_mm, viewing_distance_mm))
+    y_deg = np.degrees(np.arctan2(y_mm, viewing_distance_mm))
+    return x_deg, y_deg
+
+
+def derive_velocity_streams(common, source='binocular', units='degrees',
+                            viewing_distance_mm=650.0, window=7,
+                            polyorder=2):
+    '''
+    Derive gaze speed and acceleration magnitude from gaze position
+    streams and add them as streams on the same timeline:
+
+        gazelib/gaze/<source>_velocity_<unit>_per_s
+        gazelib/gaze/<source>_acceleration_<unit>_per_s2
+
+    where <unit> is 'deg' or 'relative'. Values are None near gaps.
+
+    Parameters:
+        common: CommonV1 object. Will be modified.
+        source: 'left_eye', 'right_eye', or 'binocular'. Positions are read
+            from streams gazelib/gaze/<source>_x_relative and
+            gazelib/gaze/<source>_y_relative. See
+            binocular.derive_binocular_streams for binocular streams.
+        units: 'degrees' for visual angle or 'relative' for relative
+            screen units.
+        viewing_distance_mm: used for visual angle. Default is typical
+            for remote eye-trackers.
+        window: samples per Savitzky-Golay window, odd.
+        polyorder: order of the Savitzky-Golay polynomial.
+
+    Require environment if units is 'degrees':
+        gazelib/gaze/tracked_display_size
+
+    Raise:
+        InsufficientDataException: if streams or environment are missing.
+        ValueError: if units is unknown.
+    '''
+    x_name = 'gazelib/gaze/' + source + '_x_relative'
+    y_name = 'gazelib/gaze/' + source + '_y_relative'
+    common.assert_has_streams([x_name, y_name])
+    tl_name = common.get_stream_timeline_name(x_name)
+    if common.get_stream_timeline_name(y_name) != tl_name:
+        msg = 'X and Y streams must share a timeline.'
+        raise common.InsufficientDataException(msg)
+    times = common.get_timeline(tl_name)
+    xs = common.get_stream_values(x_name)
+    ys = common.get_stream_values(y_name)
+
+    if units == 'degrees':
+        env_name = 'gazelib/gaze/tracked_display_size'
+        common.assert_has_environments([env_name])
+        display_size = common.get_environment(env_name)
+        xs, ys = to_visual_angle(xs, ys, display_size, viewing_distance_mm)
+        unit_name = 'deg'
+    elif units == 'relative':
+        unit_name = 'relative'
+    else:
+        raise ValueError('Unknown units: ' + str(units))
+
+    vx, ax = savitzky_golay_derivatives(xs, times, window, polyorder)
+    vy, ay = savitzky_golay_derivatives(ys, times, window, polyorder)
+    speed = np.hypot(vx, vy)
+    acceleration = np.hypot(ax, ay)
+
+    prefix = 'gazelib/gaze/' + source
+    derived = 'gazelib.preprocessing.velocity.derive_velocity_streams'
+    common.add_stream(prefix + '_velocity_' + unit_name + '_per_s',
+                      tl_name, to_stream_values(speed), derived=derived)
+    common.add_stream(prefix + '_acceleration_' + unit_name + '_per_s2',
+                      tl_name, to_stream_values(acceleration),
+                      derived=derived)
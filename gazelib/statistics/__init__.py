@@ -3,3 +3,6 @@ Statistical tools and methods.
 '''
 from .utils import (arithmetic_mean, weighted_arithmetic_mean, deltas,  # noqa
                     maximum, minimum)
+from .grouping import (concatenate_by_group, group_segments,  # noqa
+                       group_values)
+from .validity import find_runs, validity_metrics  # noqa
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+Grouping tools for aggregating data over many trials or participants.
+Do not depend on CommonV1.
+'''
+import numpy as np
+from itertools import chain
+
+
+def concatenate_by_group(chunks, get_group):
+    '''
+    Group lists by a key and concatenate the lists of each group.
+
+    The chunks of a group are first collected and then concatenated once,
+    so the cost is linear in the total number of items regardless of
+    how many chunks a group has.
+
+    Parameters:
+        chunks: an iterable of lists
+        get_group: a function that returns the group of a chunk
+
+    Return:
+        dict from group to list. If a group has only one chunk,
+        the chunk itself is returned without copying.
+
+    Example::
+
+        >>> concatenate_by_group([[1, 2], [3], [4]], lambda c: c[0] % 2)
+        {1: [1, 2, 3], 0: [4]}
+
+    '''
+    chunks_by_group = {}
+    for chunk in chunks:
+        group = get_group(chunk)
+        if group in chunks_by_group:
+            chunks_by_group[group].append(chunk)
+        else:
+            chunks_by_group[group] = [chunk]
+
+    concatenated = {}
+    for group, group_chunks in chunks_by_group.items():
+        if len(group_chunks) == 1:
+            concatenated[group] = group_chunks[0]
+        else:
+            concatenated[group] = list(chain.from_iterable(group_chunks))
+    return concatenated
+
+
+def group_segments(keys):
+    '''
+    Vectorized group-by for columnar data.
+
+    Parameters:
+        keys: a sequence of comparable group keys, one per row.
+
+    Return:
+        tuple (unique_keys, order, boundaries) where
+            unique_keys: numpy array of sorted unique keys.
+            order: numpy array of row indices that sorts rows by key.
+                The sort is stable, thus rows of a group keep their
+                original order.
+            boundaries: numpy array of length len(unique_keys) + 1.
+                Rows of the i:th group are
+                order[boundaries[i]:boundaries[i + 1]].
+    '''
+    keys = np.asarray(keys)
+    n = len(keys)
+    if n == 0:
+        return keys, np.zeros(0, dtype=np.intp), np.zeros(1, dtype=np.intp)
+
+    order = np.argsort(keys, kind='mergesort')  # mergesort is stable
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    boundaries = np.concatenate(([0], starts, [n])).astype(np.intp)
+    unique_keys = sorted_keys[boundaries[:-1]]
+    return unique_keys, order, boundaries
+
+
+def group_values(keys, values):
+    '''
+    Group a column of values by a column of keys.
+
+    Parameters:
+        keys: a sequence of group keys, one per value.
+        values: a sequence of values with the same length as keys.
+
+    Return:
+        dict from key to numpy array of the values of the group
+        in their original order.
+    '''
+    values = np.asarray(values)
+    if len(values) != len(keys):
+        raise ValueError('Keys and values must have equal length.')
+    unique_keys, order, boundaries = group_segments(keys)
+    sorted_values = values[order]
+    groups = {}
+    for i, key in enumerate(unique_keys.tolist()):
+        groups[key] = sorted_values[boundaries[i]:boundaries[i + 1]]
+    return groups
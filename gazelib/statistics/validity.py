@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+'''
+Vectorized data quality metrics computed from validity codes.
+Do not depend on CommonV1.
+'''
+import numpy as np
+
+
+def find_runs(mask):
+    '''
+    Run-length encode the True values of a boolean sequence.
+
+    Parameters:
+        mask: a sequence of booleans
+
+    Return:
+        tuple (starts, ends) of integer numpy arrays. The i:th run covers
+        indices starts[i] inclusive to ends[i] exclusive.
+
+    Example::
+
+        >>> find_runs([True, True, False, True])
+        (array([0, 3]), array([2, 4]))
+
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    # Pad with False so that runs touching the ends produce edges.
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def validity_metrics(validities, times, accepted_validities, inside=None):
+    '''
+    Compute data quality metrics of a trial in one vectorized pass.
+    Gives equal results to the following functions of
+    gazelib.legacy.igazelib: valid_gaze_percentage,
+    longest_non_valid_streak, border_violation, and
+    interpolate_using_last_good_value.
+
+    Parameters:
+        validities: a sequence of validity codes, one per sample.
+        times: a sequence of sample times, same length as validities.
+        accepted_validities: a list of validity codes regarded as valid.
+        inside: optional sequence of booleans telling if the sample
+            is inside an AoI. Required for border violation.
+
+    Return::
+
+        {
+            'valid_fraction': <float, -1 if no samples>,
+            'longest_invalid_streak': <time units>,
+            'invalid_streaks': <int array (n_streaks, 2), start index
+                inclusive and end index exclusive of each invalid streak>,
+            'fill_index': <int array, index of the last valid sample at
+                or before each sample, or of the first valid sample if
+                none. None if there are no valid samples.>,
+            'border_violation': <bool, None if inside not given>
+        }
+
+    '''
+    validities = np.asarray(validities)
+    times = np.asarray(times, dtype=float)
+    n = len(validities)
+    if len(times) != n:
+        raise ValueError('Validities and times must have equal length.')
+
+    valid = np.isin(validities, accepted_validities)
+    invalid_starts, invalid_ends = find_runs(~valid)
+
+    # Valid fraction
+    if n == 0:
+        valid_fraction = -1
+    else:
+        valid_fraction = np.count_nonzero(valid) / float(n)
+
+    # Longest invalid streak. Streak is measured from its first sample
+    # to the first sample after it, or to its last sample at the end.
+    if len(invalid_starts) == 0:
+        longest = 0
+    else:
+        streak_ends = np.minimum(invalid_ends, n - 1)
+        streaks = times[streak_ends] - times[invalid_starts]
+        longest = max(0, float(streaks.max()))
+
+    # Index of last good value for interpolation.
+    valid_indices = np.flatnonzero(valid)
+    if len(valid_indices) == 0:
+        fill_index = None
+    else:
+        fill_index = np.where(valid, np.arange(n), -1)
+        fill_index = np.maximum.accumulate(fill_index)
+        fill_index[fill_index < 0] = valid_indices[0]
+
+    # Border violation: gaze returns from invalid period on the other
+    # side of AoI border than where it was when last valid. Like in the
+    # legacy implementation, the first sample does not count as last good
+    # and before any last good the gaze is assumed to be inside.
+    if inside is None:
+        violation = None
+    else:
+        inside = np.asarray(inside, dtype=bool)
+        if len(inside) != n:
+            raise ValueError('Inside and validities must have equal length.')
+        vi = valid_indices[valid_indices > 0]
+        last_good_inside = np.concatenate(([True], inside[vi[:-1]]))
+        returning = ~valid[vi - 1]
+        crossed = inside[vi] != last_good_inside[:len(vi)]
+        violation = bool(np.any(returning & crossed))
+
+    return {
+        'valid_fraction': valid_fraction,
+        'longest_invalid_streak': longest,
+        'invalid_streaks': np.column_stack((invalid_starts, invalid_ends)),
+        'fill_index': fill_index,
+        'border_violation': violation
+    }
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic gaze data of arbitrary size for testing and benchmarking.
+
+Gaze alternates between fixations of random duration and short linear
+saccades, with Gaussian measurement noise. Fixations are attracted to the
+AoI of the current stimulus. Blinks lose both eyes and short dropouts one
+eye. Validity codes follow Tobii: 0 is certain and 4 is lost. Samples
+belong to trials of the ICL reaction experiment, each consisting of the
+periods Wait, AG, FP, and Target, each period showing an image.
+
+Data is generated in chunks so that files larger than memory can be
+written::
+
+    write_experiment_config('config.json')
+    write_gazedata('big.gazedata', duration=8 * 3600)
+    c = gazelib.conversion.icl.cg.common.convert(
+        'big.gazedata', 'config.json', 0, 'SYNTHETIC', True)
+
+Equal parameters and seed always give equal data, regardless of the chunk
+size.
+'''
+import json
+import numpy as np
+from gazelib.containers import CommonV1, to_stream_values
+
+
+# ICL trial configuration. AoIs in the ICL format [x1, x2, y1, y2].
+DEFAULT_TRIAL_CONFIGURATION = {
+    'name': 'SYNTHETIC',
+    'images': ['background.png', 'attention-grabber.png', 'fixation.png',
+               'target.png'],
+    'aois': [
+        [0.0, 1.0, 0.0, 1.0],
+        [0.4, 0.6, 0.35, 0.65],
+        [0.45, 0.55, 0.45, 0.55],
+        [0.75, 0.95, 0.4, 0.6]
+    ]
+}
+
+# Periods of a trial in order:
+# (gazedata tag, event tag, min seconds, max seconds, image, aoi)
+PERIODS = [
+    ('Wait', 'icl/experiment/reaction/period/wait', 0.5, 0.5, 0, 0),
+    ('AG', 'icl/experiment/reaction/period/attention-grabber',
+     1.0, 2.0, 1, 1),
+    ('FP', 'icl/experiment/reaction/period/pretarget', 1.0, 1.0, 2, 2),
+    ('Target', 'icl/experiment/reaction/period/target', 1.0, 1.0, 3, 3)
+]
+
+# Confidence of Tobii validity codes, as in the ICL converters.
+VALIDITY_CONFIDENCE = np.array([1.0, 0.8, 0.5, 0.1, 0.0])
+
+GAZEDATA_COLUMNS = [
+    'XGazePosLeftEye', 'YGazePosLeftEye', 'LeftEyePupilDiameter',
+    'ValidityLeftEye', 'XGazePosRightEye', 'YGazePosRightEye',
+    'RightEyePupilDiameter', 'ValidityRightEye', 'TETTime', 'Tag',
+    'Trialnumber', 'UserDefined_1', 'Aoi'
+]
+
+
+class Schedule(object):
+    '''
+    Sequence of segments that start at sample indices, each with a
+    payload, extended lazily and pruned from the past as generation
+    proceeds.
+
+    Parameters:
+        draw: function (count, last) -> (lengths, payload) that draws count
+            new segments. last is a dict of the payload of the previous
+            segment or None. lengths is an integer array of segment
+            lengths in samples and payload a dict of arrays.
+    '''
+
+    def __init__(self, draw):
+        self.draw = draw
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.payload = None
+        self.end = 0  # end of the last segment
+
+    def extend(self, until, batch=64):
+        '''Draw segments until they cover sample indices [0, until).'''
+        while self.end < until:
+            last = None
+            if self.payload is not None:
+                last = {k: v[-1] for k, v in self.payload.items()}
+            lengths, payload = self.draw(batch, last)
+            lengths = np.maximum(np.asarray(lengths, dtype=np.int64), 1)
+            starts = self.end + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            self.starts = np.concatenate((self.starts, starts))
+            if self.payload is None:
+                self.payload = payload
+            else:
+                self.payload = {k: np.concatenate((v, payload[k]))
+                                for k, v in self.payload.items()}
+            self.end = int(starts[-1] + lengths[-1])
+
+    def lookup(self, indices):
+        '''Return positions of the segments that contain the indices.'''
+        return np.searchsorted(self.starts, indices, side='right') - 1
+
+    def prune(self, index, keep=1):
+        '''Forget segments ending before the index, except keep latest.'''
+        pos = max(0, int(self.lookup(index)) - keep)
+        if pos > 0:
+            self.starts = self.starts[pos:]
+            self.payload = {k: v[pos:] for k, v in self.payload.items()}
+
+
+class GazeGenerator(object):
+    '''
+    Generates binocular gaze samples chunk by chunk. See the module
+    docstring.
+
+    Parameters:
+        rate: sampling rate in Hz
+        seed: random seed
+        noise: standard deviation of measurement noise, relative units
+        fixation_duration: mean fixation duration in seconds
+        saccade_duration: saccade duration in seconds
+        aoi_attraction: probability that a fixation lands on the AoI of the
+            current period instead of a random point.
+        blink_interval: mean time between blinks in seconds
+        blink_duration: mean blink duration in seconds
+        dropout_interval: mean time between single eye dropouts in seconds
+        uncertain_rate: fraction of tracked samples with validity 1 or 2
+        trial_configuration: ICL trial configuration with 'images' and
+            'aois'. Must have at least as many as PERIODS refer to.
+    '''
+
+    def __init__(self, rate=300.0, seed=0, noise=0.005,
+                 fixation_duration=0.3, saccade_duration=0.03,
+                 aoi_attraction=0.6, blink_interval=4.0, blink_duration=0.15,
+                 dropout_interval=2.0, uncertain_rate=0.02,
+                 trial_configuration=DEFAULT_TRIAL_CONFIGURATION):
+        self.rate = float(rate)
+        self.noise = noise
+        self.uncertain_rate = uncertain_rate
+        self.saccade_len = max(1, int(round(saccade_duration * rate)))
+        self.index = 0  # next sample index
+
+        # Independent random streams for each quantity, so that the data
+        # does not depend on how it is divided into chunks.
+        def stream(k):
+            return np.random.RandomState([seed, k])
+        self.streams = {
+            'jitter': stream(0),
+            'gaze': stream(1),
+            'pupil': stream(2),
+            'validity': stream(3)
+        }
+
+        # AoI centers and half sizes of the periods.
+        aois = np.array([trial_configuration['aois'][p[5]]
+                         for p in PERIODS], dtype=float)
+        self.aoi_center = np.column_stack(((aois[:, 0] + aois[:, 1]) / 2,
+                                           (aois[:, 2] + aois[:, 3]) / 2))
+        self.aoi_half = np.column_stack(((aois[:, 1] - aois[:, 0]) / 2,
+                                         (aois[:, 3] - aois[:, 2]) / 2))
+
+        n_periods = len(PERIODS)
+        period_min = np.array([p[2] for p in PERIODS]) * rate
+        period_max = np.array([p[3] for p in PERIODS]) * rate
+        period_rs = stream(4)
+
+        def draw_periods(count, last):
+            if last is None:
+                kinds = np.arange(count) % n_periods
+                trial0 = 1
+            else:
+                kinds = (last['kind'] + 1 + np.arange(count)) % n_periods
+                trial0 = last['trial']
+                if kinds[0] == 0:
+                    trial0 += 1
+            # Trial increments at each Wait period after the first one.
+            new_trial = (kinds == 0).astype(int)
+            new_trial[0] = 0
+            trials = trial0 + np.cumsum(new_trial)
+            lengths = np.round(period_rs.uniform(period_min[kinds],
+                                                 period_max[kinds]))
+            return lengths, {'kind': kinds, 'trial': trials}
+
+        self.periods = Schedule(draw_periods)
+
+        mean_fix = max(1.0, fixation_duration * rate)
+        fixation_rs = stream(5)
+
+        def draw_fixations(count, last):
+            lengths = fixation_rs.geometric(1.0 / mean_fix, count)
+            # Targets are resolved when the periods are known. Here the
+            # random parts: whether on AoI, offset within the AoI in units
+            # of AoI half size, and a random point otherwise.
+            u = fixation_rs.uniform(size=(count, 5))
+            return lengths, {
+                'on_aoi': u[:, 0] < aoi_attraction,
+                'offset_x': 2 * u[:, 1] - 1,
+                'offset_y': 2 * u[:, 2] - 1,
+                'x': 0.05 + 0.9 * u[:, 3],
+                'y': 0.05 + 0.9 * u[:, 4],
+                'resolved': np.zeros(count, dtype=bool)
+            }
+
+        self.fixations = Schedule(draw_fixations)
+
+        def intervals(rs, mean_gap, mean_len, eyes):
+            def draw(count, last):
+                # Alternating tracked and lost segments.
+                gaps = rs.exponential(mean_gap * rate, count)
+                lens = rs.uniform(0.5, 1.5, count) * mean_len * rate
+                lengths = np.empty(2 * count)
+                lengths[0::2] = gaps
+                lengths[1::2] = lens
+                lost = np.tile([False, True], count)
+                eye = np.repeat(rs.randint(0, eyes, count), 2)
+                return np.round(lengths), {'lost': lost, 'eye': eye}
+            return draw
+
+        self.blinks = Schedule(intervals(stream(6), blink_interval,
+                                         blink_duration, 1))
+        self.dropouts = Schedule(intervals(stream(7), dropout_interval,
+                                           0.03, 2))
+
+    def _resolve_targets(self):
+        '''Place fixations that landed on AoIs onto the AoI of the period.'''
+        fx = self.fixations.payload
+        todo = np.flatnonzero(~fx['resolved'])
+        if len(todo) == 0:
+            return
+        onsets = self.fixations.starts[todo]
+        self.periods.extend(int(onsets.max()) + 1)
+        kinds = self.periods.payload['kind'][self.periods.lookup(onsets)]
+        on_aoi = todo[fx['on_aoi'][todo]]
+        kinds = kinds[fx['on_aoi'][todo]]
+        fx['x'][on_aoi] = (self.aoi_center[kinds, 0] +
+                           fx['offset_x'][on_aoi] * self.aoi_half[kinds, 0])
+        fx['y'][on_aoi] = (self.aoi_center[kinds, 1] +
+                           fx['offset_y'][on_aoi] * self.aoi_half[kinds, 1])
+        fx['resolved'][todo] = True
+
+    def _lost_mask(self, schedule, idx, eye=None):
+        '''Boolean mask of samples in lost segments of the schedule.'''
+        pos = schedule.lookup(idx)
+        mask = schedule.payload['lost'][pos]
+        if eye is not None:
+            mask = mask & (schedule.payload['eye'][pos] == eye)
+        return mask
+
+    def get_trials_end(self, trials):
+        '''
+        Return the sample index at which the given number of trials ends.
+        Call before generating any samples.
+
+        Raise:
+            ValueError: if samples have been generated already.
+        '''
+        if self.index > 0:
+            raise ValueError('Trials end must be found before generation.')
+        # Each trial consists of all the periods in order.
+        segments = trials * len(PERIODS)
+        while len(self.periods.starts) <= segments:
+            self.periods.extend(self.periods.end + 1)
+        return int(self.periods.starts[segments])
+
+    def next_chunk(self, n):
+        '''
+        Generate the next n samples.
+
+        Return dict of numpy arrays, each of length n::
+
+            {
+                'index': <sample index from the start>,
+                'time': <int64 microseconds from the first sample>,
+                'left_x', 'left_y', 'right_x', 'right_y':
+                    <relative coordinates, NaN if lost>,
+                'left_pupil', 'right_pupil': <mm, NaN if lost>,
+                'left_validity', 'right_validity': <Tobii codes 0..4>,
+                'period': <index to PERIODS>,
+                'trial': <trial number from 1>,
+                'image': <image index of the trial configuration>,
+                'aoi': <AoI index of the trial configuration>
+            }
+
+        '''
+        rs = self.streams
+        k0 = self.index
+        k1 = k0 + n
+        idx = np.arange(k0, k1, dtype=np.int64)
+        self.index = k1
+
+        # Extend schedules to cover the chunk.
+        for schedule in [self.periods, self.fixations, self.blinks,
+                         self.dropouts]:
+            schedule.extend(k1)
+        self._resolve_targets()
+
+        # Times with jitter that keeps the order.
+        interval = 1e6 / self.rate
+        jitter = rs['jitter'].uniform(-0.05, 0.05, n) * interval
+        jitter[idx == 0] = 0.0
+        times = np.round(idx * interval + jitter).astype(np.int64)
+
+        # Gaze path: fixations and linear saccades between them.
+        fx = self.fixations
+        pos = fx.lookup(idx)
+        target = np.column_stack((fx.payload['x'][pos], fx.payload['y'][pos]))
+        since = idx - fx.starts[pos]
+        moving = (since < self.saccade_len) & (pos > 0)
+        alpha = (since[moving] + 1.0) / (self.saccade_len + 1.0)
+        prev = pos[moving] - 1
+        prev_target = np.column_stack((fx.payload['x'][prev],
+                                       fx.payload['y'][prev]))
+        path = target.copy()
+        path[moving] = (prev_target +
+                        alpha[:, np.newaxis] * (target[moving] - prev_target))
+
+        noise = rs['gaze'].normal(0, self.noise, (n, 4))
+        left = path + noise[:, 0:2]
+        right = path + noise[:, 2:4]
+        # Pupils drift slowly.
+        drift = 0.3 * np.sin(2 * np.pi * idx / (20.0 * self.rate))
+        pupil_noise = rs['pupil'].normal(0, 0.03, (n, 2))
+        left_pupil = 4.0 + drift + pupil_noise[:, 0]
+        right_pupil = 4.0 + drift + pupil_noise[:, 1]
+
+        # Validity codes
+        blink = self._lost_mask(self.blinks, idx)
+        lost = [blink | self._lost_mask(self.dropouts, idx, eye)
+                for eye in [0, 1]]
+        # Uncertain samples get validity 1 or 2 with equal probability.
+        u = rs['validity'].uniform(size=(n, 2))
+        rate = self.uncertain_rate
+        codes = np.where(u < rate, np.where(u < rate / 2, 2, 1), 0)
+        validities = []
+        for eye, eye_lost in enumerate(lost):
+            v = codes[:, eye]
+            v[eye_lost] = 4
+            validities.append(v)
+        for arr, eye_lost in [(left, lost[0]), (right, lost[1])]:
+            arr[eye_lost] = np.nan
+        left_pupil[lost[0]] = np.nan
+        right_pupil[lost[1]] = np.nan
+
+        ppos = self.periods.lookup(idx)
+        kinds = self.periods.payload['kind'][ppos]
+        trials = self.periods.payload['trial'][ppos]
+        images = np.array([p[4] for p in PERIODS])[kinds]
+        aois = np.array([p[5] for p in PERIODS])[kinds]
+
+        # Only the latest segments are needed from now on.
+        self.fixations.prune(k1, keep=1)
+        for schedule in [self.periods, self.blinks, self.dropouts]:
+            schedule.prune(k1, keep=0)
+
+        return {
+            'index': idx,
+            'time': times,
+            'left_x': left[:, 0],
+            'left_y': left[:, 1],
+            'right_x': right[:, 0],
+            'right_y': right[:, 1],
+            'left_pupil': left_pupil,
+            'right_pupil': right_pupil,
+            'left_validity': validities[0],
+            'right_validity': validities[1],
+            'period': kinds,
+            'trial': trials,
+            'image': images,
+            'aoi': aois
+        }
+
+
+def iter_chunks(duration, rate=300.0, chunk_size=65536, trials=None,
+                **options):
+    '''
+    Yield chunks of GazeGenerator.next_chunk until duration is covered or
+    the given number of trials is complete, whichever comes first.
+
+    Parameters:
+        duration: seconds or None to be limited by trials only.
+        rate: sampling rate in Hz
+        chunk_size: samples per chunk
+        trials: optional number of trials
+        options: see GazeGenerator
+
+    Raise:
+        ValueError: if neither duration nor trials is given.
+    '''
+    if duration is None and trials is None:
+        raise ValueError('Duration or number of trials must be given.')
+    gen = GazeGenerator(rate=rate, **options)
+    if duration is None:
+        n = gen.get_trials_end(trials)
+    else:
+        n = int(round(duration * rate))
+        if trials is not None:
+            n = min(n, gen.get_trials_end(trials))
+    while gen.index < n:
+        yield gen.next_chunk(min(chunk_size, n - gen.index))
+
+
+def write_experiment_config(filepath,
+                            trial_configuration=DEFAULT_TRIAL_CONFIGURATION):
+    '''
+    Write an ICL experiment configuration that contains the trial
+    configuration of the synthetic data, for the ICL converters.
+    '''
+    with open(filepath, 'w') as f:
+        json.dump([trial_configuration], f, indent=4, sort_keys=True)
+
+
+def format_gazedata_rows(chunk, tet_start=0):
+    '''
+    Format a chunk as tab-separated gazedata rows.
+
+    Return:
+        string with a line per sample
+    '''
+    def coords(key):
+        # Tobii writes -1 for lost values.
+        arr = chunk[key]
+        return np.where(np.isnan(arr), -1.0, arr).tolist()
+
+    columns = [
+        coords('left_x'), coords('left_y'), coords('left_pupil'),
+        chunk['left_validity'].tolist(),
+        coords('right_x'), coords('right_y'), coords('right_pupil'),
+        chunk['right_validity'].tolist(),
+        (chunk['time'] + tet_start).tolist(),
+        [PERIODS[k][0] for k in chunk['period']],
+        chunk['trial'].tolist(), chunk['image'].tolist(),
+        chunk['aoi'].tolist()
+    ]
+    fmt = '\t'.join(['%.6f'] * 3 + ['%d'] + ['%.6f'] * 3 +
+                    ['%d', '%d', '%s', '%d', '%d', '%d']) + '\n'
+    return ''.join([fmt % row for row in zip(*columns)])
+
+
+def write_gazedata(filepath, duration, rate=300.0, chunk_size=65536,
+                   tet_start=1436858111502548, **options):
+    '''
+    Stream synthetic data into a tab-separated Tobii gazedata file of the
+    ICL experiments. Memory use depends on chunk_size, not on duration.
+    See write_experiment_config for a configuration to convert the file.
+
+    Parameters:
+        filepath: target path
+        duration: seconds or None, see iter_chunks
+        rate: sampling rate in Hz
+        chunk_size: samples generated and written at once
+        tet_start: TETTime of the first sample in microseconds
+        options: see iter_chunks and GazeGenerator, e.g. trials
+
+    Return:
+        number of samples written
+    '''
+    n = 0
+    with open(filepath, 'w') as f:
+        f.write('\t'.join(GAZEDATA_COLUMNS) + '\n')
+        for chunk in iter_chunks(duration, rate, chunk_size, **options):
+            f.write(format_gazedata_rows(chunk, tet_start))
+            n += len(chunk['index'])
+    return n
+
+
+def generate_common(duration, rate=300.0, chunk_size=65536, **options):
+    '''
+    Generate a CommonV1 like the ICL converters produce: eye streams with
+    confidences, and events for the periods, the trials, and the image
+    stimuli with their AoI rectangles. The timeline is stored as a
+    RegularTimeline, like the converters do with regular_timeline=True.
+
+    Parameters:
+        duration: seconds or None, see iter_chunks
+        rate: sampling rate in Hz
+        chunk_size: samples generated at once
+        options: see iter_chunks and GazeGenerator, e.g. trials
+
+    Return:
+        CommonV1 object
+    '''
+    trial_configuration = options.get('trial_configuration',
+                                      DEFAULT_TRIAL_CONFIGURATION)
+    chunks = list(iter_chunks(duration, rate, chunk_size, **options))
+    data = {}
+    for key in ['time', 'left_x', 'left_y', 'right_x', 'right_y',
+                'left_pupil', 'right_pupil', 'left_validity',
+                'right_validity', 'period', 'trial', 'image', 'aoi']:
+        data[key] = np.concatenate([ch[key] for ch in chunks])
+
+    c = CommonV1()
+    c.add_environment('gazelib/gaze/eyetracker/manufacturer', 'Synthetic')
+    c.add_environment('gazelib/gaze/tracked_display_size', {
+        'physical_mm': {'width': 510.0, 'height': 288.0},
+        'resolution_px': {'width': 1024, 'height': 768}
+    })
+    times = data['time'].tolist()
+    c.add_timeline('eyetracker', times, regular=True)
+    for eye in ['left', 'right']:
+        conf = VALIDITY_CONFIDENCE[data[eye + '_validity']].tolist()
+        prefix = 'gazelib/gaze/' + eye + '_eye_'
+        c.add_stream(prefix + 'x_relative', 'eyetracker',
+                     to_stream_values(data[eye + '_x']), conf)
+        c.add_stream(prefix + 'y_relative', 'eyetracker',
+                     to_stream_values(data[eye + '_y']), conf)
+        c.add_stream(prefix + 'pupil_mm', 'eyetracker',
+                     to_stream_values(data[eye + '_pupil']), conf)
+
+    if len(times) == 0:
+        return c
+
+    # Like the converters, a range ends where the next one starts and
+    # the last one mean sample interval after the last sample.
+    if len(times) > 1:
+        interval = (times[-1] - times[0]) / float(len(times) - 1)
+    else:
+        interval = 1e6 / rate
+    end_time = times[-1] + int(round(interval))
+
+    def iter_ranges(key):
+        values = data[key]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1))
+        for i, s in enumerate(starts):
+            e = times[starts[i + 1]] if i + 1 < len(starts) else end_time
+            yield s, times[s], e
+
+    # Periods change whenever the period or the trial changes.
+    data['period_in_trial'] = data['trial'] * len(PERIODS) + data['period']
+    for s, t0, t1 in iter_ranges('period_in_trial'):
+        c.add_event([PERIODS[data['period'][s]][1]], t0, t1)
+    for s, t0, t1 in iter_ranges('trial'):
+        extra = {'icl/experiment/reaction/trial/sequence_number':
+                 int(data['trial'][s])}
+        c.add_event(['icl/experiment/reaction/trial'], t0, t1, extra=extra)
+    data['stimulus'] = data['image'] * 1000 + data['aoi']
+    for s, t0, t1 in iter_ranges('stimulus'):
+        image = int(data['image'][s])
+        aoi = trial_configuration['aois'][int(data['aoi'][s])]
+        extra = {
+            'original_area_of_interest_index': int(data['aoi'][s]),
+            'original_image_index': image,
+            'icl/stimulus/image/filename':
+                trial_configuration['images'][image],
+            # gazelib/geom/rectangle
+            'icl/stimulus/image/rectangle': [aoi[0], aoi[2], aoi[1], aoi[3]]
+        }
+        c.add_event(['icl/stimulus', 'icl/stimulus/image'], t0, t1,
+                    extra=extra)
+    return c
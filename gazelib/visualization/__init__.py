@@ -2,4 +2,4 @@
 Visualization tools for gazelib/common/v1 and possibly other containers in
 the future.
 '''
-from . import common, utils  # noqa
+from . import common, heatmap, utils  # noqa
@@ -1,32 +1,72 @@
 # -*- coding: utf-8 -*-
-import bokeh.plotting as plotting
+'''
+Bokeh, Jinja2, and YAML are imported on first use within the functions,
+so that importing gazelib.visualization stays fast in worker processes.
+'''
 from . import utils
 import gazelib.preprocessing as gpre
-
-# For printing environments
-import yaml
-
-# Custom HTML templates are required by custom HTML such as tables.
-# The following setup is needed for custom HTML with bokeh.
-# See http://bokeh.pydata.org/en/0.10.0/docs/user_guide/embed.html
-# See http://bokeh.pydata.org/en/latest/docs/reference/embed.html
-# For FileSystemLoader, see https://gist.github.com/wrunk/1317933
-from bokeh.resources import CDN
-from bokeh.embed import file_html
-from jinja2 import Environment, FileSystemLoader
-from jinja2.exceptions import TemplateNotFound
+from gazelib.statistics.validity import find_runs
+import numpy as np
+from multiprocessing import Pool
 import os
 
 
-def render_path(common, output_html_filepath, title='Path'):
+PATH_STREAM_NAMES = [
+    'gazelib/gaze/left_eye_x_relative',
+    'gazelib/gaze/left_eye_y_relative',
+    'gazelib/gaze/right_eye_x_relative',
+    'gazelib/gaze/right_eye_y_relative'
+]
+
+
+# Templates are loaded once per process and shared by all the pages.
+_jinja2env = None
+
+
+def get_template(template_name):
     '''
-    Create a HTML-based visualization of the gaze path.
+    Load a Jinja2 template from the templates directory.
+
+    Raise:
+        TemplateNotFound: if no such template.
+    '''
+    # Custom HTML templates are required by custom HTML such as tables.
+    # The following setup is needed for custom HTML with bokeh.
+    # See http://bokeh.pydata.org/en/0.10.0/docs/user_guide/embed.html
+    # See http://bokeh.pydata.org/en/latest/docs/reference/embed.html
+    # For FileSystemLoader, see https://gist.github.com/wrunk/1317933
+    from jinja2 import Environment, FileSystemLoader
+    from jinja2.exceptions import TemplateNotFound
+    global _jinja2env
+    this_dir = os.path.dirname(os.path.abspath(__file__))
+    template_dir = os.path.join(this_dir, 'templates')
+    if _jinja2env is None:
+        jinja2loader = FileSystemLoader(template_dir)
+        _jinja2env = Environment(loader=jinja2loader)
+    try:
+        return _jinja2env.get_template(template_name)
+    except TemplateNotFound as ex:
+        print('Tried template dir: ' + template_dir)
+        raise ex
+
+
+def create_path_figure(lxs, lys, rxs, rys, title='Path', max_points=None):
     '''
-    lxs = common.get_stream_values('gazelib/gaze/left_eye_x_relative')
-    lys = common.get_stream_values('gazelib/gaze/left_eye_y_relative')
-    rxs = common.get_stream_values('gazelib/gaze/right_eye_x_relative')
-    rys = common.get_stream_values('gazelib/gaze/right_eye_y_relative')
+    Create a Bokeh figure of the gaze path of both eyes.
+
+    Each eye is drawn with one line broken at gaps and one scatter of
+    crosses, both reading the same ColumnDataSource. Thus the number of
+    glyphs does not depend on the number of gaps.
 
+    Parameters:
+        lxs, lys, rxs, rys: sequences of left and right eye coordinates.
+            Nones are gaps.
+        title: figure title as string
+        max_points: plot about this many points per eye by keeping every
+            n:th sample. Gaps stay in place. None to plot all the points.
+    '''
+    import bokeh.plotting as plotting
+    from bokeh.models import ColumnDataSource
     p = plotting.figure(title=title, x_axis_label='X', y_axis_label='Y',
                         plot_width=640, plot_height=480,
                         x_range=(-0.2, 1.2), y_range=(-0.2, 1.2))
@@ -35,61 +75,191 @@ def render_path(common, output_html_filepath, title='Path'):
     p.quad(left=[0.0], right=[1.0], top=[0.0], bottom=[1.0],
            line_width=1, line_color='black', fill_alpha=0)
 
-    # Visualize only valid points.
-    # We do that by visualizing valid subpaths
-
-    def validator(x):
-        return x[0] is not None and x[1] is not None
+    # Blue as Left, Red as Right
+    for xs, ys, color in [(lxs, lys, 'blue'), (rxs, rys, 'red')]:
+        xs, ys = utils.get_path_arrays(xs, ys, max_points)
+        source = ColumnDataSource(data={'x': xs, 'y': ys})
+        # Bokeh breaks lines at NaNs and skips them in scatters.
+        p.scatter('x', 'y', source=source, marker='cross', size=10,
+                  line_color=color)
+        p.line('x', 'y', source=source, line_width=1, line_color=color)
 
-    lpaths = utils.get_valid_sublists(zip(lxs, lys), validator)
-    rpaths = utils.get_valid_sublists(zip(rxs, rys), validator)
+        # Display start point.
+        valid = np.flatnonzero(~np.isnan(xs))
+        if len(valid) > 0:
+            first = valid[0]
+            # Width and height in x_axis and y_axis units.
+            p.oval(x=xs[first], y=ys[first], width=0.17, height=0.2,
+                   line_color=color, fill_alpha=0)
 
-    for valid_path in lpaths:
-        valid_xs = list(map(lambda x: x[0], valid_path))
-        valid_ys = list(map(lambda x: x[1], valid_path))
+    return p
 
-        p.cross(valid_xs, valid_ys, size=10, line_color='blue')
-        p.line(valid_xs, valid_ys, line_width=1, line_color='blue')
 
-    for valid_path in rpaths:
-        valid_xs = list(map(lambda x: x[0], valid_path))
-        valid_ys = list(map(lambda x: x[1], valid_path))
-
-        p.cross(valid_xs, valid_ys, size=10, line_color='red')
-        p.line(valid_xs, valid_ys, line_width=1, line_color='red')
-        # Red as Right
+def render_path(common, output_html_filepath, title='Path',
+                max_points=None):
+    '''
+    Create a HTML-based visualization of the gaze path.
+    See create_path_figure.
 
-    # Display start points.
-    lfirst = lpaths[0][0]
-    rfirst = rpaths[0][0]
-    # Width and height in x_axis and y_axis units.
-    p.oval(x=lfirst[0], y=lfirst[1], width=0.17, height=0.2,
-           line_color='blue', fill_alpha=0)
-    p.oval(x=rfirst[0], y=rfirst[1], width=0.17, height=0.2,
-           line_color='red', fill_alpha=0)
+    Parameters:
+        common: A CommonV1 object
+        output_html_filepath: a filepath as string
+        title: HTML page title as string
+        max_points: plot about this many points per eye or None for all.
+    '''
+    import bokeh.plotting as plotting
+    lxs, lys, rxs, rys = map(common.get_stream_values, PATH_STREAM_NAMES)
+    p = create_path_figure(lxs, lys, rxs, rys, title, max_points)
 
     plotting.output_file(output_html_filepath, title)
     plotting.save(p)
 
 
-def render_path_for_each_event(common, event_tag, output_html_filepath):
-    pass
+def render_event_page(job):
+    '''
+    Render and write the path page of a single event. Used by the process
+    pool of render_path_for_each_event and therefore defined on module
+    level.
+
+    Parameters:
+        job: dict with keys 'eyes', 'filepath', 'title', 'max_points', and
+            'links' where eyes is a tuple of the four coordinate arrays and
+            links a dict of hrefs to the index and neighbour pages.
+    '''
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+    lxs, lys, rxs, rys = job['eyes']
+    fig = create_path_figure(lxs, lys, rxs, rys, job['title'],
+                             job['max_points'])
+    html = file_html(fig, CDN, title=job['title'],
+                     template=get_template('event_path.html'),
+                     template_variables={'links': job['links']})
+    with open(job['filepath'], 'w') as f:
+        f.write(html)
+
+
+def render_path_for_each_event(common, event_tag, output_html_filepath,
+                               max_points=2000, processes=None):
+    '''
+    Render the gaze path of each event with the given tag, for example of
+    each trial, onto its own HTML page, and an index page that links to
+    them. Handy for reviewing the quality of a whole study.
+
+    The eye streams are read once and windowed by the event ranges. The
+    pages are rendered in parallel in a process pool. Pages link to Bokeh
+    resources in CDN instead of inlining them, so they stay small.
+
+    Parameters:
+        common: A CommonV1 object
+        event_tag: e.g. 'icl/experiment/reaction/trial'
+        output_html_filepath: filepath of the index page. Event pages are
+            written into the same directory, named after the index page
+            and the event order, e.g. index-003.html
+        max_points: plot about this many points per eye or None for all.
+        processes: number of worker processes. Defaults to the number of
+            CPUs. Give 1 to render in the current process.
+
+    Raise:
+        InsufficientDataException: if eye streams are missing.
+
+    Return:
+        list of filepaths of the event pages in event order.
+    '''
+    common.assert_has_streams(PATH_STREAM_NAMES)
+    events = list(common.iter_events_by_tag(event_tag))
+
+    # Windows of the events on each stream timeline. Same as
+    # slice_by_relative_time: start inclusive, end exclusive.
+    starts = [ev['range'][0] for ev in events]
+    ends = [ev['range'][1] for ev in events]
+    streams = []
+    for name in PATH_STREAM_NAMES:
+        tl = np.asarray(common.get_timeline(
+            common.get_stream_timeline_name(name)))
+        values = common.get_stream_values(name)
+        streams.append((values,
+                        np.searchsorted(tl, starts, side='left'),
+                        np.searchsorted(tl, ends, side='left')))
+
+    root, ext = os.path.splitext(output_html_filepath)
+    digits = len(str(max(len(events) - 1, 0)))
+    filepaths = [root + '-' + str(i).zfill(digits) + ext
+                 for i in range(len(events))]
+    # Links are relative so the directory can be moved as a whole.
+    hrefs = [os.path.basename(fp) for fp in filepaths]
+    index_href = os.path.basename(output_html_filepath)
+
+    jobs = []
+    rows = []
+    for i, ev in enumerate(events):
+        eyes = tuple(values[i0[i]:i1[i]] for values, i0, i1 in streams)
+        title = event_tag + ' ' + str(i)
+        links = {
+            'index': index_href,
+            'previous': hrefs[i - 1] if i > 0 else None,
+            'next': hrefs[i + 1] if i + 1 < len(events) else None
+        }
+        jobs.append({
+            'eyes': eyes,
+            'filepath': filepaths[i],
+            'title': title,
+            'max_points': max_points,
+            'links': links
+        })
+        rows.append({
+            'href': hrefs[i],
+            'title': title,
+            'tags': ', '.join(ev['tags']),
+            'start_ms': int(round(ev['range'][0] / 1000.0)),
+            'end_ms': int(round(ev['range'][1] / 1000.0)),
+            'samples': len(eyes[0])
+        })
+
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            render_event_page(job)
+    else:
+        pool = Pool(processes)
+        try:
+            pool.map(render_event_page, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    html = get_template('event_index.html').render(title=event_tag,
+                                                   rows=rows)
+    with open(output_html_filepath, 'w') as f:
+        f.write(html)
+
+    return filepaths
 
 
 def render_overview(common, output_html_filepath, title='Overview',
-                    emphasize_gaps=False):
+                    emphasize_gaps=False, max_points=2000,
+                    downsampling='lttb'):
     '''
     Create HTML-based visualization from all streams and events.
     Does not understand stream or event semantics like gaze paths for example.
 
-    Can be slow if streams contain large number of gaps.
+    Long streams are downsampled before plotting so that the size of the
+    HTML file does not grow with the length of the session. See
+    utils.downsample_indices.
 
     Parameters:
         common: A CommonV1 object
         output_html_filepath: a filepath as string
         title: HTML page title as string
-        emphasize_gaps: if False, do not show red gaps. Makes it quicker.
+        emphasize_gaps: if True, show gaps as red lines.
+        max_points: number of points to plot per stream, about two per
+            pixel column by default. None to plot all the points.
+        downsampling: 'lttb' for Largest-Triangle-Three-Buckets or
+            'minmax' for minimum and maximum per bucket.
     '''
+    import bokeh.plotting as plotting
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+    # For printing environments
+    import yaml
 
     # Collect figures together
     figs = []
@@ -139,29 +309,31 @@ def render_overview(common, output_html_filepath, title='Overview',
                               toolbar_location=None)
 
         if emphasize_gaps:
-            # Emphasize gaps with red. Slow if data very gapped.
-            # Get valid substreams
-            sl = utils.get_valid_sublists_2d(x, y)
-
-            for xs, ys in sl:
-                fig.line(xs, ys, line_color=color)
-
-            # Emphasize gaps with red line.
-            # Loop pairwise, fill gaps.
-            # TODO Optimize. Currently very slow.
-            for i in range(len(sl) - 1):
-                xs0, ys0 = sl[i]
-                xs1, ys1 = sl[i + 1]
-                # Extrapolate from last known value
-                x0 = xs0[-1]
-                x1 = xs1[0]
-                y = ys0[-1]
-                fig.line(x=[x0, x1], y=[y, y], line_width=1, line_color='red')
+            # Emphasize gaps with red.
+            ys = np.array(y, dtype=float)
+            xs = np.asarray(x, dtype=float)
+            picked = utils.downsample_indices(xs, ys, max_points,
+                                              downsampling)
+            starts, ends = find_runs(~np.isnan(ys))
+
+            # Draw valid runs as a single line broken by NaNs. Ends of the
+            # valid runs are always picked, thus the breaks go before the
+            # picked run starts.
+            breaks = np.searchsorted(picked, starts[1:])
+            fig.line(x=np.insert(xs[picked], breaks, np.nan),
+                     y=np.insert(ys[picked], breaks, np.nan),
+                     line_width=1, line_color=color)
+
+            # Draw gaps as segments at the last known value.
+            last = ends[:-1] - 1
+            fig.segment(x0=xs[last], y0=ys[last], x1=xs[starts[1:]],
+                        y1=ys[last], line_width=1, line_color='red')
         else:
             # Fill gaps and draw single line.
-            # This should be much faster.
             yy = gpre.fill_gaps(y)
-            fig.line(x=x, y=yy, line_width=1, line_color=color)
+            picked = utils.downsample_indices(x, yy, max_points, downsampling)
+            fig.line(x=[x[i] for i in picked], y=[yy[i] for i in picked],
+                     line_width=1, line_color=color)
 
         figs.append(fig)
 
@@ -191,7 +363,7 @@ def render_overview(common, output_html_filepath, title='Overview',
                           toolbar_location=None)
 
     # Hide event indices and draw custom text instead.
-    fig.yaxis.visible = None
+    fig.yaxis.visible = False
 
     def get_text_position(x0, x1, minx, maxx):
         '''Change text position based on event's horizontal position so that
@@ -241,16 +413,7 @@ def render_overview(common, output_html_filepath, title='Overview',
     # Render HTML
     ##########
 
-    this_dir = os.path.dirname(os.path.abspath(__file__))
-    template_dir = os.path.join(this_dir, 'templates')
-    jinja2loader = FileSystemLoader(template_dir)
-    jinja2env = Environment(loader=jinja2loader)
-    try:
-        overview_template = jinja2env.get_template('overview.html')
-    except TemplateNotFound as ex:
-        print('Tried template dir: ' + template_dir)
-        raise ex
-
+    overview_template = get_template('overview.html')
     html = file_html(figs, CDN, title=title,
                      template=overview_template,
                      template_variables={'environment': env_html,
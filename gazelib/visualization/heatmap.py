@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+Gaze density heatmaps.
+
+Samples are binned into a fixed 2D histogram over the screen. Histograms
+are accumulated container by container, thus memory use depends only on
+the number of bins, not on the number of trials. Gaussian smoothing is
+applied once when the density is read.
+
+Usage::
+
+    hm = HeatmapAccumulator()
+    for common in trials:
+        hm.add_common(common)
+    render_heatmap(hm, 'heatmap.html')
+'''
+import numpy as np
+
+
+class HeatmapAccumulator(object):
+    '''
+    Weighted 2D histogram of gaze points in relative screen coordinates.
+
+    Parameters:
+        bins: tuple (nx, ny), number of bins horizontally and vertically.
+        x_range, y_range: tuples (min, max) of the binned area. Points
+            outside are ignored.
+    '''
+
+    def __init__(self, bins=(160, 90), x_range=(0.0, 1.0),
+                 y_range=(0.0, 1.0)):
+        self.bins = (int(bins[0]), int(bins[1]))
+        self.x_range = (float(x_range[0]), float(x_range[1]))
+        self.y_range = (float(y_range[0]), float(y_range[1]))
+        # Indexed [y_bin, x_bin] like images.
+        self.counts = np.zeros((self.bins[1], self.bins[0]))
+        self.total_weight = 0.0
+
+    def add(self, xs, ys, weights=None):
+        '''
+        Add points. Points with None or NaN coordinates are skipped.
+
+        Parameters:
+            xs, ys: sequences of coordinates.
+            weights: optional sequence of non-negative weights, e.g.
+                confidences. Points weigh 1 by default.
+        '''
+        xs = np.array(xs, dtype=float)
+        ys = np.array(ys, dtype=float)
+        if weights is None:
+            weights = np.ones(len(xs))
+        else:
+            weights = np.array(weights, dtype=float)
+        nx, ny = self.bins
+        # Bin indices. Invalid coordinates give NaN and fail the tests.
+        with np.errstate(invalid='ignore'):
+            fx = (xs - self.x_range[0]) / (self.x_range[1] - self.x_range[0])
+            fy = (ys - self.y_range[0]) / (self.y_range[1] - self.y_range[0])
+            ok = ((fx >= 0) & (fx < 1) & (fy >= 0) & (fy < 1) &
+                  ~np.isnan(weights))
+        ix = (fx[ok] * nx).astype(int)
+        iy = (fy[ok] * ny).astype(int)
+        w = weights[ok]
+        flat = np.bincount(iy * nx + ix, weights=w, minlength=nx * ny)
+        self.counts += flat.reshape((ny, nx))
+        self.total_weight += float(w.sum())
+
+    def add_common(self, common, sources=('left_eye', 'right_eye'),
+                   use_confidence=True):
+        '''
+        Add gaze samples of a CommonV1.
+
+        Parameters:
+            common: CommonV1 object
+            sources: read streams gazelib/gaze/<source>_x_relative and
+                gazelib/gaze/<source>_y_relative for each source, e.g.
+                'left_eye', 'right_eye', or 'binocular'.
+            use_confidence: weight samples by the smaller confidence of
+                the x and y streams, if available.
+
+        Raise:
+            InsufficientDataException: if streams are missing.
+        '''
+        for source in sources:
+            x_name = 'gazelib/gaze/' + source + '_x_relative'
+            y_name = 'gazelib/gaze/' + source + '_y_relative'
+            common.assert_has_streams([x_name, y_name])
+            x_stream = common.get_stream(x_name)
+            y_stream = common.get_stream(y_name)
+            weights = None
+            if use_confidence:
+                confs = [s['confidence'] for s in [x_stream, y_stream]
+                         if 'confidence' in s]
+                if len(confs) > 0:
+                    weights = np.minimum.reduce(
+                        [np.array(c, dtype=float) for c in confs])
+            self.add(x_stream['values'], y_stream['values'], weights)
+
+    def merge(self, other):
+        '''
+        Add the histogram of another accumulator with equal binning, e.g.
+        one computed in another process.
+
+        Raise:
+            ValueError: if binning differs.
+        '''
+        if (self.bins != other.bins or self.x_range != other.x_range or
+                self.y_range != other.y_range):
+            raise ValueError('Heatmaps must have equal binning.')
+        self.counts += other.counts
+        self.total_weight += other.total_weight
+
+    def density(self, sigma=2.0):
+        '''
+        Return the smoothed density as a 2D float numpy array indexed
+        [y_bin, x_bin] that sums to 1, or zeros if nothing was added.
+
+        Parameters:
+            sigma: standard deviation of the Gaussian kernel in bins.
+                0 or None for no smoothing.
+        '''
+        grid = self.counts
+        if sigma:
+            import scipy.ndimage  # imported on first use
+            grid = scipy.ndimage.gaussian_filter(grid, sigma, mode='constant')
+        total = grid.sum()
+        if total <= 0:
+            return np.zeros_like(grid)
+        return grid / total
+
+
+def render_heatmap(heatmap, output_html_filepath, title='Heatmap',
+                   sigma=2.0, palette='Viridis256'):
+    '''
+    Create a HTML-based visualization of a heatmap as a single image glyph.
+    The size of the HTML file depends on the number of bins only.
+
+    Parameters:
+        heatmap: HeatmapAccumulator
+        output_html_filepath: a filepath as string
+        title: HTML page title as string
+        sigma: see HeatmapAccumulator.density
+        palette: name of a Bokeh palette
+    '''
+    import bokeh.plotting as plotting  # imported on first use
+    x0, x1 = heatmap.x_range
+    y0, y1 = heatmap.y_range
+    p = plotting.figure(title=title, x_axis_label='X', y_axis_label='Y',
+                        plot_width=640, plot_height=480,
+                        x_range=(x0, x1), y_range=(y0, y1))
+    p.image(image=[heatmap.density(sigma)], x=x0, y=y0, dw=x1 - x0,
+            dh=y1 - y0, palette=palette)
+
+    # Render screen rectangle
+    p.quad(left=[0.0], right=[1.0], top=[0.0], bottom=[1.0],
+           line_width=1, line_color='white', fill_alpha=0)
+
+    plotting.output_file(output_html_filepath, title)
+    plotting.save(p)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import numpy as np
+from gazelib.statistics.validity import find_runs
 
 
 def isNotNone(x):
@@ -79,3 +81,148 @@ def get_valid_sublists_2d(xs, ys, validator=isNotNone2d):
         sublists.append((cur_sublist_x, cur_sublist_y))
 
     return sublists
+
+
+def lttb_indices(xs, ys, n_out):
+    '''
+    Downsample a line by Largest-Triangle-Three-Buckets. The first and last
+    points are kept. The rest are divided into n_out - 2 buckets and from
+    each bucket the point is kept that forms the largest triangle with the
+    previously kept point and the mean of the next bucket. Peaks and other
+    visually important features survive.
+
+    Parameters:
+        xs, ys: sequences of numbers without gaps. xs in ascending order.
+        n_out: number of points to keep.
+
+    Return:
+        integer numpy array of indices of kept points in ascending order.
+    '''
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    n = len(xs)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket i covers indices edges[i]..edges[i + 1] exclusive.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Means of the buckets, and of the last point as the final bucket.
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(xs[:-1], edges[:-1]) / counts, xs[-1])
+    mean_y = np.append(np.add.reduceat(ys[:-1], edges[:-1]) / counts, ys[-1])
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo = edges[i]
+        hi = edges[i + 1]
+        ax = xs[a]
+        ay = ys[a]
+        # Twice the triangle areas, sign ignored.
+        area = np.abs((ax - mean_x[i + 1]) * (ys[lo:hi] - ay) -
+                      (ax - xs[lo:hi]) * (mean_y[i + 1] - ay))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax_indices(ys, n_out):
+    '''
+    Downsample a line by keeping the minimum and maximum of each of
+    n_out / 2 buckets of consecutive points. With a bucket per pixel column
+    the line looks the same as with all the points.
+
+    Parameters:
+        ys: sequence of numbers without gaps.
+        n_out: number of points to keep, approximately.
+
+    Return:
+        integer numpy array of indices of kept points in ascending order.
+    '''
+    ys = np.asarray(ys, dtype=float)
+    n = len(ys)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    bucket = (np.arange(n) * n_buckets) // n
+    # Sort by value within buckets. Bucket minimum and maximum are then
+    # the first and last of each bucket.
+    order = np.lexsort((ys, bucket))
+    starts = np.flatnonzero(np.diff(np.append(-1, bucket[order])))
+    ends = np.append(starts[1:], n) - 1
+    kept = np.union1d(order[starts], order[ends])
+    # Keep the line ends.
+    return np.union1d(kept, [0, n - 1])
+
+
+def downsample_indices(xs, ys, max_points, method='lttb'):
+    '''
+    Pick indices of points to plot so that the shape of the line is
+    preserved with about max_points points. Gaps are respected: only valid
+    points are picked, and the first and last point of each valid run are
+    always kept so gaps stay exactly in place. Thus heavily gapped data can
+    produce more points than max_points.
+
+    Parameters:
+        xs: sequence of numbers in ascending order.
+        ys: sequence of numbers. None and NaN values are gaps.
+        max_points: number of points to keep or None to keep all.
+        method: 'lttb' for Largest-Triangle-Three-Buckets or 'minmax' for
+            minimum and maximum per bucket.
+
+    Return:
+        integer numpy array of indices of kept valid points.
+
+    Raise:
+        ValueError: if method is unknown.
+    '''
+    if method not in ('lttb', 'minmax'):
+        raise ValueError('Unknown downsampling method: ' + str(method))
+    ys = np.array(ys, dtype=float)
+    valid = np.flatnonzero(~np.isnan(ys))
+    if max_points is None or len(valid) <= max_points:
+        return valid
+
+    if method == 'lttb':
+        xs = np.asarray(xs, dtype=float)
+        picked = valid[lttb_indices(xs[valid], ys[valid], max_points)]
+    else:
+        picked = valid[minmax_indices(ys[valid], max_points)]
+
+    starts, ends = find_runs(~np.isnan(ys))
+    return np.union1d(picked, np.concatenate((starts, ends - 1)))
+
+
+def get_path_arrays(xs, ys, max_points=None):
+    '''
+    Convert a gaze path to float arrays where gaps are NaN, optionally
+    decimated by keeping every n:th sample. Samples next to gaps are always
+    kept, and one NaN of each gap, so decimation never bridges a gap.
+
+    Parameters:
+        xs, ys: sequences of coordinates. Nones are gaps.
+        max_points: keep about this many samples or None to keep all.
+
+    Return:
+        tuple (xs, ys) of float numpy arrays
+    '''
+    xs = np.array(xs, dtype=float)
+    ys = np.array(ys, dtype=float)
+    # Sample is valid only if both coordinates are known.
+    gap = np.isnan(xs) | np.isnan(ys)
+    xs[gap] = np.nan
+    ys[gap] = np.nan
+    n = len(xs)
+    if max_points is None or n <= max_points:
+        return xs, ys
+
+    step = int(np.ceil(n / float(max_points)))
+    starts, ends = find_runs(~gap)
+    # First gap sample after each run, if any.
+    gap_starts = ends[ends < n]
+    kept = np.unique(np.concatenate((np.arange(0, n, step), starts,
+                                     ends - 1, gap_starts)))
+    return xs[kept], ys[kept]
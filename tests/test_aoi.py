@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest  # to support Python 2.6
+except ImportError:
+    import unittest
+
+from gazelib import aoi as unit
+from gazelib.legacy import igazelib
+
+
+class TestHits(unittest.TestCase):
+
+    xs = [0.1, 0.4, 0.4, 0.8, None, 0.1]
+    ys = [None, 0.1, 0.7, 0.2, None, 0.2]
+    # gazelib/geom/rectangle i.e. [x1, y1, x2, y2]
+    rects = [
+        [0.35, 0.05, 0.45, 0.8],
+        [0.0, 0.0, 0.5, 0.5],
+        [0.9, 0.9, 1.0, 1.0]
+    ]
+
+    def test_membership(self):
+        m = unit.membership(self.xs, self.ys, self.rects)
+        self.assertEqual(m.shape, (6, 3))
+        self.assertListEqual(m[:, 0].tolist(),
+                             [False, True, True, False, False, False])
+        self.assertListEqual(m[:, 1].tolist(),
+                             [False, True, False, False, False, True])
+        self.assertFalse(m[:, 2].any())
+
+    def test_match_legacy(self):
+        aoi = {'x1': 0.35, 'x2': 0.45, 'y1': 0.05, 'y2': 0.8}
+        data = [{'x': x if x is not None else -1,
+                 'y': y if y is not None else -1}
+                for x, y in zip(self.xs, self.ys)]
+        r = unit.hit_test(self.xs, self.ys, [aoi])
+        self.assertEqual(r['first_index'][0],
+                         igazelib.gaze_inside_aoi(data, 'x', 'y', aoi,
+                                                  'first'))
+        self.assertEqual(r['last_index'][0],
+                         igazelib.gaze_inside_aoi(data, 'x', 'y', aoi,
+                                                  'last'))
+        self.assertAlmostEqual(r['dwell_fraction'][0],
+                               igazelib.gaze_inside_aoi_percentage(
+                                   data, 'x', 'y', aoi))
+
+    def test_hit_test(self):
+        r = unit.hit_test(self.xs, self.ys, self.rects)
+        self.assertListEqual(r['first_index'].tolist(), [1, 1, -1])
+        self.assertListEqual(r['last_index'].tolist(), [2, 5, -1])
+        fr = r['dwell_fraction'].tolist()
+        self.assertAlmostEqual(fr[0], 2.0 / 6)
+        self.assertAlmostEqual(fr[1], 2.0 / 6)
+        self.assertAlmostEqual(fr[2], 0.0)
+
+    def test_empty(self):
+        r = unit.hit_test([], [], self.rects)
+        self.assertEqual(r['membership'].shape, (0, 3))
+        self.assertListEqual(r['first_index'].tolist(), [-1, -1, -1])
+        self.assertListEqual(r['dwell_fraction'].tolist(), [-1, -1, -1])
+
+    def test_invalid_rectangle(self):
+        f = lambda: unit.membership([0.1], [0.1], [[0.0, 1.0]])
+        self.assertRaises(ValueError, f)
+
+
+class TestAoiIndex(unittest.TestCase):
+
+    def test_grid_matches_brute_force(self):
+        # 10 x 10 grid of cells with gaps between them
+        rects = []
+        for row in range(10):
+            for col in range(10):
+                rects.append([col * 0.1, row * 0.1,
+                              col * 0.1 + 0.09, row * 0.1 + 0.09])
+        index = unit.AoiIndex(rects)
+        self.assertEqual(len(index), 100)
+
+        xs = [i * 0.0137 for i in range(80)] + [None, 1.5, -0.2]
+        ys = [(i * 0.0291) % 1.0 for i in range(80)] + [0.5, 0.5, None]
+        expected = unit.membership(xs, ys, rects)
+        member = index.membership(xs, ys)
+        self.assertListEqual(member.tolist(), expected.tolist())
+
+        ids = index.lookup(xs, ys)
+        for i in range(len(xs)):
+            hits = expected[i].nonzero()[0].tolist()
+            self.assertEqual(ids[i], hits[0] if hits else -1)
+
+    def test_polygon(self):
+        triangle = [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]]
+        rect = [0.5, 0.5, 1.0, 1.0]
+        index = unit.AoiIndex([triangle, rect], grid_size=3)
+        ids = index.lookup([0.1, 0.6, 0.8, 0.45], [0.1, 0.6, 0.3, 0.45])
+        self.assertListEqual(ids.tolist(), [0, 1, -1, 0])
+
+    def test_overlap_smallest_id_wins(self):
+        index = unit.AoiIndex([[0.0, 0.0, 1.0, 1.0], [0.2, 0.2, 0.4, 0.4]])
+        self.assertListEqual(index.lookup([0.3], [0.3]).tolist(), [0])
+        member = index.membership([0.3], [0.3])
+        self.assertListEqual(member.tolist(), [[True, True]])
+
+    def test_invalid(self):
+        f = lambda: unit.AoiIndex([[0.0, 1.0]])
+        self.assertRaises(ValueError, f)
+        index = unit.AoiIndex([])
+        self.assertListEqual(index.lookup([0.1], [0.1]).tolist(), [-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
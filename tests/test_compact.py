@@ -0,0 +1,182 @@
+try:
+    import unittest2 as unittest  # to support Python 2.6
+except ImportError:
+    import unittest
+
+from gazelib.compact import (CompactArray, RegularTimeline, compact_floats,
+                             to_json_compatible)
+import numpy as np
+import bisect
+import json
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_coded(self):
+        values = [1.0, 0.8, 0.5, 0.1, 0.0, 1.0, 1.0]
+        c = compact_floats(values)
+        self.assertEqual(c.data.dtype, np.uint8)
+        self.assertEqual(len(c), 7)
+        self.assertEqual(c.nbytes, 7 + 5 * 8)
+        self.assertEqual(c[1], 0.8)
+        self.assertEqual(c[-1], 1.0)
+        self.assertEqual(list(c), values)
+        self.assertEqual(c.tolist(), values)
+        self.assertEqual(c, values)
+        self.assertNotEqual(c, values[:-1])
+        self.assertNotEqual(c, [None] * 7)
+        self.assertEqual(sorted(c.representatives()),
+                         [0.0, 0.1, 0.5, 0.8, 1.0])
+        # Slices share buffers
+        s = c[2:4]
+        self.assertIsInstance(s, CompactArray)
+        self.assertEqual(s, [0.5, 0.1])
+        self.assertIs(s.levels, c.levels)
+        np.testing.assert_array_equal(np.asarray(c, dtype=float), values)
+        # Compacting twice does nothing.
+        self.assertIs(compact_floats(c), c)
+
+    def test_float32(self):
+        values = np.arange(1000) / 1024.0
+        c = compact_floats(values)
+        self.assertIsNone(c.levels)
+        self.assertEqual(c.data.dtype, np.float32)
+        self.assertEqual(c.nbytes, 4000)
+        self.assertEqual(c, values)
+        self.assertEqual(c[0:2].tolist(), [0.0, 1 / 1024.0])
+
+    def test_float64(self):
+        # Values that float32 would round are kept exactly.
+        values = np.linspace(0.0, 1.0, 1000)
+        c = compact_floats(values)
+        self.assertIsNone(c.levels)
+        self.assertEqual(c.data.dtype, np.float64)
+        self.assertEqual(c.tolist(), values.tolist())
+        self.assertEqual(json.loads(json.dumps(c, default=to_json_compatible)),
+                         values.tolist())
+        # Appending such values widens float32 data.
+        c = compact_floats(np.arange(300) / 1024.0)
+        c.extend([0.001])
+        self.assertEqual(c.data.dtype, np.float64)
+        self.assertEqual(c[-1], 0.001)
+        self.assertEqual(c[0:300], np.arange(300) / 1024.0)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, lambda: compact_floats([1.0, None]))
+        self.assertRaises(ValueError, lambda: compact_floats(['foo']))
+        self.assertRaises(ValueError, lambda: compact_floats([[1.0]]))
+
+    def test_regular_timeline(self):
+        # 300 Hz with a fractional interval, jitter, and an outlier.
+        times = [int(round(i * 10000 / 3.0)) for i in range(100)]
+        times[10] += 7
+        times[50] -= 3
+        times[70] += 3000
+        tl = RegularTimeline.from_times(times)
+        self.assertEqual(tl.exception_indices.tolist(), [70])
+        self.assertEqual(tl.residuals.dtype, np.int8)
+        self.assertEqual(tl.residuals[10], 7)
+        self.assertEqual(len(tl), 100)
+        self.assertEqual(tl, times)
+        self.assertEqual(tl.tolist(), times)
+        self.assertEqual([tl[i] for i in range(-100, 100)], times + times)
+        self.assertIsInstance(tl[10], int)
+        self.assertRaises(IndexError, lambda: tl[100])
+        self.assertEqual(tl.nbytes, 16 + 100 + 40)
+        self.assertEqual(tl.representatives(), [0, times[70]])
+
+        # Slices keep rounding and corrections.
+        for a, b in [(3, 40), (10, 11), (11, 70), (60, 200), (5, 2)]:
+            sub = tl[a:b]
+            self.assertIsInstance(sub, RegularTimeline)
+            self.assertEqual(sub.tolist(), times[a:b])
+        self.assertEqual(tl[::2], times[::2])
+
+        # Exactly regular needs no residuals.
+        regular = RegularTimeline.from_times(list(range(0, 3000, 30)))
+        self.assertIsNone(regular.residuals)
+        self.assertEqual(regular.nbytes, 40)
+
+        self.assertIsNone(RegularTimeline.from_times(times, 0))
+        self.assertEqual(RegularTimeline.from_times([]), [])
+        self.assertEqual(RegularTimeline.from_times([5]), [5])
+        self.assertRaises(ValueError,
+                          lambda: RegularTimeline.from_times([0.5, 1.5]))
+
+    def test_regular_timeline_bisect_left(self):
+        rs = np.random.RandomState(0)
+        times = np.cumsum(rs.randint(3200, 3450, size=1000))
+        times[500:] += 100000  # gap
+        times = times.tolist()
+        tl = RegularTimeline.from_times(times)
+        for sub_start in [0, 250]:
+            sub = tl[sub_start:]
+            expected = times[sub_start:]
+            for t in [-1, 0, times[0], times[-1], times[-1] + 1,
+                      times[499] + 1, times[500]] + \
+                    rs.randint(0, times[-1] + 10, size=200).tolist():
+                self.assertEqual(sub.bisect_left(t),
+                                 bisect.bisect_left(expected, t))
+        self.assertEqual(RegularTimeline.from_times([]).bisect_left(5), 0)
+        self.assertEqual(RegularTimeline.from_times([5]).bisect_left(5), 0)
+        self.assertEqual(RegularTimeline.from_times([5]).bisect_left(6), 1)
+
+    def test_extend(self):
+        c = compact_floats([1.0, 0.5])
+        view = c[0:2]
+        c.extend([0.5, 0.25, 1.0])
+        self.assertEqual(c, [1.0, 0.5, 0.5, 0.25, 1.0])
+        self.assertEqual(view, [1.0, 0.5])
+        self.assertEqual(c.data.dtype, np.uint8)
+        # Appending to a view copies its buffer.
+        view.extend([0.0])
+        self.assertEqual(view, [1.0, 0.5, 0.0])
+        self.assertEqual(c, [1.0, 0.5, 0.5, 0.25, 1.0])
+        # Too many levels switch to floats.
+        many = np.linspace(0.0, 1.0, 300)
+        c.extend(many)
+        self.assertIsNone(c.levels)
+        self.assertEqual(c[5:].tolist(), many.tolist())
+        self.assertRaises(ValueError, lambda: c.extend([None]))
+        # Buffers grow by doubling.
+        c = compact_floats([1.0])
+        for _ in range(1000):
+            c.extend([1.0])
+        self.assertEqual(len(c), 1001)
+        self.assertLessEqual(len(c._buffers['data']), 2048)
+
+    def test_regular_timeline_extend(self):
+        rs = np.random.RandomState(1)
+        times = (np.arange(3000) * 10000 / 3.0).astype(np.int64)
+        times += rs.randint(-50, 50, size=3000)
+        times[1500] += 200000
+        times = times.tolist()
+        tl = RegularTimeline.from_times(times[:2])
+        sub = tl[0:2]
+        for i in range(2, 3000, 100):
+            tl.extend(times[i:i + 100])
+        self.assertEqual(tl, times)
+        self.assertEqual(tl.exception_indices.tolist(), [1500])
+        self.assertEqual(sub, times[:2])
+        self.assertRaises(ValueError, lambda: tl.extend([1.5]))
+        # Residuals widen if needed.
+        tl = RegularTimeline.from_times([0, 3333, 6667])
+        self.assertEqual(tl.residuals.dtype, np.int8)
+        tl.extend([10000 + 500])
+        self.assertEqual(tl.residuals.dtype, np.int16)
+        self.assertEqual(tl, [0, 3333, 6667, 10500])
+        empty = RegularTimeline.from_times([])
+        empty.extend([5, 10, 15])
+        self.assertEqual(empty, [5, 10, 15])
+        self.assertIsNone(empty.residuals)
+
+    def test_json(self):
+        c = compact_floats([0.5, 1.0])
+        s = json.dumps({'c': c, 'a': np.arange(2)},
+                       default=to_json_compatible, sort_keys=True)
+        self.assertEqual(s, '{"a": [0, 1], "c": [0.5, 1.0]}')
+        self.assertRaises(TypeError, lambda: to_json_compatible(object()))
+
+
+if __name__ == '__main__':
+    unittest.main()
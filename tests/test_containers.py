@@ -12,7 +12,9 @@ from .utils import (get_temp_filepath, remove_temp_file, frange,
     assert_deep_equal)
 import jsonschema  # import ValidationError
 import six  # Python version agnostic string type testing.
+import json
 import os
+import numpy as np
 
 
 def assert_valid(self, common_raw, msg='Invalid CommonV1 structure'):
@@ -310,6 +312,16 @@ class TestCommonV1(unittest.TestCase):
 
         assert_valid(self, g.raw)
 
+    def test_add_derived_stream(self):
+        c = CommonV1()
+        c.add_timeline('mytime', [1, 2, 3])
+        c.add_stream('foo', 'mytime', [5, 5, 5], derived='my.function')
+        self.assertEqual(c.get_stream('foo')['derived'], 'my.function')
+        assert_valid(self, c.raw)
+
+        f = lambda: c.add_stream('bar', 'mytime', [5, 5, 5], derived=1)
+        self.assertRaises(CommonV1.InvalidStreamException, f)
+
     def test_add_stream_with_invalid_confidence(self):
         '''Confidency too short or elements not between 0.0 and 1.0'''
         ex = CommonV1.InvalidStreamException
@@ -336,6 +348,161 @@ class TestCommonV1(unittest.TestCase):
         self.assertEqual(len(stream['values']), 1000)
         self.assertEqual(len(stream['confidence']), 1000)
 
+    def test_add_stream_compact_confidence(self):
+        c = CommonV1()
+        c.set_time_reference(0)
+        c.add_timeline('tl', [0, 1, 2, 3])
+        c.add_stream('s', 'tl', [1, 2, 3, 4], [1.0, 0.8, 0.8, 0.0])
+        conf = c.get_stream('s')['confidence']
+        self.assertEqual(conf.nbytes, 4 + 3 * 8)
+        self.assertEqual(conf, [1.0, 0.8, 0.8, 0.0])
+        self.assertNotIsInstance(conf, list)
+        self.assertEqual(list(conf), [1.0, 0.8, 0.8, 0.0])
+        assert_valid(self, c.raw)
+        raw = json.loads(json.dumps(
+            c.raw, default=gazelib.compact.to_json_compatible))
+        self.assertEqual(raw['streams']['s']['confidence'],
+                         [1.0, 0.8, 0.8, 0.0])
+
+        # Sliced and saved transparently
+        sub = c.slice_by_relative_time(1, 3)
+        self.assertEqual(sub.get_stream('s')['confidence'], [0.8, 0.8])
+        fpath = get_temp_filepath('compact.json')
+        c.save_as_json(fpath)
+        loaded = CommonV1(fpath)
+        remove_temp_file(fpath)
+        self.assertEqual(loaded.get_stream('s')['confidence'],
+                         [1.0, 0.8, 0.8, 0.0])
+        self.assertTrue(loaded == c)
+
+        f = lambda: c.add_stream('t', 'tl', [1, 2, 3, 4], [1, 1, None, 1])
+        self.assertRaises(CommonV1.InvalidStreamException, f)
+        f = lambda: c.add_stream('t', 'tl', [1, 2, 3, 4], [1, 1, 1, np.nan])
+        self.assertRaises(CommonV1.InvalidStreamException, f)
+
+    def test_add_regular_timeline(self):
+        c = CommonV1()
+        c.set_time_reference(0)
+        times = list(range(0, 100000, 1000))
+        times[40] += 10
+        c.add_timeline('tl', times, regular=True)
+        c.add_timeline('irregular', [0, 1, 5, 6, 20, 21, 50, 51, 90, 91],
+                       regular=True)
+        tl = c.get_timeline('tl')
+        self.assertIsInstance(tl, gazelib.compact.RegularTimeline)
+        self.assertIsInstance(c.get_timeline('irregular'), list)
+        self.assertEqual(c.get_relative_time_by_index('tl', 40), 40010)
+        self.assertEqual(c.get_relative_end_time(), 99000)
+        self.assertEqual(c.get_timeline_mean_interval('tl'), 1000.0)
+        c.add_timeline('one', [5], regular=True)
+        self.assertIsNone(c.get_timeline_mean_interval('one'))
+        c.add_stream('a', 'tl', list(range(100)))
+        c.add_stream('b', 'tl', list(range(100)), [1.0] * 100)
+        assert_valid(self, c.raw)
+
+        # Streams of a slice share the sliced timeline.
+        sub = c.slice_by_relative_time(35000, 45000)
+        self.assertEqual(sub.get_timeline('tl'), times[35:45])
+        self.assertEqual(sub.get_stream_values('b'), list(range(35, 45)))
+        assert_valid(self, sub.raw)
+
+        # Saved as a list.
+        fpath = get_temp_filepath('regular.json')
+        c.save_as_json(fpath)
+        loaded = CommonV1(fpath)
+        remove_temp_file(fpath)
+        self.assertEqual(loaded.get_timeline('tl'), times)
+        self.assertTrue(loaded == c)
+
+        f = lambda: c.add_timeline('foo', [0.5, 1.5], regular=True)
+        self.assertRaises(CommonV1.InvalidTimelineException, f)
+
+    def test_compact(self):
+        g = CommonV1(get_fixture_filepath('sample.common.json'))
+        before = g.memory_usage()
+        expected = CommonV1(get_fixture_filepath('sample.common.json'))
+        g.compact()
+        self.assertIsInstance(g.get_timeline('ecg'),
+                              gazelib.compact.RegularTimeline)
+        self.assertTrue(g == expected)
+        self.assertLess(g.memory_usage()['total'], before['total'])
+        assert_valid(self, g.raw)
+        for t0, t1 in [(50000, 110000), (-5, 35000), (95000, None)]:
+            self.assertTrue(g.slice_by_relative_time(t0, t1) ==
+                            expected.slice_by_relative_time(t0, t1))
+
+    def test_append_samples(self):
+        for regular in [False, True]:
+            c = CommonV1()
+            c.set_time_reference(0)
+            c.add_timeline('tl', [], regular=regular)
+            c.add_timeline('other', [0])
+            c.add_stream('a', 'tl', [])
+            c.add_stream('b', 'tl', [], confidence=[])
+            c.add_stream('c', 'other', [1])
+            for i in range(10):
+                times = range(i * 100, (i + 1) * 100, 10)
+                c.append_samples('tl', times, {
+                    'a': [i] * 10,
+                    'b': range(10)
+                }, {'b': [1.0, 0.5] * 5})
+            self.assertEqual(c.get_timeline('tl'), list(range(0, 1000, 10)))
+            self.assertEqual(c.get_stream_values('a')[-1], 9)
+            self.assertEqual(len(c.get_stream('b')['confidence']), 100)
+            self.assertEqual(c.get_stream_values('c'), [1])
+            assert_valid(self, c.raw)
+            if regular:
+                self.assertIsNone(c.get_timeline('tl').residuals)
+
+            # Invalid chunks are not appended.
+            ex = CommonV1.InvalidStreamException
+            tex = CommonV1.InvalidTimelineException
+            f = lambda: c.append_samples('tl', [985], {'a': [1], 'b': [1]},
+                                         {'b': [1.0]})
+            self.assertRaises(tex, f)
+            f = lambda: c.append_samples('tl', [1000, 999],
+                                         {'a': [1, 1], 'b': [1, 1]},
+                                         {'b': [1.0, 1.0]})
+            self.assertRaises(tex, f)
+            f = lambda: c.append_samples('tl', [1000.5], {'a': [1], 'b': [1]},
+                                         {'b': [1.0]})
+            self.assertRaises(tex, f)
+            f = lambda: c.append_samples('tl', [1000], {'a': [1]},
+                                         {'b': [1.0]})
+            self.assertRaises(ex, f)
+            f = lambda: c.append_samples('tl', [1000], {'a': [1], 'b': [1]})
+            self.assertRaises(ex, f)
+            f = lambda: c.append_samples('tl', [1000], {'a': [1], 'b': [1]},
+                                         {'b': [1.5]})
+            self.assertRaises(ex, f)
+            f = lambda: c.append_samples('tl', [1000],
+                                         {'a': [1], 'b': [1], 'c': [1]},
+                                         {'b': [1.0]})
+            self.assertRaises(ex, f)
+            f = lambda: c.append_samples('tl', [1000], {'a': [], 'b': [1]},
+                                         {'b': [1.0]})
+            self.assertRaises(ex, f)
+            f = lambda: c.append_samples('foo', [1000], {})
+            self.assertRaises(CommonV1.MissingTimelineException, f)
+            self.assertEqual(len(c.get_timeline('tl')), 100)
+            self.assertEqual(len(c.get_stream_values('a')), 100)
+            self.assertEqual(len(c.get_stream('b')['confidence']), 100)
+
+    def test_append_samples_to_slice(self):
+        g = CommonV1(get_fixture_filepath('sample.common.json'))
+        g.compact()
+        sub = g.slice_by_relative_time(0, 50000)
+        names = [n for n in sub.list_stream_names()
+                 if sub.get_stream_timeline_name(n) == 'ecg']
+        values = dict((n, [0.0]) for n in names)
+        confs = dict((n, [1.0]) for n in names
+                     if 'confidence' in sub.get_stream(n))
+        sub.append_samples('ecg', [50000], values, confs)
+        self.assertEqual(sub.get_timeline('ecg')[-1], 50000)
+        # The original is unaffected.
+        expected = CommonV1(get_fixture_filepath('sample.common.json'))
+        self.assertTrue(g == expected)
+
     def test_add_timeline_from_generator(self):
         '''
         Ensure add_timeline can handle generators and converts them to lists.
@@ -431,5 +598,49 @@ class TestCommonV1(unittest.TestCase):
 
         remove_temp_file(fpath)
 
+    def test_to_stream_values(self):
+        arr = np.array([1.5, np.nan, 0.0])
+        values = gazelib.containers.to_stream_values(arr)
+        self.assertEqual(values, [1.5, None, 0.0])
+        self.assertIsInstance(values[0], float)
+
+    def test_memory_usage(self):
+        c = CommonV1()
+        c.add_timeline('tl', list(range(1000, 2000)))
+        c.add_stream('a', 'tl', [float(i) for i in range(1000)],
+                     confidence=[1.0] * 1000)
+        c.add_stream('b', 'tl', [None] * 1000)
+        c.add_environment('env', {'name': 'x'})
+        c.add_event(['tag'], 1000, 1500)
+
+        r = c.memory_usage()
+        self.assertEqual(sorted(r['timelines'].keys()), ['tl'])
+        self.assertEqual(sorted(r['streams'].keys()), ['a', 'b'])
+        self.assertEqual(sorted(r['confidence'].keys()), ['a'])
+        # List of pointers plus the numbers.
+        self.assertGreater(r['streams']['a'], 1000 * 8 + 1000 * 16)
+        # A repeated number and Nones take only the pointers.
+        self.assertLess(r['confidence']['a'], 1000 * 8 + 200)
+        self.assertLess(r['streams']['b'], 1000 * 8 + 200)
+        self.assertGreater(r['events'], 0)
+        self.assertGreater(r['environment'], 0)
+        parts = (sum(r['timelines'].values()) + sum(r['streams'].values()) +
+                 sum(r['confidence'].values()) + r['events'] +
+                 r['environment'])
+        self.assertEqual(r['total'], parts)
+
+        # Buffers are sized by nbytes.
+        self.assertEqual(gazelib.containers.get_deep_size(
+            np.zeros(100, dtype=np.float32)), 400)
+
+    def test_aggregate_memory_usage(self):
+        g = CommonV1(get_fixture_filepath('sample.common.json'))
+        r = g.memory_usage()
+        agg = gazelib.containers.aggregate_memory_usage([g, r])
+        self.assertEqual(agg['containers'], 2)
+        self.assertEqual(agg['total'], 2 * r['total'])
+        for name, size in r['streams'].items():
+            self.assertEqual(agg['streams'][name], 2 * size)
+
 if __name__ == '__main__':
     unittest.main()
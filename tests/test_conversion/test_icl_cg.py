@@ -42,6 +42,18 @@ class TestCgToGazelibCommon(unittest.TestCase):
 
         # common.save_as_json('foo.json')
 
+        # Timeline is a list unless asked otherwise.
+        tl = common.get_timeline('eyetracker')
+        self.assertIsInstance(tl, list)
+        regular = cg.common.convert(gazedata_path,
+                                    exp_config_path,
+                                    participant_number=0,
+                                    trial_config_id='SRT2',
+                                    was_calibrated=True,
+                                    regular_timeline=True)
+        self.assertNotIsInstance(regular.get_timeline('eyetracker'), list)
+        self.assertEqual(regular.get_timeline('eyetracker'), tl)
+
     def test_empty_rows(self):
         common = cg.common.convert(gazedata_emptyrows_path,
                                    exp_config_path,
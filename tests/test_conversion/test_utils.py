@@ -66,3 +66,13 @@ class TestSplitToRangesAtChangeInValue(unittest.TestCase):
         ]
         slices = list(split(rows, value_converter, time_converter))
         self.assertEqual(len(slices), 2)
+
+
+class TestTrialConfiguration(unittest.TestCase):
+
+    def test_get_aoi_rectangles(self):
+        tc = unit.TrialConfiguration({
+            'aois': [[0.0, 1.0, 0.0, 1.0], [0.1, 0.3, 0.2, 0.4]]
+        })
+        self.assertListEqual(tc.get_aoi_rectangles(),
+                             [[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+'''Ensure heavy optional dependencies are imported only on first use.'''
+try:
+    import unittest2 as unittest  # to support Python 2.6
+except ImportError:
+    import unittest
+import subprocess
+import sys
+
+HEAVY_MODULES = ['deepdiff', 'jsonschema', 'scipy', 'bokeh', 'yaml', 'jinja2']
+
+
+class TestImports(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        # Run in a fresh interpreter, other tests have imported everything.
+        code = ('import sys\n'
+                'import gazelib, gazelib.models, gazelib.visualization\n'
+                'import gazelib.conversion\n'
+                'print(",".join(m for m in {0!r} if m in sys.modules))\n')
+        out = subprocess.check_output([sys.executable, '-c',
+                                       code.format(HEAVY_MODULES)])
+        self.assertEqual(out.decode('utf-8').strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
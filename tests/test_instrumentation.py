@@ -0,0 +1,90 @@
+try:
+    import unittest2 as unittest  # to support Python 2.6
+except ImportError:
+    import unittest
+
+from .utils import get_temp_filepath, remove_temp_file
+from gazelib import instrumentation
+import gazelib
+import json
+import os
+
+# Find file path
+this_dir = os.path.dirname(os.path.realpath(__file__))
+fixtures_dir = os.path.join(this_dir, 'fixtures')
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertFalse(instrumentation.is_enabled())
+        # Null span accepts counts silently.
+        with instrumentation.span('foo') as s:
+            s.count('bar')
+            instrumentation.count('bar')
+
+    def test_profile_summary(self):
+        path = os.path.join(fixtures_dir, 'sample.gazedata')
+        with instrumentation.profile() as summary:
+            self.assertTrue(instrumentation.is_enabled())
+            gazelib.io.load_csv_as_dictlist(path)
+            gazelib.io.load_csv_as_dictlist(path)
+        self.assertFalse(instrumentation.is_enabled())
+
+        stats = summary.summary()
+        s = stats['gazelib.io.load_csv_as_dictlist']
+        self.assertEqual(s['calls'], 2)
+        self.assertEqual(s['errors'], 0)
+        self.assertEqual(s['counters'], {'rows': 20})
+        self.assertTrue(s['min_seconds'] <= s['max_seconds'])
+        self.assertIn('gazelib.io.load_csv_as_dictlist', summary.format())
+
+    def test_nested_spans_and_errors(self):
+        sink = instrumentation.SummarySink()
+        spans = []
+
+        class ListSink(object):
+            def record(self, span):
+                spans.append(span)
+
+        with instrumentation.profile(sink):
+            with instrumentation.profile(ListSink()):
+                with instrumentation.span('outer', trials=2) as outer:
+                    outer.count('trials')
+                    try:
+                        gazelib.io.load_json('foo')
+                    except IOError:
+                        pass
+
+        self.assertEqual([s.name for s in spans],
+                         ['gazelib.io.load_json', 'outer'])
+        self.assertEqual(spans[0].parent, 'outer')
+        self.assertIsNone(spans[1].parent)
+        self.assertEqual(spans[1].counters, {'trials': 3})
+        stats = sink.summary()
+        self.assertEqual(stats['gazelib.io.load_json']['errors'], 1)
+        self.assertEqual(stats['outer']['errors'], 0)
+
+    def test_json_lines_sink(self):
+        fpath = get_temp_filepath('spans.jsonl')
+        sink = instrumentation.JsonLinesSink(fpath)
+        with instrumentation.profile(sink):
+            g = gazelib.containers.CommonV1(
+                os.path.join(fixtures_dir, 'sample.common.json'))
+            g.slice_by_relative_time(0, 100000)
+        sink.close()
+
+        with open(fpath) as f:
+            records = [json.loads(line) for line in f]
+        remove_temp_file(fpath)
+        names = [r['name'] for r in records]
+        self.assertIn('gazelib.containers.CommonV1.validate', names)
+        last = records[-1]
+        self.assertEqual(last['name'],
+                         'gazelib.containers.CommonV1.slice_by_relative_time')
+        self.assertEqual(last['pid'], os.getpid())
+        self.assertIn('samples', last['counters'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -130,6 +130,31 @@ class TestGazelibMethods(unittest.TestCase):
         # validity
         self.assertAlmostEqual(gazelib.valid_gaze_percentage(data, 'yval', [1]), 0.5)
 
+    def test_validity_metrics(self):
+        data = TestGazelibMethods.data
+        aoi = {"x1":0.35, "x2":0.45, "y1":0.05, "y2":0.8}
+
+        for valkey, accepted in [('yval', [1]), ('yval', [0, 1]),
+                                 ('xval', [1]), ('xval', [7])]:
+            m = gazelib.validity_metrics(data, valkey, 'time', accepted,
+                                         aoi, 'x', 'y')
+            self.assertAlmostEqual(m['valid_fraction'],
+                gazelib.valid_gaze_percentage(data, valkey, accepted))
+            self.assertEqual(m['longest_invalid_streak'],
+                gazelib.longest_non_valid_streak(data, valkey, 'time',
+                                                 accepted))
+            self.assertEqual(m['border_violation'],
+                gazelib.border_violation(data, aoi, 'x', 'y', valkey,
+                                         accepted))
+
+        m = gazelib.validity_metrics(data, 'xval', 'time', [1, 0])
+        self.assertIsNone(m['border_violation'])
+        xs = gazelib.get_key(data, 'x')
+        filled = [xs[i] for i in m['fill_index']]
+        interpolated = gazelib.interpolate_using_last_good_value(
+            [gp.copy() for gp in data], 'x', 'xval', [1, 0])
+        self.assertListEqual(filled, gazelib.get_key(interpolated, 'x'))
+
     def test_grouping_and_combination(self):
         data = TestGazelibMethods.data
 
@@ -142,6 +167,13 @@ class TestGazelibMethods(unittest.TestCase):
         xs, ys, vals = gazelib.combine_coordinates(TestGazelibMethods.data2,
             [0, 1], 'rx', 'ry', 'rval', 'lx', 'ly', 'lval')
         assertListAlmostEqual(self, xs, [0.1, 0.3, 0.3, 0.8, -1, 0.1])
+        self.assertIs(type(xs[4]), int)
+        # Coordinates of rejected eyes are not read.
+        data3 = [{'rx': 0.5, 'ry': 0.5, 'lx': '', 'ly': None,
+                  'rval': 0, 'lval': 4}]
+        xs, ys, vals = gazelib.combine_coordinates(data3,
+            [0, 1], 'rx', 'ry', 'rval', 'lx', 'ly', 'lval')
+        self.assertEqual((xs, ys, vals), ([0.5], [0.5], [0]))
 
         # grouping test
         grouping = gazelib.group(data, 'tag', 'time')
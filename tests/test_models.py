@@ -4,9 +4,14 @@ try:
 except ImportError:
     import unittest
 
+import os
+import shutil
+import tempfile
+import numpy as np
 from .utils import load_fixture, assert_deep_equal
 
 from gazelib.containers import CommonV1
+from gazelib import instrumentation
 from gazelib import models as unit
 
 
@@ -23,24 +28,278 @@ class TestSaccade(unittest.TestCase):
         f = lambda: unit.saccade.fit(c)
         self.assertRaises(CommonV1.InsufficientDataException, f)
 
-    # def test_fixture_saccade(self):
-    #     raw = load_fixture('saccade.common.json')
-    #     c1 = CommonV1(raw)
-    #     c2 = c1.slice_by_tag('icl/experiment/reaction/period/target')
-    #     t0 = c2.get_relative_start_time()
-    #     # First second
-    #     c3 = c2.slice_by_relative_time(t0, t0 + 1000000)
-    #     r = unit.saccade.fit(c3)
-    #     assert_deep_equal(self, r, {
-    #         'type': 'gazelib/gaze/saccade',
-    #         'start_time_relative': 123,
-    #         'end_time_relative': 321,
-    #         'mean_squared_error': 0.123
-    #     })
+    def test_fit_by_tag(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        # Two short periods and one without data.
+        for tag in ['icl/experiment/reaction/period/attention-grabber',
+                    'icl/experiment/reaction/period/pretarget']:
+            ev = c.get_event_by_tag(tag)
+            c.add_event(['test/window'], ev['range'][0], ev['range'][1])
+        c.add_event(['test/window'], 10**9, 10**9 + 1000)
+
+        for processes in [1, 2]:
+            table = unit.saccade.fit_by_tag(c, 'test/window', processes)
+            self.assertEqual(len(table), 3)
+            slices = c.iter_slices_by_tag('test/window', limit_to=2)
+            for row, sl in zip(table, slices):
+                r = unit.saccade.fit(sl)
+                self.assertEqual(row['start_time_relative'],
+                                 r['start_time_relative'])
+                self.assertEqual(row['end_time_relative'],
+                                 r['end_time_relative'])
+                self.assertAlmostEqual(row['mean_squared_error'],
+                                       r['mean_squared_error'])
+            self.assertEqual(table[2]['event_index'], 2)
+            self.assertIsNone(table[2]['start_time_relative'])
+            self.assertIsNone(table[2]['mean_squared_error'])
+
+    def test_fixture_saccade(self):
+        raw = load_fixture('saccade.common.json')
+        c1 = CommonV1(raw)
+        c2 = c1.slice_by_tag('icl/experiment/reaction/period/target')
+        t0 = c2.get_relative_start_time()
+        # First second
+        c3 = c2.slice_by_relative_time(t0, t0 + 1000000)
+        r = unit.saccade.fit(c3)
+        self.assertEqual(r['type'], 'gazelib/gaze/saccade')
+        self.assertEqual(r['start_time_relative'], 2173195)
+        self.assertEqual(r['end_time_relative'], 2199934)
+        self.assertAlmostEqual(r['mean_squared_error'], 0.000632192638541)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fingerprint(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        names = unit.saccade.STREAM_NAMES
+        f = unit.cache.fingerprint
+        key = f(c, names, 'a', 1)
+        self.assertEqual(key, f(CommonV1(raw), names, 'a', 1))
+        self.assertNotEqual(key, f(c, names, 'b', 1))
+        self.assertNotEqual(key, f(c, names, 'a', 2))
+        self.assertNotEqual(key, f(c, names, 'a', 1, {'window': 5}))
+        self.assertNotEqual(key, f(c, names[:2], 'a', 1))
+        c.raw['streams'][names[0]]['values'][0] = 0.123
+        self.assertNotEqual(key, f(c, names, 'a', 1))
+
+        g = unit.cache.fingerprint_arrays
+        self.assertNotEqual(g('a', 1, None, [[1, 2], [3]]),
+                            g('a', 1, None, [[1], [2, 3]]))
+        self.assertEqual(g('a', 1, None, [['x', None]]),
+                         g('a', 1, None, [['x', None]]))
+
+    def test_result_cache(self):
+        cache = unit.cache.ResultCache(self.directory, max_bytes=130)
+        self.assertRaises(KeyError, lambda: cache['a'])
+        self.assertIsNone(cache.get('a'))
+        cache['a'] = {'x': [1, 2]}
+        self.assertIn('a', cache)
+        self.assertEqual(cache['a'], {'x': [1, 2]})
+        # Shared through the directory.
+        other = unit.cache.ResultCache(self.directory)
+        self.assertEqual(other['a'], {'x': [1, 2]})
+        # Evict the least recently used.
+        cache['b'] = 'b' * 60
+        os.utime(os.path.join(self.directory, 'a.json'), (0, 0))
+        cache['c'] = 'c' * 60
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+        self.assertIn('c', cache)
+        cache.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+        # Overwriting a result does not grow the total size.
+        cache['a'] = 'a' * 10
+        for _ in range(5):
+            cache['a'] = 'a' * 10
+        self.assertEqual(cache._size, 12)
+
+    def test_saccade_fit(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        cache = unit.cache.ResultCache(self.directory)
+        with instrumentation.profile() as summary:
+            r1 = unit.saccade.fit(c, cache=cache)
+        # A miss is a single span.
+        stats = summary.summary()
+        self.assertEqual(stats['gazelib.models.saccade.fit']['calls'], 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        r2 = unit.saccade.fit(c, cache=cache)
+        self.assertEqual(r1, r2)
+        self.assertEqual(r1, unit.saccade.fit(c))
+
+    def test_saccade_fit_by_tag(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        tag = 'icl/experiment/reaction/period/pretarget'
+        ev = c.get_event_by_tag(tag)
+        c.add_event(['test/window'], ev['range'][0], ev['range'][1])
+        c.add_event(['test/window'], 10**9, 10**9 + 1000)
+        cache = unit.cache.ResultCache(self.directory)
+        t1 = unit.saccade.fit_by_tag(c, 'test/window', 1, cache)
+        # Also no-data results are stored.
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        t2 = unit.saccade.fit_by_tag(c, 'test/window', 1, cache)
+        self.assertEqual(t1, t2)
+        self.assertEqual(t1, unit.saccade.fit_by_tag(c, 'test/window', 1))
+
+
+class TestSaccadeSearch(unittest.TestCase):
+
+    def test_step(self):
+        xs = [0, 0, 0, 0.5, 1, 1, 1]
+        ys = [0] * 7
+        r = unit.saccade_search.fit(xs, ys)
+        self.assertEqual(r['saccade_start_index'], 2)
+        self.assertEqual(r['saccade_end_index'], 5)
+        self.assertAlmostEqual(r['mean_squared_error'], 0.0079365079365)
+        self.assertTrue(r['converged'])
+
+    def test_saccade_sse_matches_direct_sum(self):
+        rng = np.random.RandomState(1)
+        points = rng.uniform(size=(40, 2))
+        src = np.array([0.2, 0.3])
+        tgt = np.array([0.9, 0.1])
+        sums = unit.saccade_search.PrefixSums(points, src, tgt)
+        for t_start, t_end in [(0, 0), (0, 40), (5, 17), (39, 40)]:
+            sse = 0.0
+            for i in range(t_start, t_end):
+                alpha = (i + 0.5 - t_start) / (t_end - t_start)
+                mu = src * (1 - alpha) + tgt * alpha
+                sse += ((points[i] - mu) ** 2).sum()
+            self.assertAlmostEqual(float(sums.saccade_sse(t_start, t_end)),
+                                   sse)
+
+    def test_too_short(self):
+        f = lambda: unit.saccade_search.fit([0.1], [0.1])
+        self.assertRaises(unit.saccade_search.SaccadeModelError, f)
+
+
+def create_fixation_common():
+    '''
+    Three fixations at 300 Hz: 0.3 s at (0.2, 0.2), 0.4 s at (0.8, 0.5)
+    with a gap in the middle, and 0.2 s at (0.5, 0.5). Saccades between.
+    '''
+    xs = [0.2] * 90 + [0.4, 0.6] + [0.8] * 120 + [0.7, 0.6] + [0.5] * 60
+    ys = [0.2] * 90 + [0.3, 0.4] + [0.5] * 120 + [0.5, 0.5] + [0.5] * 60
+    # Gap
+    for i in range(150, 156):
+        xs[i] = None
+        ys[i] = None
+    c = CommonV1()
+    c.add_timeline('eyetracker', [i * 3333 for i in range(len(xs))])
+    for eye in ['left', 'right']:
+        c.add_stream('gazelib/gaze/' + eye + '_eye_x_relative',
+                     'eyetracker', xs)
+        c.add_stream('gazelib/gaze/' + eye + '_eye_y_relative',
+                     'eyetracker', ys)
+    return c
 
 
 class TestFixation(unittest.TestCase):
-    pass
+
+    def test_fit(self):
+        c = create_fixation_common()
+        c2 = c.slice_by_timeline('eyetracker', 0, 90)
+        r = unit.fixation.fit(c2)
+        self.assertEqual(r['type'], 'gazelib/gaze/fixation')
+        self.assertAlmostEqual(r['centroid'][0], 0.2)
+        self.assertAlmostEqual(r['centroid'][1], 0.2)
+        self.assertAlmostEqual(r['mean_squared_error'], 0.0)
+
+        f = lambda: unit.fixation.fit(CommonV1())
+        self.assertRaises(CommonV1.InsufficientDataException, f)
+
+    def test_detect(self):
+        for method in ['ivt', 'idt']:
+            c = create_fixation_common()
+            fxs = unit.fixation.detect(c, method)
+            # The gap splits the second fixation to two.
+            self.assertEqual(len(fxs), 4)
+            self.assertEqual(fxs[0]['start_index'], 0)
+            self.assertIn(fxs[0]['end_index'], [90, 91])
+            self.assertEqual(fxs[1]['end_index'], 150)
+            self.assertEqual(fxs[2]['start_index'], 156 + (method == 'ivt'))
+            self.assertAlmostEqual(fxs[3]['centroid'][0], 0.5)
+            self.assertEqual(c.count_events('gazelib/gaze/fixation'), 4)
+            ev = c.get_event_by_tag('gazelib/gaze/fixation', 1)
+            self.assertEqual(ev['derived'],
+                             'gazelib.models.fixation.detect_' + method)
+            self.assertEqual(ev['range'][0], fxs[1]['start_time_relative'])
+            self.assertAlmostEqual(ev['extra']['centroid'][0], 0.8)
+
+        f = lambda: unit.fixation.detect(c, 'foo')
+        self.assertRaises(ValueError, f)
+
+    def test_dispersion_window(self):
+        rng = np.random.RandomState(2)
+        xs = rng.uniform(size=300)
+        ys = rng.uniform(size=300)
+        w = unit.fixation.DispersionWindow(xs, ys)
+        for step in range(600):
+            if len(w) == 0 or (w.end < 300 and rng.uniform() < 0.55):
+                w.push()
+            else:
+                w.pop()
+            if len(w) > 0:
+                wx = xs[w.start:w.end]
+                wy = ys[w.start:w.end]
+                expected = wx.max() - wx.min() + wy.max() - wy.min()
+                self.assertAlmostEqual(w.dispersion(), expected)
+        w.reset(10)
+        self.assertEqual(len(w), 0)
+        w.push()
+        self.assertEqual(w.dispersion(), 0.0)
+
+    def test_detect_idt_matches_naive(self):
+        rng = np.random.RandomState(3)
+        n = 3000
+        # Random walk with occasional jumps and gaps.
+        steps = rng.normal(0, 0.002, (n, 2))
+        steps[rng.uniform(size=n) < 0.01] += 0.2
+        path = np.cumsum(steps, axis=0)
+        xs, ys = path[:, 0], path[:, 1]
+        xs[rng.uniform(size=n) < 0.005] = np.nan
+        times = np.arange(n) * 1000
+        thr = 0.03
+        dur = 50000
+
+        # Naive reference: recompute dispersion for every window.
+        def disp(a, b):
+            return (xs[a:b].max() - xs[a:b].min() +
+                    ys[a:b].max() - ys[a:b].min())
+        expected = []
+        s = 0
+        while s < n:
+            e = s + dur // 1000 + 1
+            if e > n:
+                break
+            if np.isnan(xs[s:e]).any() or disp(s, e) > thr:
+                s += 1
+                continue
+            while e < n and not np.isnan(xs[e]) and disp(s, e + 1) <= thr:
+                e += 1
+            expected.append((s, e))
+            s = e
+
+        fxs = unit.fixation.detect_idt(xs, ys, times, thr, dur)
+        found = [(fx['start_index'], fx['end_index']) for fx in fxs]
+        self.assertTrue(len(found) > 10)
+        self.assertListEqual(found, expected)
+
+    def test_detect_min_duration(self):
+        c = create_fixation_common()
+        fxs = unit.fixation.detect(c, 'idt', add_events=False,
+                                   min_duration=250000)
+        self.assertEqual(len(fxs), 1)
+        self.assertEqual(c.count_events(), 0)
 
 if __name__ == '__main__':
     unittest.main()
@@ -4,7 +4,9 @@ try:
 except ImportError:
     import unittest
 
+import numpy as np
 from gazelib import preprocessing as unit
+from gazelib.containers import CommonV1
 
 
 class TestPreprocessing(unittest.TestCase):
@@ -22,6 +24,122 @@ class TestPreprocessing(unittest.TestCase):
         f = lambda: unit.fill_gaps(c)
         self.assertRaises(unit.ExtrapolationError, f)
 
+    def test_fill_gaps_array(self):
+        a = [1, None, 2, float('nan')]
+        b = [None, 1, 2]
+        self.assertListEqual(unit.fill_gaps_array(a).tolist(), [1, 1, 2, 2])
+        self.assertListEqual(unit.fill_gaps_array(b).tolist(), [1, 1, 2])
+
+        f = lambda: unit.fill_gaps_array([None, None])
+        self.assertRaises(unit.ExtrapolationError, f)
+        f = lambda: unit.fill_gaps_array([])
+        self.assertRaises(unit.ExtrapolationError, f)
+
+
+class TestBinocular(unittest.TestCase):
+
+    def test_combine_coordinates(self):
+        x, y, val = unit.binocular.combine_coordinates(
+            [0.1, 0.4, -1], [0.3, 0.1, -1], [1, 1, 4],
+            [-1, 0.2, -1], [-1, 0.3, -1], [8, 0, 3], [0, 1])
+        self.assertListEqual(x.tolist(), [0.1, 0.30000000000000004, -1.0])
+        self.assertListEqual(y.tolist(), [0.3, 0.2, -1.0])
+        self.assertListEqual(val.tolist(), [1, 0, 3])
+
+    def test_derive_binocular_streams(self):
+        c = CommonV1()
+        c.add_timeline('eyetracker', [0, 10, 20, 30])
+        c.add_stream('gazelib/gaze/left_eye_x_relative', 'eyetracker',
+                     [0.2, None, 0.4, 0.5], [1.0, 0.0, 1.0, 0.1])
+        c.add_stream('gazelib/gaze/left_eye_y_relative', 'eyetracker',
+                     [0.2, None, 0.4, 0.5], [1.0, 0.0, 1.0, 0.1])
+        c.add_stream('gazelib/gaze/right_eye_x_relative', 'eyetracker',
+                     [0.4, 0.6, None, 0.5], [0.8, 1.0, 0.0, 0.1])
+        c.add_stream('gazelib/gaze/right_eye_y_relative', 'eyetracker',
+                     [0.0, 0.6, None, 0.5], [0.8, 1.0, 0.0, 0.1])
+        unit.binocular.derive_binocular_streams(c)
+
+        stream = c.get_stream('gazelib/gaze/binocular_x_relative')
+        self.assertEqual(stream['timeline'], 'eyetracker')
+        self.assertIn('derived', stream)
+        xs = stream['values']
+        self.assertAlmostEqual(xs[0], 0.3)
+        self.assertEqual(xs[1:], [0.6, 0.4, None])
+        self.assertEqual(stream['confidence'], [1.0, 1.0, 1.0, 0.0])
+        ys = c.get_stream_values('gazelib/gaze/binocular_y_relative')
+        self.assertAlmostEqual(ys[0], 0.1)
+        CommonV1.validate(c.raw)
+
+    def test_derive_binocular_streams_missing(self):
+        c = CommonV1()
+        f = lambda: unit.binocular.derive_binocular_streams(c)
+        self.assertRaises(CommonV1.InsufficientDataException, f)
+
+
+class TestVelocity(unittest.TestCase):
+
+    def test_savitzky_golay_derivatives(self):
+        # Irregular sampling of x = t^2 with t in seconds.
+        times = [0, 3000, 7000, 10000, 16000, 20000, 23000, 30000, 33000]
+        values = [(t / 1e6) ** 2 for t in times]
+        values[7] = None
+        v, a = unit.velocity.savitzky_golay_derivatives(values, times, 5)
+        self.assertTrue(np.isnan(v[:2]).all())
+        self.assertAlmostEqual(v[2], 2 * 0.007)
+        self.assertAlmostEqual(v[4], 2 * 0.016)
+        self.assertAlmostEqual(a[3], 2.0)
+        # Windows reaching the gap are unknown.
+        self.assertTrue(np.isnan(v[5:]).all())
+
+    def test_savitzky_golay_derivatives_invalid(self):
+        f = unit.velocity.savitzky_golay_derivatives
+        self.assertRaises(ValueError, f, [], [], 4)
+        self.assertRaises(ValueError, f, [], [], 5, 5)
+        v, a = f([1.0, 2.0], [0, 1000])
+        self.assertTrue(np.isnan(v).all())
+
+    def test_derive_velocity_streams(self):
+        c = CommonV1()
+        c.add_environment('gazelib/gaze/tracked_display_size', {
+            'physical_mm': {'width': 500.0, 'height': 300.0},
+            'resolution_px': {'width': 1000, 'height': 600}
+        })
+        times = [i * 3333 for i in range(20)]
+        c.add_timeline('eyetracker', times)
+        # Move along x at 2 screen widths per second.
+        xs = [0.5 + 2.0 * (t - times[10]) / 1e6 for t in times]
+        ys = [0.5] * 20
+        c.add_stream('gazelib/gaze/binocular_x_relative', 'eyetracker', xs)
+        c.add_stream('gazelib/gaze/binocular_y_relative', 'eyetracker', ys)
+
+        unit.velocity.derive_velocity_streams(c, units='relative')
+        name = 'gazelib/gaze/binocular_velocity_relative_per_s'
+        stream = c.get_stream(name)
+        self.assertIn('derived', stream)
+        self.assertEqual(stream['values'][:3], [None] * 3)
+        self.assertAlmostEqual(stream['values'][10], 2.0)
+        name = 'gazelib/gaze/binocular_acceleration_relative_per_s2'
+        self.assertAlmostEqual(c.get_stream_values(name)[10], 0.0)
+
+        unit.velocity.derive_velocity_streams(c, viewing_distance_mm=500.0)
+        name = 'gazelib/gaze/binocular_velocity_deg_per_s'
+        vs = c.get_stream_values(name)
+        # Gaze passes the screen center at sample 10 where
+        # 1000 mm/s at 500 mm is about 2 rad/s.
+        self.assertAlmostEqual(vs[10], np.degrees(2.0), delta=1.0)
+        CommonV1.validate(c.raw)
+
+    def test_derive_velocity_streams_missing(self):
+        c = CommonV1()
+        c.add_timeline('eyetracker', [0, 10])
+        c.add_stream('gazelib/gaze/left_eye_x_relative', 'eyetracker', [0, 1])
+        c.add_stream('gazelib/gaze/left_eye_y_relative', 'eyetracker', [0, 1])
+        f = unit.velocity.derive_velocity_streams
+        self.assertRaises(CommonV1.InsufficientDataException, f, c)
+        self.assertRaises(CommonV1.InsufficientDataException, f, c,
+                          'left_eye')
+        self.assertRaises(ValueError, f, c, 'left_eye', 'pixels')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -43,5 +43,69 @@ class TestStatistics(unittest.TestCase):
         w = [1, None, 1]
         self.assertEqual(unit.weighted_arithmetic_mean(l, w), 1.0)
 
+
+class TestGrouping(unittest.TestCase):
+
+    def test_concatenate_by_group(self):
+        a = [{'g': 'x', 'v': 1}]
+        b = [{'g': 'y', 'v': 2}]
+        c = [{'g': 'x', 'v': 3}, {'g': 'x', 'v': 4}]
+        groups = unit.concatenate_by_group([a, b, c], lambda d: d[0]['g'])
+        self.assertListEqual(groups['x'], a + c)
+        self.assertIs(groups['y'], b)
+        # Original lists are not modified.
+        self.assertEqual(len(a), 1)
+
+    def test_group_segments(self):
+        keys = ['b', 'a', 'b', 'c', 'a']
+        uniq, order, bounds = unit.group_segments(keys)
+        self.assertListEqual(uniq.tolist(), ['a', 'b', 'c'])
+        self.assertListEqual(order.tolist(), [1, 4, 0, 2, 3])
+        self.assertListEqual(bounds.tolist(), [0, 2, 4, 5])
+
+        uniq, order, bounds = unit.group_segments([])
+        self.assertEqual(len(uniq), 0)
+        self.assertListEqual(bounds.tolist(), [0])
+
+    def test_group_values(self):
+        groups = unit.group_values([2, 1, 2, 1], [10, 20, 30, 40])
+        self.assertListEqual(sorted(groups.keys()), [1, 2])
+        self.assertListEqual(groups[1].tolist(), [20, 40])
+        self.assertListEqual(groups[2].tolist(), [10, 30])
+
+        f = lambda: unit.group_values([1, 2], [1])
+        self.assertRaises(ValueError, f)
+
+
+class TestValidity(unittest.TestCase):
+
+    def test_find_runs(self):
+        starts, ends = unit.find_runs([True, True, False, True])
+        self.assertListEqual(starts.tolist(), [0, 3])
+        self.assertListEqual(ends.tolist(), [2, 4])
+        starts, ends = unit.find_runs([])
+        self.assertEqual(len(starts), 0)
+
+    def test_validity_metrics(self):
+        vals = [4, 0, 4, 4, 0, 4]
+        times = [0, 10, 20, 30, 40, 50]
+        inside = [False, True, False, False, False, False]
+        m = unit.validity_metrics(vals, times, [0], inside)
+        self.assertAlmostEqual(m['valid_fraction'], 2.0 / 6)
+        self.assertEqual(m['longest_invalid_streak'], 20)
+        self.assertListEqual(m['invalid_streaks'].tolist(),
+                             [[0, 1], [2, 4], [5, 6]])
+        self.assertListEqual(m['fill_index'].tolist(), [1, 1, 1, 1, 4, 4])
+        self.assertTrue(m['border_violation'])
+
+        m = unit.validity_metrics([4, 4], [0, 10], [0])
+        self.assertIsNone(m['fill_index'])
+        self.assertEqual(m['valid_fraction'], 0.0)
+
+        m = unit.validity_metrics([], [], [0])
+        self.assertEqual(m['valid_fraction'], -1)
+        self.assertEqual(m['longest_invalid_streak'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest  # to support Python 2.6
+except ImportError:
+    import unittest
+
+import os
+import numpy as np
+from .utils import get_temp_filepath, remove_temp_file
+from gazelib.containers import CommonV1
+from gazelib.conversion.icl import cg
+from gazelib import synthetic as unit
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_chunk_size_invariance(self):
+        a = list(unit.iter_chunks(10.0, chunk_size=1000, seed=3))
+        b = list(unit.iter_chunks(10.0, chunk_size=777, seed=3))
+        for key in a[0]:
+            xa = np.concatenate([ch[key] for ch in a])
+            xb = np.concatenate([ch[key] for ch in b])
+            self.assertEqual(len(xa), 3000)
+            np.testing.assert_array_equal(xa, xb)
+
+    def test_next_chunk(self):
+        gen = unit.GazeGenerator(rate=120.0, seed=1)
+        ch = gen.next_chunk(120 * 60)
+        self.assertTrue((np.diff(ch['time']) > 0).all())
+        lost = np.isnan(ch['left_x'])
+        self.assertTrue((ch['left_validity'][lost] == 4).all())
+        self.assertTrue((ch['left_validity'][~lost] < 4).all())
+        # Some blinks and dropouts, but mostly tracked.
+        self.assertGreater(lost.mean(), 0.0)
+        self.assertLess(lost.mean(), 0.2)
+        self.assertEqual(set(ch['period']), set([0, 1, 2, 3]))
+        self.assertEqual(ch['trial'][0], 1)
+        self.assertGreater(ch['trial'][-1], 10)
+        self.assertTrue((np.diff(ch['trial']) >= 0).all())
+
+    def test_generate_common(self):
+        c = unit.generate_common(20.0, rate=60.0, seed=2)
+        CommonV1.validate(c.raw)
+        self.assertEqual(len(c.get_timeline('eyetracker')), 1200)
+        trials = list(c.iter_events_by_tag('icl/experiment/reaction/trial'))
+        self.assertGreater(len(trials), 3)
+        self.assertEqual(trials[0]['range'][0], 0)
+        stim = c.get_event_by_tag('icl/stimulus/image')
+        rect = stim['extra']['icl/stimulus/image/rectangle']
+        self.assertEqual(rect, [0.0, 0.0, 1.0, 1.0])
+
+    def test_trials(self):
+        tag = 'icl/experiment/reaction/trial'
+        c = unit.generate_common(None, rate=60.0, seed=2, trials=3)
+        self.assertEqual(c.count_events(tag), 3)
+        # The last trial is complete.
+        target = 'icl/experiment/reaction/period/target'
+        self.assertEqual(c.count_events(target), 3)
+        last = list(c.iter_events_by_tag(target))[-1]
+        # Target period lasts one second.
+        s = c.slice_by_relative_time(*last['range'])
+        self.assertEqual(len(s.get_timeline('eyetracker')), 60)
+        # Duration limits too.
+        c = unit.generate_common(2.0, rate=60.0, seed=2, trials=3)
+        self.assertEqual(len(c.get_timeline('eyetracker')), 120)
+        self.assertRaises(ValueError, lambda: unit.generate_common(None))
+        gen = unit.GazeGenerator()
+        gen.next_chunk(10)
+        self.assertRaises(ValueError, lambda: gen.get_trials_end(1))
+
+    def test_write_gazedata_and_convert(self):
+        gazedata_path = get_temp_filepath('synthetic.gazedata')
+        config_path = get_temp_filepath('config.json')
+        n = unit.write_gazedata(gazedata_path, 10.0, rate=60.0, seed=4,
+                                chunk_size=100)
+        self.assertEqual(n, 600)
+        unit.write_experiment_config(config_path)
+        c = cg.common.convert(gazedata_path, config_path, 0, 'SYNTHETIC',
+                              True)
+        expected = unit.generate_common(10.0, rate=60.0, seed=4)
+        self.assertEqual(c.get_timeline('eyetracker'),
+                         expected.get_timeline('eyetracker'))
+        xs = c.get_stream_values('gazelib/gaze/left_eye_x_relative')
+        ys = expected.get_stream_values('gazelib/gaze/left_eye_x_relative')
+        self.assertEqual([x is None for x in xs], [y is None for y in ys])
+        for x, y in zip(xs, ys):
+            if x is not None:
+                self.assertAlmostEqual(x, y, places=5)
+        for tag in ['icl/experiment/reaction/trial', 'icl/stimulus/image']:
+            self.assertEqual(
+                [ev['range'] for ev in c.iter_events_by_tag(tag)],
+                [ev['range'] for ev in expected.iter_events_by_tag(tag)])
+        remove_temp_file(gazedata_path)
+        remove_temp_file(config_path)
+        self.assertFalse(os.path.exists(gazedata_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,12 @@ try:
 except ImportError:
     import unittest
 
+import os
 from os.path import isfile
 from .utils import (get_temp_filepath, remove_temp_file, load_fixture)
 from gazelib.containers import CommonV1
 import gazelib.visualization as unit
+import numpy as np
 
 class TestUtils(unittest.TestCase):
 
@@ -22,6 +24,83 @@ class TestUtils(unittest.TestCase):
         sl = unit.utils.get_valid_sublists(l)
         self.assertEqual(sl, [])
 
+    def test_lttb_indices(self):
+        ys = [0, 0, 5, 0, 0, -3, 0]
+        idx = unit.utils.lttb_indices(range(7), ys, 4)
+        self.assertEqual(idx.tolist(), [0, 2, 5, 6])
+        idx = unit.utils.lttb_indices(range(3), [1, 2, 3], 4)
+        self.assertEqual(idx.tolist(), [0, 1, 2])
+
+    def test_minmax_indices(self):
+        ys = [0, 3, 1, 2, -1, 0, 4, 2]
+        idx = unit.utils.minmax_indices(ys, 4)
+        self.assertEqual(idx.tolist(), [0, 1, 4, 6, 7])
+
+    def test_downsample_indices(self):
+        ys = [0, 5, None, 1, 2, 9, 3, 4]
+        f = unit.utils.downsample_indices
+        # Valid run ends 0, 1, 3, 7 are always kept.
+        self.assertEqual(f(range(8), ys, 4).tolist(), [0, 1, 3, 5, 7])
+        self.assertEqual(f(range(8), ys, 4, 'minmax').tolist(),
+                         [0, 1, 3, 5, 6, 7])
+        self.assertEqual(f(range(8), ys, None).tolist(),
+                         [0, 1, 3, 4, 5, 6, 7])
+        self.assertRaises(ValueError, f, range(8), ys, 4, 'median')
+
+    def test_get_path_arrays(self):
+        f = unit.utils.get_path_arrays
+        xs, ys = f([0.1, None, 0.3, 0.4], [0.1, 0.2, None, 0.4])
+        self.assertEqual(xs[0], 0.1)
+        self.assertTrue(np.isnan(xs[1:3]).all())
+        self.assertTrue(np.isnan(ys[1:3]).all())
+        self.assertEqual(ys[3], 0.4)
+        # Decimation keeps the gap and its neighbours.
+        values = [float(i) for i in range(10)] + [None] + [1.0] * 9
+        xs, ys = f(values, values, 5)
+        self.assertEqual(xs[:2].tolist(), [0.0, 4.0])
+        self.assertEqual(xs[3], 9.0)
+        self.assertTrue(np.isnan(xs[4]))
+        self.assertLess(len(xs), len(values))
+
+    def test_render_path(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        for max_points in [None, 100]:
+            fpath = get_temp_filepath('path.html')
+            unit.common.render_path(c, fpath, max_points=max_points)
+            with open(fpath) as f:
+                html = f.read()
+            remove_temp_file(fpath)
+            # Screen, and line, scatter, and start per eye.
+            self.assertEqual(html.count('"GlyphRenderer"'), 7)
+
+    def test_render_path_for_each_event(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        tag = 'icl/experiment/reaction/period/test'
+        for period in ['attention-grabber', 'pretarget', 'target']:
+            ev = c.get_event_by_tag('icl/experiment/reaction/period/' + period)
+            c.add_event([tag], ev['range'][0], ev['range'][1])
+
+        for processes in [1, 2]:
+            index_path = get_temp_filepath('index.html')
+            d = os.path.dirname(index_path)
+            paths = unit.common.render_path_for_each_event(
+                c, tag, index_path, processes=processes)
+            self.assertEqual([os.path.basename(p) for p in paths],
+                             ['index-0.html', 'index-1.html', 'index-2.html'])
+            with open(index_path) as f:
+                index_html = f.read()
+            with open(paths[1]) as f:
+                page_html = f.read()
+            self.assertIn('href="index-2.html"', index_html)
+            self.assertIn('href="index-0.html"', page_html)
+            self.assertIn('href="index.html"', page_html)
+            for p in paths:
+                os.remove(p)
+            remove_temp_file(index_path)
+            self.assertFalse(os.path.exists(d))
+
     def test_render_overview_without_errors(self):
         raw = load_fixture('sample.common.json')
         c = CommonV1(raw)
@@ -30,5 +109,80 @@ class TestUtils(unittest.TestCase):
         isfile(fpath)
         remove_temp_file(fpath)
 
+    def test_render_overview_downsampled(self):
+        raw = load_fixture('sample.common.json')
+        c = CommonV1(raw)
+        for emphasize_gaps in [False, True]:
+            for method in ['lttb', 'minmax']:
+                fpath = get_temp_filepath('myfile.html')
+                unit.common.render_overview(c, fpath,
+                                            emphasize_gaps=emphasize_gaps,
+                                            max_points=10,
+                                            downsampling=method)
+                self.assertTrue(isfile(fpath))
+                remove_temp_file(fpath)
+
+    def test_render_overview_gap_glyphs(self):
+        c = CommonV1()
+        c.add_timeline('eyetracker', [i * 3333 for i in range(100)])
+        values = [None if i % 3 == 0 else float(i) for i in range(100)]
+        c.add_stream('test/values', 'eyetracker', values)
+        c.add_event(['test/event'], 0, 1000)
+        counts = []
+        for emphasize_gaps in [False, True]:
+            fpath = get_temp_filepath('myfile.html')
+            unit.common.render_overview(c, fpath,
+                                        emphasize_gaps=emphasize_gaps)
+            with open(fpath) as f:
+                counts.append(f.read().count('GlyphRenderer'))
+            remove_temp_file(fpath)
+        # Gaps are drawn with a single extra glyph.
+        self.assertEqual(counts[1], counts[0] + 1)
+
+class TestHeatmap(unittest.TestCase):
+
+    def test_add(self):
+        hm = unit.heatmap.HeatmapAccumulator(bins=(4, 2))
+        hm.add([0.1, 0.9, None, 1.5, 0.6], [0.1, 0.9, 0.5, 0.5, 0.1],
+               [1.0, 0.5, 1.0, 1.0, 0.25])
+        self.assertEqual(hm.counts.tolist(), [[1.0, 0.0, 0.25, 0.0],
+                                              [0.0, 0.0, 0.0, 0.5]])
+        self.assertEqual(hm.total_weight, 1.75)
+        d = hm.density(sigma=None)
+        self.assertAlmostEqual(d.sum(), 1.0)
+        self.assertAlmostEqual(d[0, 0], 1.0 / 1.75)
+        # Smoothing spreads but keeps normalization.
+        d = hm.density(sigma=1.0)
+        self.assertAlmostEqual(d.sum(), 1.0)
+        self.assertGreater(d[0, 1], 0.0)
+
+    def test_merge(self):
+        a = unit.heatmap.HeatmapAccumulator(bins=(4, 2))
+        b = unit.heatmap.HeatmapAccumulator(bins=(4, 2))
+        a.add([0.1], [0.1])
+        b.add([0.1, 0.9], [0.1, 0.9])
+        a.merge(b)
+        self.assertEqual(a.counts[0, 0], 2.0)
+        self.assertEqual(a.total_weight, 3.0)
+        c = unit.heatmap.HeatmapAccumulator(bins=(2, 2))
+        self.assertRaises(ValueError, a.merge, c)
+        empty = unit.heatmap.HeatmapAccumulator()
+        self.assertEqual(empty.density().sum(), 0.0)
+
+    def test_render_heatmap(self):
+        raw = load_fixture('saccade.common.json')
+        c = CommonV1(raw)
+        hm = unit.heatmap.HeatmapAccumulator()
+        hm.add_common(c)
+        hm.add_common(c, use_confidence=False)
+        self.assertGreater(hm.total_weight, 0.0)
+        fpath = get_temp_filepath('heatmap.html')
+        unit.heatmap.render_heatmap(hm, fpath)
+        self.assertTrue(isfile(fpath))
+        remove_temp_file(fpath)
+        f = lambda: hm.add_common(CommonV1())
+        self.assertRaises(CommonV1.InsufficientDataException, f)
+
+
 if __name__ == '__main__':
     unittest.main()